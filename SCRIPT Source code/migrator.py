@@ -1,25 +1,70 @@
 import sqlite3
 import os
+import argparse
 import shutil
 import uuid
+import time
+import hashlib
+import random
+from collections import namedtuple
 from datetime import datetime
 from urllib.parse import urlparse
+from urllib.request import pathname2url
 import sys
+import io
 import json 
+import threading
+import queue
+import contextlib
+import tempfile
+import zipfile
 import requests 
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from itertools import islice, zip_longest
+from typing import Callable
+from contextlib import contextmanager
+import cProfile
+import pstats
+import tracemalloc
 
-# --- REQUIRED IMPORT ---
-# NOTE: You MUST run 'pip install playwright' AND 'playwright install'
+# --- OPTIONAL IMPORT ---
+# NOTE: Playwright is only needed for URLs that refuse plain HTTP downloads (e.g. bot protection).
+# Install it with 'pip install playwright' AND 'playwright install'
 try:
     from playwright.sync_api import sync_playwright
 except ImportError:
-    # A soft fail message if the library is missing
-    def sync_playwright():
-        raise SystemExit("\nFATAL ERROR: Playwright not installed. Please run 'pip install playwright' and 'playwright install'")
+    sync_playwright = None
+
+# NOTE: Pillow is only needed for image normalization (NORMALIZE_IMAGES / --normalize-images).
+# Install it with 'pip install Pillow'
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# POSIX only; used to reflink local assets where the filesystem supports it
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 # --- Configuration ---
-APPDATA_PATH = os.getenv('APPDATA')
+
+def default_appdata_path():
+    """
+    The folder Electron keeps OpenHud's data in: %APPDATA% on Windows,
+    ~/Library/Application Support on macOS, $XDG_CONFIG_HOME or ~/.config elsewhere.
+    """
+    if os.getenv('APPDATA'):
+        return os.getenv('APPDATA')
+    if sys.platform == 'darwin':
+        return os.path.expanduser('~/Library/Application Support')
+    return os.getenv('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')
+
+APPDATA_PATH = default_appdata_path()
 OLD_DB_PATH = os.path.join(APPDATA_PATH, 'openhud', 'database.db')
 NEW_DB_PATH = os.path.join(APPDATA_PATH, 'openhud', 'database.v1.db')
 
@@ -39,11 +84,208 @@ TEAMS_AVATAR_FOLDER = os.path.join(
     'team_logos'
 )
 
-# Headers for Playwright context
+# Persistent URL -> stored file cache, so re-runs skip assets they already have
+ASSET_CACHE_PATH = os.path.join(APPDATA_PATH, 'openhud', 'migrator_asset_cache.json')
+
+# Cached downloads younger than this (seconds) are reused without asking the server;
+# older ones are revalidated with If-None-Match / If-Modified-Since
+ASSET_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Minimum seconds between asset cache saves while a migration is running
+ASSET_CACHE_SAVE_INTERVAL = 30
+
+# Headers for the HTTP session and the Playwright context
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
 }
 
+# Maximum number of avatars/logos downloaded at the same time
+DOWNLOAD_WORKERS = 8
+
+# Seconds a plain HTTP download may wait for the connection and then for data. The short
+# connect timeout makes dead hosts fail fast
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 30
+
+# Seconds Chromium may take to load a URL that refused the plain HTTP download
+BROWSER_TIMEOUT = 20
+
+# Downloads from the same host at the same time (out of DOWNLOAD_WORKERS). Most avatars
+# usually come from one CDN, so this only needs lowering for hosts that throttle
+HOST_CONNECTIONS = 8
+
+# Connection errors, timeouts and these statuses are retried up to DOWNLOAD_RETRIES times,
+# waiting RETRY_BACKOFF seconds doubled per attempt (plus jitter) or the server's
+# Retry-After, but never more than RETRY_MAX_DELAY seconds
+RETRY_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+DOWNLOAD_RETRIES = 3
+RETRY_BACKOFF = 0.5
+RETRY_MAX_DELAY = 30
+
+# Circuit breaker: after this many transient failures in a row a host counts as down and
+# its remaining URLs fail at once. A single request is let through after HOST_COOLDOWN seconds
+HOST_FAILURE_THRESHOLD = 5
+HOST_COOLDOWN = 60
+
+# Downloads are streamed to disk in chunks of this size and aborted beyond MAX_ASSET_BYTES,
+# so a URL pointing at a video or an archive cannot fill memory or disk
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MAX_ASSET_BYTES = 20 * 1024 * 1024
+
+# Local avatars/logos may be hardlinked into the uploads folder when the filesystem cannot
+# reflink them. Off by default: a hardlinked upload shares its file with the legacy image,
+# so editing one in place silently changes the other
+LOCAL_ASSET_HARDLINKS = False
+
+# Bulk-load write mode: fast PRAGMAs on the (throwaway) target file and triggers added after the load
+BULK_LOAD = True
+
+# Where the target is built: 'partial' writes database.v1.db.partial next to it and renames
+# it over the target once complete, so a run killed at any point can be resumed from its
+# last batch; 'memory' (RAM) and 'temp' (a private SQLite temp file) build it away from disk
+# and publish it with the backup API, but only keep an interrupted run if they exit cleanly;
+# 'direct' writes database.v1.db in place, so an interrupted run leaves a partial file there
+TARGET_BUILD = 'partial'
+TARGET_BUILDS = ('partial', 'memory', 'temp', 'direct')
+
+# Rows written per executemany() call, each batch in its own transaction
+INSERT_BATCH_SIZE = 1000
+
+# Rows read from the old database per page; memory use is bounded by this, not by the table size
+READ_PAGE_SIZE = 1000
+
+# Threads that turn read pages into insertable rows (cleaning + asset downloads) while
+# the reader fetches ahead and the writer inserts earlier pages
+PIPELINE_WORKERS = 2
+
+# Pages allowed between the reader and the writer at any time (bounds pipeline memory)
+PIPELINE_MAX_PAGES = 4
+
+# Scale avatars/logos down to the HUD sizes below and re-encode them as NORMALIZED_IMAGE_FORMAT
+# (needs Pillow). Images already within the size limit are only re-encoded if that makes them smaller.
+NORMALIZE_IMAGES = False
+
+# Largest (width, height) stored per asset type; the aspect ratio is kept and nothing is upscaled
+PLAYER_AVATAR_SIZE = (512, 512)
+TEAM_LOGO_SIZE = (256, 256)
+
+# Pillow format name and quality used for normalized images (WEBP keeps logo transparency)
+NORMALIZED_IMAGE_FORMAT = 'WEBP'
+NORMALIZED_IMAGE_QUALITY = 85
+
+# Processes decoding/encoding images in parallel (None: one per CPU core)
+IMAGE_WORKERS = None
+
+# Migrate tables without assets (coaches, matches) with one INSERT ... SELECT over the
+# ATTACHed old database instead of streaming their rows through Python
+SQL_NATIVE_TABLES = True
+
+# Which legacy row wins when several share a value the target requires to be UNIQUE:
+# 'first' or 'last' in source order, or 'newest' by the legacy 'updatedAt' column.
+# The losers are skipped before any of their images are downloaded
+DUPLICATE_POLICY = 'first'
+DUPLICATE_POLICIES = ('first', 'last', 'newest')
+
+# Skipped duplicates listed per table; the rest are only counted
+DUPLICATE_EXAMPLES = 10
+
+# Worker processes for large tables that go through the Python pipeline (players, teams):
+# the table is split into rowid ranges of SHARD_ROWS rows, each migrated into its own shard
+# database by one process and merged into the target. 1 keeps everything in this process
+SHARD_WORKERS = 1
+SHARD_ROWS = 50000
+
+# Tables with fewer rows left than this are not worth starting worker processes for
+SHARD_MIN_ROWS = 100000
+
+# Tables migrated at the same time, so asset-free tables don't wait for the downloads
+# of players/teams. Their writes still go through one connection, one transaction at a time
+TABLE_WORKERS = 4
+
+# Machine-readable summary of every run (stage times, counters, rows per table)
+METRICS_REPORT_PATH = os.path.join(APPDATA_PATH, 'openhud', 'migrator_report.json')
+
+# Seconds between progress line updates; when the output is not a terminal
+# (e.g. redirected to a log file) a full line is printed every PROGRESS_LOG_INTERVAL seconds
+PROGRESS_INTERVAL = 0.5
+PROGRESS_LOG_INTERVAL = 10
+
+# Where --profile writes one cProfile file per stage (open with pstats or snakeviz)
+PROFILE_FOLDER = os.path.join(APPDATA_PATH, 'openhud', 'migrator_profile')
+
+# Remote assets that could not be fetched, kept for a later 'refetch' run
+FAILED_ASSETS_PATH = os.path.join(APPDATA_PATH, 'openhud', 'migrator_failed_assets.json')
+
+# Hash buckets per table when verifying a migration; only keys in buckets that differ
+# are looked at individually, and at most VERIFY_MAX_KEYS of them are listed per table
+VERIFY_BUCKETS = 256
+VERIFY_MAX_KEYS = 20
+
+# --plan --probe sends a HEAD request to at most this many URLs per host and extrapolates
+PLAN_PROBE_SAMPLE = 50
+
+# Seconds between checks of the legacy database for changes in sync mode
+SYNC_INTERVAL = 2
+
+# Identifies 'export' bundles; importers refuse newer versions than they know
+BUNDLE_FORMAT = 'openhud-migrator-bundle'
+BUNDLE_VERSION = 1
+
+# Migrations run at the same time in batch mode (each one also uses DOWNLOAD_WORKERS threads)
+BATCH_WORKERS = 4
+
+@dataclass
+class MigrationPaths:
+    """
+    Every file and folder one migration reads or writes. from_config() is the OpenHud
+    install configured above; for_target() keeps everything next to the target file,
+    so migrations into different folders never share assets or caches.
+    """
+    old_db: str
+    new_db: str
+    player_avatar_folder: str
+    teams_avatar_folder: str
+    asset_cache: str
+    report: str
+    profile_folder: str
+    failed_assets: str
+
+    @classmethod
+    def from_config(cls):
+        return cls(OLD_DB_PATH, NEW_DB_PATH, PLAYER_AVATAR_FOLDER, TEAMS_AVATAR_FOLDER,
+                   ASSET_CACHE_PATH, METRICS_REPORT_PATH, PROFILE_FOLDER, FAILED_ASSETS_PATH)
+
+    @classmethod
+    def for_target(cls, old_db, new_db):
+        """
+        Lays the migration out like an OpenHud data folder around 'new_db'.
+        """
+        folder = os.path.dirname(os.path.abspath(new_db))
+        return cls(
+            old_db,
+            new_db,
+            os.path.join(folder, 'uploads', 'player_pictures'),
+            os.path.join(folder, 'uploads', 'team_logos'),
+            os.path.join(folder, 'migrator_asset_cache.json'),
+            os.path.join(folder, 'migrator_report.json'),
+            os.path.join(folder, 'migrator_profile'),
+            os.path.join(folder, 'migrator_failed_assets.json'),
+        )
+
+    @property
+    def partial_db(self):
+        """
+        Where a staged build keeps an interrupted migration for --resume.
+        """
+        return f"{self.new_db}.partial"
+
+    @property
+    def sync_index(self):
+        """
+        The content-hash index of the rows sync mode has written into the target.
+        """
+        return os.path.join(os.path.dirname(os.path.abspath(self.new_db)), 'migrator_sync_index.db')
+
 # --- Helper Functions ---
 
 def get_timestamp():
@@ -53,6 +295,40 @@ def get_timestamp():
     """
     return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
     
+def reject_json_constant(name):
+    raise json.JSONDecodeError(f"{name} is not valid JSON", name, 0)
+
+# Per-thread in-memory SQLite connection for clean_extra_field()
+_json_checker = threading.local()
+
+def json_checker():
+    """
+    Returns this thread's (and process's) in-memory SQLite connection, which checks JSON
+    and renders floats exactly as the SQL paths (run_table_sql(), verification) do.
+    """
+    if getattr(_json_checker, 'pid', None) != os.getpid():
+        _json_checker.conn = sqlite3.connect(':memory:')
+        _json_checker.pid = os.getpid()
+    return _json_checker.conn
+
+def is_valid_json(text):
+    """
+    True when 'text' is valid JSON. SQLite's json_valid() decides, the same check
+    sql_clean_json() makes, so a table cleans identically in Python and in SQL (e.g. for
+    nesting json.loads() cannot recurse into). Without SQLite's JSON functions there is
+    no SQL path, and json.loads() decides.
+    """
+    try:
+        return bool(json_checker().execute('SELECT json_valid(?)', (text,)).fetchone()[0])
+    except sqlite3.OperationalError:
+        pass
+    try:
+        # NaN/Infinity are not JSON; rejected like SQLite's json_valid() does
+        json.loads(text, parse_constant=reject_json_constant)
+        return True
+    except (json.JSONDecodeError, RecursionError):
+        return False
+
 def clean_extra_field(extra_value):
     """
     Checks the 'extra' field for corruption (None, '[Object Object]', 'undefined', 
@@ -61,22 +337,66 @@ def clean_extra_field(extra_value):
     if extra_value is None:
         return '{}'
     
-    value_str = str(extra_value).strip()
-    
-    if value_str.lower() in ('[object object]', 'undefined', ''):
-        return '{}'
+    if isinstance(extra_value, float):
+        # Written as SQLite writes it ('1.0e+300', not '1e+300'), like the SQL path does
+        value_str = json_checker().execute('SELECT CAST(? AS TEXT)', (extra_value,)).fetchone()[0].strip()
+    else:
+        value_str = str(extra_value).strip()
     
-    try:
-        json.loads(value_str)
-        return value_str
-    except (json.JSONDecodeError, TypeError):
-        print(f"  -> WARNING: Found non-JSON/corrupt extra field: '{value_str[:50]}...'. Replacing with '{{}}'.")
+    if value_str.lower() in ('[object object]', 'undefined', '') or not is_valid_json(value_str):
+        # Counted instead of printed: a corrupt table would otherwise flood the console
+        METRICS.count('corrupt_values')
         return '{}'
+    return value_str
+
+# The characters str.strip() removes (str.isspace()), as trim() arguments, so SQL trims
+# exactly like clean_extra_field()
+SQL_WHITESPACE = ('char(9, 10, 11, 12, 13, 28, 29, 30, 31, 32, 133, 160, 5760, 8192, 8193, 8194, 8195, 8196, '
+                  '8197, 8198, 8199, 8200, 8201, 8202, 8232, 8233, 8239, 8287, 12288)')
+
+def sql_clean_json(expression):
+    """
+    SQL counterpart of clean_extra_field(): the trimmed value of 'expression' if it is
+    valid JSON, otherwise '{}' (NULL, '[object Object]', 'undefined', '' and BLOBs
+    included).
+    """
+    trimmed = f"trim({expression}, {SQL_WHITESPACE})"
+    return f"CASE WHEN typeof({expression}) != 'blob' AND json_valid({trimmed}) THEN {trimmed} ELSE '{{}}' END"
+
+def sql_is_corrupt_json(expression):
+    """
+    SQL condition that is true where clean_extra_field() would count a corrupt value.
+    """
+    return (f"({expression} IS NOT NULL AND (typeof({expression}) = 'blob' "
+            f"OR NOT json_valid(trim({expression}, {SQL_WHITESPACE}))))")
+
+def column_is_numeric(declared_type):
+    """
+    True when SQLite gives a column of 'declared_type' INTEGER, REAL or NUMERIC
+    affinity, i.e. numeric-looking text is stored as a number.
+    """
+    declared_type = (declared_type or '').upper()
+    if 'INT' in declared_type:
+        return True
+    return bool(declared_type) and not any(word in declared_type for word in ('CHAR', 'CLOB', 'TEXT', 'BLOB'))
+
+def sql_stored_value(expression, numeric):
+    """
+    SQL that normalizes 'expression' to the text a target column would hold, so a legacy
+    value and its migrated copy compare equal. Numeric columns store integral reals as
+    integers.
+    """
+    if numeric:
+        expression = (f"CASE WHEN typeof({expression}) = 'real' AND {expression} = CAST({expression} AS INTEGER) "
+                      f"THEN CAST({expression} AS INTEGER) ELSE {expression} END")
+    return f"CAST({expression} AS TEXT)"
 
-def create_new_db_schema(conn):
+def create_new_db_schema(conn, with_triggers=True):
     """
     Creates the required tables in the new database, matching the application's required schema 
     with DEFAULT constraints, Foreign Keys, and Triggers.
+    Pass with_triggers=False to defer the triggers until after a bulk load
+    (see create_new_db_triggers).
     """
     cursor = conn.cursor()
     
@@ -142,7 +462,19 @@ def create_new_db_schema(conn):
     ''')
     
     conn.commit()
+
+    if not with_triggers:
+        print("Table schemas created/updated. Triggers deferred until the data is loaded.")
+        return
+
     print("Table schemas created/updated. Adding Triggers...")
+    create_new_db_triggers(conn)
+
+def create_new_db_triggers(conn):
+    """
+    Adds the UPDATE triggers that keep 'updatedAt' current.
+    """
+    cursor = conn.cursor()
 
     # 5. Add UPDATE Triggers for automatic updatedAt management 
     
@@ -189,366 +521,3789 @@ def create_new_db_schema(conn):
     conn.commit()
     print("Triggers added. Schema setup complete.")
 
-# --- Core Migration Functions ---
+# --- Metrics ---
 
-def migrate_players(old_conn, new_conn, page):
-    os.makedirs(PLAYER_AVATAR_FOLDER, exist_ok=True)
-    old_conn.row_factory = sqlite3.Row
-    old_cursor = old_conn.cursor()
-    try:
-        old_cursor.execute('SELECT * FROM players')
-        old_players = old_cursor.fetchall()
-    except sqlite3.OperationalError as e:
-        print(f"FATAL ERROR: Error reading 'players' table from old DB. Does it exist? Error: {e}")
-        return 0
-    print(f"\nFound {len(old_players)} player records to migrate.")
-    new_cursor = new_conn.cursor()
-    migrated_count = 0
-    for old_player_row in old_players:
-        old_player = dict(old_player_row) 
-        username = old_player.get('username', 'N/A')
-        current_time = get_timestamp() # Uses new fixed timestamp format
-        old_avatar_source = old_player.get('avatar')
-        new_avatar_filename = None 
-        
-        # --- Avatar Download/Copy Logic ---
-        if old_avatar_source:
-            try:
-                is_url = old_avatar_source.lower().startswith(('http://', 'https://'))
-                new_avatar_uuid = str(uuid.uuid4())
-                
-                if is_url:
-                    page.set_extra_http_headers(HEADERS)
-                    response = page.goto(old_avatar_source, wait_until="load", timeout=60000)
-                    if response is None or response.status >= 400:
-                        raise Exception(f"Playwright failed to get a response (Status: {response.status if response else 'N/A'}).")
-                    image_data = response.body()
-                    
-                    path = urlparse(old_avatar_source).path
-                    _, file_ext = os.path.splitext(path)
-                    if not file_ext or len(file_ext) > 5 or file_ext.lower() not in ('.jpg', '.png', '.jpeg', '.webp'):
-                        content_type = response.headers.get('Content-Type', '')
-                        file_ext = '.jpg' if 'image/jpeg' in content_type else '.png' 
-                        
-                    new_avatar_filename = f"{new_avatar_uuid}{file_ext}"
-                    new_avatar_full_path = os.path.join(PLAYER_AVATAR_FOLDER, new_avatar_filename)
-                    with open(new_avatar_full_path, 'wb') as f:
-                        f.write(image_data)
-                
-                elif os.path.exists(old_avatar_source):
-                    _, file_ext = os.path.splitext(old_avatar_source)
-                    new_avatar_filename = f"{new_avatar_uuid}{file_ext}"
-                    new_avatar_full_path = os.path.join(PLAYER_AVATAR_FOLDER, new_avatar_filename)
-                    shutil.copy2(old_avatar_source, new_avatar_full_path)
-
-            except Exception as e:
-                print(f"  !!! CRITICAL ERROR processing avatar for {username} ('{old_avatar_source}'). Error: {e}")
-                new_avatar_filename = None
-        
-        player_data = (
-            old_player.get('_id'),
-            old_player.get('firstName'),
-            old_player.get('lastName'),
-            username,
-            new_avatar_filename,  
-            old_player.get('country'),
-            old_player.get('steamid'),
-            old_player.get('team'),
-            clean_extra_field(old_player.get('extra')), 
-            current_time,     
-            current_time,     
-        )
+# Stages timed by MigrationMetrics, in report order
+METRIC_STAGES = ('read', 'clean', 'download', 'copy', 'normalize', 'insert', 'commit')
+
+METRIC_COUNTERS = (
+    'rows_read', 'rows_written', 'skipped_rows', 'corrupt_values', 'bytes_downloaded',
+    'bytes_copied', 'files_linked', 'cache_hits', 'not_modified', 'retries', 'browser_fallbacks',
+    'hosts_down', 'circuit_skips', 'assets_failed', 'images_normalized', 'normalized_bytes_saved',
+)
+
+class ConsoleOutput:
+    """
+    Stand-in for sys.stdout while tables migrate on several threads. Each thread's text
+    is held until it ends a line and written as whole lines under one lock, so messages
+    of concurrent tables never mix mid-line. The interactive progress line is cleared
+    before such lines and drawn again below them.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._progress = None
+
+    def write(self, text):
+        pending = getattr(self._local, 'pending', '') + text
+        complete, newline, self._local.pending = pending.rpartition('\n')
+        if newline:
+            with self._lock:
+                if self._progress is not None:
+                    self.stream.write(f"\r{'':<79}\r")
+                self.stream.write(complete + newline)
+                if self._progress is not None:
+                    self.stream.write(f"\r{self._progress:<79}")
+                self.stream.flush()
+        return len(text)
+
+    def show_progress(self, line, final=False):
+        """
+        Draws the progress line in place; with 'final' it is kept as a regular line.
+        """
+        with self._lock:
+            self.stream.write(f"\r{line:<79}")
+            if final:
+                self.stream.write("\n")
+            self._progress = None if final else line
+            self.stream.flush()
+
+    def flush(self):
+        self.stream.flush()
+
+    def isatty(self):
+        return self.stream.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+class MigrationMetrics:
+    """
+    Thread-safe instrumentation for one migration run: wall time per stage, event
+    counters, per-table row counts and the live progress line with ETA.
+
+    Stage times are summed over every thread, so stages that overlap in the pipeline
+    can add up to more than the run itself took. With profile=True each stage also runs
+    under cProfile (one profiler per thread; a stage entered while another profiler is
+    active is only timed) and tracemalloc records the peak and top allocation sites of
+    every table.
+    """
+
+    def __init__(self, profile=False):
+        self.reset(profile)
+
+    def reset(self, profile=False):
+        self.profile = profile
+        self.started_at = get_timestamp()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+        self._local = threading.local()
+        self.stage_seconds = dict.fromkeys(METRIC_STAGES, 0.0)
+        self.stage_calls = dict.fromkeys(METRIC_STAGES, 0)
+        self.counters = dict.fromkeys(METRIC_COUNTERS, 0)
+        self.tables = {}
+        self.profiles = {}
+        self.allocations = {}
+        self._table_started = {}
+        self._progress_at = 0
+        self._progress_open = False
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block as one call of stage 'name'.
+        """
+        profiler = self._start_profiler() if self.profile else None
+        started = time.perf_counter()
         try:
-            new_cursor.execute('''
-                INSERT INTO players (
-                    _id, firstName, lastName, username, avatar, country, steamid, team, extra, createdAt, updatedAt
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', player_data)
-            migrated_count += 1
-            # print(f"  -> SUCCESS: Migrated player {username} (ID: {old_player.get('_id')}).")
-        except sqlite3.IntegrityError as e:
-            print(f"  !!! ERROR inserting {username}: Integrity failed (e.g., duplicate _id). Record skipped. Error: {e}")
-        except Exception as e:
-            print(f"  !!! UNEXPECTED ERROR inserting {username}. Record skipped. Error: {e}")
-            
-    return migrated_count
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+                self._local.profiling = False
+            with self._lock:
+                self.stage_seconds[name] += elapsed
+                self.stage_calls[name] += 1
+            if profiler is not None:
+                # Merging is slow; keep it off the lock the counters use
+                with self._profile_lock:
+                    if name in self.profiles:
+                        self.profiles[name].add(profiler)
+                    else:
+                        self.profiles[name] = pstats.Stats(profiler)
 
-def migrate_teams(old_conn, new_conn, page):
-    os.makedirs(TEAMS_AVATAR_FOLDER, exist_ok=True)
-    old_conn.row_factory = sqlite3.Row
-    old_cursor = old_conn.cursor()
-    try:
-        old_cursor.execute('SELECT * FROM teams')
-        old_teams = old_cursor.fetchall()
-    except sqlite3.OperationalError as e:
-        print(f"FATAL ERROR: Error reading 'teams' table from old DB. Does it exist? Error: {e}")
-        return 0
-    
-    print(f"\nFound {len(old_teams)} team records to migrate.")
-    new_cursor = new_conn.cursor()
-    migrated_count = 0
-    
-    for old_team_row in old_teams:
-        old_team = dict(old_team_row) 
-        name = old_team.get('name', 'N/A')
-        current_time = get_timestamp() # Uses new fixed timestamp format
-        old_logo_source = old_team.get('logo')
-        new_logo_filename = None 
-        
-        # --- Logo Download/Copy Logic ---
-        if old_logo_source:
-            try:
-                is_url = old_logo_source.lower().startswith(('http://', 'https://'))
-                new_logo_uuid = str(uuid.uuid4())
-                
-                if is_url:
-                    page.set_extra_http_headers(HEADERS)
-                    response = page.goto(old_logo_source, wait_until="load", timeout=60000)
-                    if response is None or response.status >= 400:
-                        raise Exception(f"Playwright failed to get a response (Status: {response.status if response else 'N/A'}).")
-                    image_data = response.body()
-                    
-                    path = urlparse(old_logo_source).path
-                    _, file_ext = os.path.splitext(path)
-                    if not file_ext or len(file_ext) > 5 or file_ext.lower() not in ('.jpg', '.png', '.jpeg', '.webp'):
-                        content_type = response.headers.get('Content-Type', '')
-                        file_ext = '.jpg' if 'image/jpeg' in content_type else '.png' 
-                        
-                    new_logo_filename = f"{new_logo_uuid}{file_ext}"
-                    new_logo_full_path = os.path.join(TEAMS_AVATAR_FOLDER, new_logo_filename)
-                    with open(new_logo_full_path, 'wb') as f:
-                        f.write(image_data)
-                
-                elif os.path.exists(old_logo_source):
-                    _, file_ext = os.path.splitext(old_logo_source)
-                    new_logo_filename = f"{new_logo_uuid}{file_ext}"
-                    new_logo_full_path = os.path.join(TEAMS_AVATAR_FOLDER, new_logo_filename)
-                    shutil.copy2(old_logo_source, new_logo_full_path)
-
-            except Exception as e:
-                print(f"  !!! CRITICAL ERROR processing logo for {name} ('{old_logo_source}'). Error: {e}")
-                new_logo_filename = None
-        
-        team_data = (
-            old_team.get('_id'),
-            name,
-            old_team.get('country'),
-            old_team.get('shortName'),
-            new_logo_filename,
-            clean_extra_field(old_team.get('extra')), 
-            current_time,     
-            current_time,     
-        )
+    def _start_profiler(self):
+        if getattr(self._local, 'profiling', False):
+            return None # nested stage, already covered by the outer profiler
+        profiler = cProfile.Profile()
         try:
-            new_cursor.execute('''
-                INSERT INTO teams (
-                    _id, name, country, shortName, logo, extra, createdAt, updatedAt
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', team_data)
-            migrated_count += 1
-            # print(f"  -> SUCCESS: Migrated team {name} (ID: {old_team.get('_id')}).")
-        except sqlite3.IntegrityError as e:
-            print(f"  !!! ERROR inserting {name}: Integrity failed (e.g., duplicate _id). Record skipped. Error: {e}")
-        except Exception as e:
-            print(f"  !!! UNEXPECTED ERROR inserting {name}. Record skipped. Error: {e}")
+            profiler.enable()
+        except ValueError:
+            return None # Python 3.12+ allows only one active profiler at a time
+        self._local.profiling = True
+        return profiler
 
-    return migrated_count
+    # Progress
 
-def migrate_coaches(old_conn, new_conn):
-    old_conn.row_factory = sqlite3.Row
-    old_cursor = old_conn.cursor()
-    try:
-        old_cursor.execute('SELECT steamid FROM coaches')
-        old_coaches = old_cursor.fetchall()
-    except sqlite3.OperationalError as e:
-        print(f"\nINFO: 'coaches' table not found in old DB. Assuming no coach data to migrate. Error: {e}")
-        return 0
+    def start_table(self, table, total, done=0):
+        """
+        Starts the progress of 'table', which has 'total' source rows of which 'done'
+        were already migrated by an interrupted run. Several tables can be in progress
+        at once; advance() and finish_table() apply to the table the calling thread
+        started.
+        """
+        with self._lock:
+            self.tables[table] = {'rows': total, 'done': done, 'resumed_at': done, 'written': 0, 'seconds': 0.0}
+            self._table_started[table] = time.perf_counter()
+            first = len(self._table_started) == 1
+            if first:
+                self._progress_at = self._table_started[table]
+        self._local.table = table
+        if self.profile and tracemalloc.is_tracing() and first:
+            tracemalloc.reset_peak()
 
-    print(f"\nFound {len(old_coaches)} coach records to migrate.")
-    new_cursor = new_conn.cursor()
-    migrated_count = 0
-    current_time = get_timestamp() # Uses new fixed timestamp format
-    
-    for old_coach_row in old_coaches:
-        old_coach = dict(old_coach_row)
-        steamid = old_coach.get('steamid')
-        
-        coach_data = (
-            steamid,
-            None, # name
-            None, # team
-            current_time,
-            current_time,
-        )
-        try:
-            new_cursor.execute('''
-                INSERT INTO coaches (
-                    steamid, name, team, createdAt, updatedAt
-                ) VALUES (?, ?, ?, ?, ?)
-            ''', coach_data)
-            migrated_count += 1
-            # print(f"  -> SUCCESS: Migrated coach {steamid}.")
-        except sqlite3.IntegrityError as e:
-            print(f"  !!! ERROR inserting coach {steamid}: Integrity failed. Record skipped. Error: {e}")
-        except Exception as e:
-            print(f"  !!! UNEXPECTED ERROR inserting coach {steamid}. Record skipped. Error: {e}")
-            
-    return migrated_count
+    def advance(self, rows):
+        """
+        Counts 'rows' more processed rows of the calling thread's table and refreshes the
+        progress line at most every PROGRESS_INTERVAL seconds.
+        """
+        interactive = sys.stdout.isatty()
+        table = getattr(self._local, 'table', None)
+        with self._lock:
+            if table is None:
+                return
+            self.tables[table]['done'] += rows
+            now = time.perf_counter()
+            if now - self._progress_at < (PROGRESS_INTERVAL if interactive else PROGRESS_LOG_INTERVAL):
+                return
+            self._progress_at = now
+            line = self._progress_line(now, self._table_started)
+        self._print_progress(line, interactive)
 
-def migrate_matches(old_conn, new_conn):
-    old_conn.row_factory = sqlite3.Row
-    old_cursor = old_conn.cursor()
-    
-    try:
-        # Use the confirmed column names: id, current, left_id, left_wins, right_id, right_wins, matchType, vetos
-        old_cursor.execute('SELECT id, current, left_id, left_wins, right_id, right_wins, matchType, vetos FROM matches')
-        old_matches = old_cursor.fetchall()
-    except sqlite3.OperationalError as e:
-        print(f"FATAL ERROR: Error reading 'matches' table from old DB. Does it exist? Error: {e}")
-        return 0
+    def finish_table(self, written):
+        name = getattr(self._local, 'table', None)
+        if name is None:
+            return
+        self._local.table = None
+        with self._lock:
+            table = self.tables[name]
+            table['written'] = written
+            now = time.perf_counter()
+            table['seconds'] = now - self._table_started[name]
+            line = self._progress_line(now, {name: self._table_started.pop(name)})
+        self._print_progress(line, sys.stdout.isatty(), final=True)
 
-    print(f"\nFound {len(old_matches)} match records to migrate.")
-    new_cursor = new_conn.cursor()
-    migrated_count = 0
-    current_time = get_timestamp() # Uses new fixed timestamp format
+        # With tables running concurrently the peak covers all of them
+        if self.profile and tracemalloc.is_tracing():
+            table['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+            top_sites = tracemalloc.take_snapshot().statistics('lineno')[:10]
+            self.allocations[name] = [str(site) for site in top_sites]
 
-    for old_match_row in old_matches:
-        old_match = dict(old_match_row)
-        
-        # Ensure 'current' is treated as an integer (0 or 1)
-        current_status = 1 if old_match.get('current') in (1, 'true', 'True') else 0
-        
-        match_data = (
-            old_match.get('id'),
-            current_status,
-            old_match.get('left_id'),
-            old_match.get('left_wins', 0),
-            old_match.get('right_id'),
-            old_match.get('right_wins', 0),
-            old_match.get('matchType', 'Legacy'),
-            clean_extra_field(old_match.get('vetos')),
-            current_time,
-            current_time,
-        )
-        
-        try:
-            new_cursor.execute('''
-                INSERT INTO matches (
-                    id, current, left_id, left_wins, right_id, right_wins, matchType, vetos, createdAt, updatedAt
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', match_data)
-            migrated_count += 1
-            # print(f"  -> SUCCESS: Migrated match {old_match.get('id')}.")
-        except sqlite3.IntegrityError as e:
-            print(f"  !!! ERROR inserting match {old_match.get('id')}: Integrity failed. Record skipped. Error: {e}")
-        except Exception as e:
-            print(f"  !!! UNEXPECTED ERROR inserting match {old_match.get('id')}. Record skipped. Error: {e}")
+    def _progress_line(self, now, started):
+        parts = []
+        for name, table_started in started.items():
+            table = self.tables[name]
+            elapsed = now - table_started
+            rate = (table['done'] - table['resumed_at']) / elapsed if elapsed > 0 else 0
+            remaining = max(table['rows'] - table['done'], 0)
+            eta = format_duration(remaining / rate) if rate else '?'
+            percent = 100 * table['done'] / table['rows'] if table['rows'] else 100
+            if len(started) == 1:
+                parts.append(f"{name}: {table['done']}/{table['rows']} rows ({percent:.0f}%), {rate:.0f} rows/s, ETA {eta}")
+            else:
+                parts.append(f"{name} {percent:.0f}% ETA {eta}")
+        return '  -> ' + ' | '.join(parts)
 
-    return migrated_count
+    def _print_progress(self, line, interactive, final=False):
+        if not interactive:
+            print(line)
+            return
+        if isinstance(sys.stdout, ConsoleOutput):
+            sys.stdout.show_progress(line, final)
+            return
+        sys.stdout.write(f"\r{line:<79}")
+        if final:
+            sys.stdout.write("\n")
+        sys.stdout.flush()
 
+    # Reporting
 
-# --- Main Migration Runner ---
+    def report(self, completed=None, error=None, counts=None):
+        """
+        Returns the JSON-serializable summary of the run. 'counts' are the final rows
+        per target table as reported to the user.
+        """
+        with self._lock:
+            report = {
+                'started_at': self.started_at,
+                'seconds': round(time.perf_counter() - self._started, 3),
+                'completed': completed,
+                'error': error,
+                'counts': counts or {},
+                'tables': {name: dict(table) for name, table in self.tables.items()},
+                'stages': {
+                    name: {'seconds': round(self.stage_seconds[name], 3), 'calls': self.stage_calls[name]}
+                    for name in self.stage_seconds
+                },
+                'counters': dict(self.counters),
+            }
+        if self.profile:
+            report['allocations'] = self.allocations
+            if tracemalloc.is_tracing():
+                report['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+        return report
 
-def run_migration():
-    # 1. Setup connections
-    if not os.path.exists(OLD_DB_PATH):
-        print(f"FATAL ERROR: Old database file not found at {OLD_DB_PATH}")
-        return
+    def absorb(self, report):
+        """
+        Adds the stage times and counters of another run's report(), e.g. a shard
+        worker's, to this run.
+        """
+        with self._lock:
+            for name, stage in report['stages'].items():
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + stage['seconds']
+                self.stage_calls[name] = self.stage_calls.get(name, 0) + stage['calls']
+            for name, value in report['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
 
-    try:
-        old_conn = sqlite3.connect(OLD_DB_PATH)
-    except Exception as e:
-        print(f"FATAL ERROR: Could not open old database file. Error: {e}")
-        return
-        
-    # Delete old target file if it exists
-    if os.path.exists(NEW_DB_PATH):
+    def write_report(self, path, report=None):
         try:
-            os.remove(NEW_DB_PATH)
-            print(f"Deleted old target file: {os.path.basename(NEW_DB_PATH)}")
-        except Exception as e:
-            print(f"FATAL ERROR: Could not delete old {os.path.basename(NEW_DB_PATH)}. Please close any program using it and try again. Error: {e}")
-            old_conn.close()
-            return
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report or self.report(), f, indent=2)
+        except OSError as e:
+            print(f"  -> WARNING: Could not write metrics report '{path}'. Error: {e}")
 
-    try:
-        new_conn = sqlite3.connect(NEW_DB_PATH)
-        create_new_db_schema(new_conn)
-    except Exception as e:
-        print(f"FATAL ERROR: Could not create new database schema. Error: {e}")
-        old_conn.close()
-        return
+    def write_profiles(self, folder, top=8):
+        """
+        Dumps one '<stage>.prof' file per profiled stage into 'folder' and prints the
+        'top' functions of each by cumulative time, plus the top allocation sites per table.
+        """
+        os.makedirs(folder, exist_ok=True)
+        for name, stats in self.profiles.items():
+            stats.dump_stats(os.path.join(folder, f'{name}.prof'))
+            print(f"\n--- Profile: {name} stage ({self.stage_calls[name]} calls, {self.stage_seconds[name]:.2f}s) ---")
+            stats.stream = sys.stdout
+            stats.sort_stats('cumulative').print_stats(top)
+        for name, sites in self.allocations.items():
+            peak = self.tables[name].get('peak_traced_bytes', 0)
+            print(f"\n--- Memory: {name} (peak {peak / 1048576:.1f} MiB) ---")
+            for site in sites:
+                print(f"  {site}")
+        print(f"\nProfile files written to: {folder}")
 
-    # 2. Run migrations
-    migrated_players = 0
-    migrated_teams = 0
-    coach_count = 0
-    match_count = 0
-    
+# Metrics of the current run; reset by run_migration()
+METRICS = MigrationMetrics()
+
+# --- Resume Checkpoint ---
+
+class MigrationCheckpoint:
+    """
+    Per-table progress of a migration, stored in the target database itself so every
+    update commits in the same transaction as the batch of rows it describes.
+
+    For each table it records the last source rowid written and whether the table is
+    finished. A resumed run continues each unfinished table right after that rowid and
+    skips finished ones. The table is dropped once a run completes.
+    """
+
+    TABLE = '_migration_checkpoint'
+
+    def __init__(self, conn):
+        self.conn = conn
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                table_name TEXT PRIMARY KEY NOT NULL,
+                last_rowid INTEGER,
+                done INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.commit()
+
+    @classmethod
+    def exists_in(cls, conn):
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (cls.TABLE,)).fetchone()
+        return row is not None
+
+    def last_rowid(self, table):
+        row = self.conn.execute(f'SELECT last_rowid FROM {self.TABLE} WHERE table_name = ?', (table,)).fetchone()
+        return row[0] if row else None
+
+    def is_done(self, table):
+        row = self.conn.execute(f'SELECT done FROM {self.TABLE} WHERE table_name = ?', (table,)).fetchone()
+        return bool(row and row[0])
+
+    def record(self, table, last_rowid):
+        """
+        Must be called inside the transaction that wrote the rows up to 'last_rowid'.
+        """
+        self.conn.execute(f'''
+            INSERT INTO {self.TABLE} (table_name, last_rowid) VALUES (?, ?)
+            ON CONFLICT(table_name) DO UPDATE SET last_rowid = excluded.last_rowid
+        ''', (table, last_rowid))
+
+    def mark_done(self, table):
+        self.conn.execute(f'''
+            INSERT INTO {self.TABLE} (table_name, done) VALUES (?, 1)
+            ON CONFLICT(table_name) DO UPDATE SET done = 1
+        ''', (table,))
+        self.conn.commit()
+
+    def clear(self):
+        self.conn.execute(f'DROP TABLE IF EXISTS {self.TABLE}')
+        self.conn.commit()
+
+def table_progress(checkpoint, table):
+    """
+    Returns (after_rowid, on_batch) for migrating 'table': where to resume reading and
+    the insert_rows() hook that records progress. Both are None without a checkpoint.
+    """
+    if checkpoint is None:
+        return None, None
+    after_rowid = checkpoint.last_rowid(table)
+    if after_rowid is not None:
+        print(f"  -> Resuming '{table}' after source row {after_rowid}.")
+    return after_rowid, lambda last_rowid: checkpoint.record(table, last_rowid)
+
+# --- Streaming Read Functions ---
+
+def count_rows(conn, table):
+    """
+    Returns the number of rows in 'table'. Raises sqlite3.OperationalError if the
+    table does not exist, so callers can report a missing table up front.
+    """
+    return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+def table_columns(conn, table):
+    """
+    Returns the set of column names of 'table', in lower case as SQLite matches them.
+    Empty when the table does not exist.
+    """
+    return {row[1].lower() for row in conn.execute(f'PRAGMA table_info({table})')}
+
+def has_rowids(conn, table):
+    """
+    True when 'table' can be read by rowid (not a WITHOUT ROWID table or a view).
+    """
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch()
-            context = browser.new_context()
-            page = context.new_page()
+        conn.execute(f'SELECT _rowid_ FROM {table} LIMIT 0')
+    except sqlite3.OperationalError:
+        return False
+    return True
 
-            # Player Migration (Includes avatar download)
-            migrated_players = migrate_players(old_conn, new_conn, page)
-            
-            # Team Migration (Includes logo download)
-            migrated_teams = migrate_teams(old_conn, new_conn, page)
-            
-            browser.close()
-            
-        # Coach Migration (Simplified)
-        coach_count = migrate_coaches(old_conn, new_conn)
-        
-        # Match Migration (Corrected)
-        match_count = migrate_matches(old_conn, new_conn)
-            
-    except Exception as e:
-        print(f"\n!!! CRITICAL MIGRATION ERROR: {e}")
-        print("Migration incomplete. Check the logs above for detailed errors.")
-    finally:
-        # 3. Commit and Close
-        new_conn.commit()
-        old_conn.close()
-        new_conn.close()
+def database_path(conn):
+    """
+    Returns the file behind the main database of 'conn'.
+    """
+    return conn.execute('PRAGMA database_list').fetchone()[2]
 
-    print("\n-------------------------------------------")
-    print("✅ Full Database Migration Complete!")
-    print(f"Players migrated: {migrated_players}")
-    print(f"Teams migrated: {migrated_teams}")
-    print(f"Coaches migrated: {coach_count}")
-    print(f"Matches migrated: {match_count}")
-    print("New database file created: database.v1.db")
-    print("-------------------------------------------")
+def read_pages(conn, table, columns='*', page_size=None, after_rowid=None, until_rowid=None):
+    """
+    Generator that reads 'table' page by page and yields lists of at most 'page_size'
+    (default: READ_PAGE_SIZE) rows as dicts, so only one page is ever held in memory.
 
+    Pages are fetched by rowid range ('WHERE rowid > last ORDER BY rowid LIMIT n'), which
+    stays fast at any offset. Every dict carries the source rowid under '_rowid_'. Tables
+    without a rowid fall back to fetchmany() on a single cursor, numbering rows from 1.
+    Rows up to and including 'after_rowid' are skipped (used to resume a migration), and
+    reading stops after 'until_rowid' (used by shards; tables with rowids only).
+    """
+    page_size = page_size or READ_PAGE_SIZE
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
 
-# --- Main Execution ---\
+    if not has_rowids(conn, table):
+        cursor.execute(f'SELECT {columns} FROM {table}')
+        position = 0
+        while True:
+            with METRICS.stage('read'):
+                rows = cursor.fetchmany(page_size)
+            if not rows:
+                return
+            METRICS.count('rows_read', len(rows))
+            page = []
+            for row in rows:
+                position += 1
+                if after_rowid is None or position > after_rowid:
+                    page.append({**dict(row), '_rowid_': position})
+            if page:
+                yield page
 
-if __name__ == "__main__":
-    if not os.path.exists(OLD_DB_PATH):
-        print(f"FATAL ERROR: Old database file not found at {OLD_DB_PATH}")
-        print("Please ensure the old file is at %APPDATA%/openhud/database.db")
+    # Start below the smallest possible rowid unless resuming
+    last_rowid = -(2 ** 63) if after_rowid is None else after_rowid
+    until_rowid = 2 ** 63 - 1 if until_rowid is None else until_rowid
+    while True:
+        with METRICS.stage('read'):
+            cursor.execute(
+                f'SELECT _rowid_ AS _rowid_, {columns} FROM {table} WHERE _rowid_ > ? AND _rowid_ <= ? '
+                f'ORDER BY _rowid_ LIMIT ?',
+                (last_rowid, until_rowid, page_size),
+            )
+            page = [dict(row) for row in cursor.fetchall()]
+        if not page:
+            return
+        METRICS.count('rows_read', len(page))
+        last_rowid = page[-1]['_rowid_']
+        yield page
+
+# --- Bulk Write Functions ---
+
+def apply_bulk_load_pragmas(conn, durable=False):
+    """
+    Tunes the target connection for bulk loading. A throwaway build (staged in memory
+    or a temp file, a shard, an import) is rebuilt from scratch after a crash, so crash
+    durability during the load is traded for speed; the journal stays in memory (not
+    OFF) so a failed batch can still be rolled back. A 'durable' build carries the
+    resume checkpoint in the file, so it uses WAL with synchronous=NORMAL instead: a
+    crash can lose the last batches but never corrupt the rows a checkpoint vouches for.
+    """
+    if durable:
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
     else:
-        # Check for necessary libraries
+        conn.execute('PRAGMA journal_mode = MEMORY')
+        conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -65536') # 64 MiB page cache
+    conn.execute('PRAGMA temp_store = MEMORY')
+    # No FK checks while loading; tables are filled in dependency-agnostic order
+    conn.execute('PRAGMA foreign_keys = OFF')
+
+def iter_batches(rows, batch_size):
+    """
+    Yields lists of up to 'batch_size' items from any iterable.
+    """
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def insert_rows(conn, insert_sql, rows, describe, batch_size=None, on_batch=None, lock=None):
+    """
+    Inserts 'rows', an iterable of (source_rowid, values) pairs, with executemany() in
+    batches of 'batch_size' (default: INSERT_BATCH_SIZE), each batch in its own
+    explicit transaction.
+
+    When a batch hits a constraint violation it is rolled back and replayed row by row,
+    so only the offending records are skipped and reported. 'describe(values)' names a
+    row in those messages. 'on_batch(last_source_rowid)' runs inside each batch's
+    transaction just before it commits, so progress can be checkpointed atomically
+    with the rows. 'lock' is held for every batch transaction, so several tables can
+    write through one connection. Returns the number of inserted rows.
+    """
+    batch_size = batch_size or INSERT_BATCH_SIZE
+    lock = lock or contextlib.nullcontext()
+    inserted = 0
+
+    for batch in iter_batches(rows, batch_size):
+        values = [row_values for _, row_values in batch]
+        last_source_rowid = batch[-1][0]
+        with lock:
+            batch_inserted = insert_batch(conn, insert_sql, values, last_source_rowid, describe, on_batch)
+        inserted += batch_inserted
+        METRICS.count('rows_written', batch_inserted)
+        METRICS.count('skipped_rows', len(batch) - batch_inserted)
+        METRICS.advance(len(batch))
+
+    return inserted
+
+def insert_batch(conn, insert_sql, values, last_source_rowid, describe, on_batch=None):
+    """
+    Writes one insert_rows() batch in its own transaction and returns how many of its
+    rows were inserted.
+    """
+    try:
+        conn.execute('BEGIN')
         try:
-            import requests 
-            from playwright.sync_api import sync_playwright
-        except ImportError:
-            print("FATAL ERROR: Required libraries are missing.")
-            print("Please run these two commands:")
-            print("1. pip install playwright requests")
-            print("2. playwright install")
-            sys.exit(1)
+            with METRICS.stage('insert'):
+                conn.executemany(insert_sql, values)
+                if on_batch:
+                    on_batch(last_source_rowid)
+            with METRICS.stage('commit'):
+                conn.commit()
+            return len(values)
+        except sqlite3.Error:
+            conn.rollback()
 
-        # --- WARNING AND CONFIRMATION ---
-        print("=" * 70)
-        print("                ⚠️ WARNING: DATABASE MIGRATION ⚠️")
-        print("=" * 70)
-        print("This file migrates the old database.db file into the newer database.v1.db.")
-        print(f"1. This script will **DELETE** any existing file named: {os.path.basename(NEW_DB_PATH)}, the old file should be safe")
-        print("2. It will then generate a new 'database.v1.db' from the old 'database.db'.")
+        # Slow path: find and skip the rows that broke the batch
+        conn.execute('BEGIN')
+        batch_inserted = 0
+        with METRICS.stage('insert'):
+            for row in values:
+                try:
+                    conn.execute(insert_sql, row)
+                    batch_inserted += 1
+                except sqlite3.IntegrityError as e:
+                    print(f"  !!! ERROR inserting {describe(row)}: Integrity failed. Record skipped. Error: {e}")
+                except Exception as e:
+                    print(f"  !!! UNEXPECTED ERROR inserting {describe(row)}. Record skipped. Error: {e}")
+            if on_batch:
+                on_batch(last_source_rowid)
+        with METRICS.stage('commit'):
+            conn.commit()
+        return batch_inserted
+    except BaseException:
+        # e.g. Ctrl-C: never leave a half-written batch behind
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+# --- Staged Target Build ---
+
+def open_build_database(build, resume_from=None):
+    """
+    Opens the private database a staged migration is built in: RAM for 'memory', an
+    anonymous SQLite temp file for 'temp'. 'resume_from' is a partial build to
+    continue, copied in with the backup API.
+    """
+    conn = sqlite3.connect(':memory:' if build == 'memory' else '', check_same_thread=False)
+    if resume_from:
+        partial_conn = sqlite3.connect(resume_from)
+        try:
+            partial_conn.backup(conn)
+        finally:
+            partial_conn.close()
+    return conn
+
+def remove_database_file(path):
+    """
+    Deletes the SQLite file 'path' with its journal and WAL files, if present.
+    """
+    for suffix in ('', '-journal', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def save_database(conn, path):
+    """
+    Writes the database of 'conn' to the file 'path' with the online backup API and
+    syncs it to disk. The file appears under 'path' only once it is complete.
+    """
+    temp_path = f"{path}.tmp"
+    remove_database_file(temp_path)
+    file_conn = sqlite3.connect(temp_path)
+    try:
+        conn.backup(file_conn)
+        file_conn.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        file_conn.close()
+    publish_database(temp_path, path)
+
+def publish_database(path, destination):
+    """
+    Syncs the finished (and closed) database file 'path' to disk and atomically renames
+    it over 'destination'.
+    """
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+    publish_file(path, destination)
+
+def publish_file(source, destination):
+    """
+    Atomically renames the finished database 'source' over 'destination'. A stale
+    rollback journal of the replaced database is removed first, as SQLite would apply
+    it to the new file.
+
+    Raises OSError while 'destination' has a WAL file: a program has it open (or
+    crashed with it open), and its committed rows may still be in the WAL only.
+    """
+    if os.path.exists(destination + '-wal'):
+        raise OSError(f"{os.path.basename(destination)} is in use ({os.path.basename(destination)}-wal exists); "
+                      "it was not replaced")
+    for suffix in ('-journal', '-shm'):
+        if os.path.exists(destination + suffix):
+            os.remove(destination + suffix)
+    os.replace(source, destination)
+    if hasattr(os, 'O_DIRECTORY'): # make the rename itself durable (POSIX)
+        folder = os.open(os.path.dirname(os.path.abspath(destination)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(folder)
+        finally:
+            os.close(folder)
+
+# --- Asset Download Functions ---
+
+# One downloaded image (a StagedAsset) plus the validators needed to revalidate it later
+FetchedAsset = namedtuple('FetchedAsset', ['file', 'content_type', 'etag', 'last_modified'])
+
+class AssetTooLarge(Exception):
+    """
+    Raised when a download exceeds MAX_ASSET_BYTES.
+    """
+
+class StagedAsset:
+    """
+    A temp file inside an uploads folder that one download is streamed into, hashed
+    while it is written so it never has to be held in memory. publish() renames it to
+    its content-addressed name; discard() deletes it if it was not published.
+    Writing more than 'max_bytes' (default: MAX_ASSET_BYTES) raises AssetTooLarge.
+    """
+
+    def __init__(self, folder, max_bytes=None):
+        self.folder = folder
+        self.max_bytes = max_bytes or MAX_ASSET_BYTES
+        self.path = os.path.join(folder, f".{uuid.uuid4().hex}.download.tmp")
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._file = open(self.path, 'wb')
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise AssetTooLarge(f"Download is larger than MAX_ASSET_BYTES ({self.max_bytes} bytes).")
+        self._digest.update(chunk)
+        self._file.write(chunk)
+
+    def read(self):
+        """
+        Returns the bytes written so far (for image normalization).
+        """
+        self._file.flush()
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def publish(self, file_ext):
+        """
+        Moves the file to '<sha256><ext>' in the folder and returns that name. When an
+        identical image is already stored the temp file is simply dropped.
+        """
+        self._file.close()
+        filename = f"{self._digest.hexdigest()}{file_ext.lower()}"
+        full_path = os.path.join(self.folder, filename)
+        if os.path.exists(full_path):
+            os.remove(self.path)
+        else:
+            os.replace(self.path, full_path)
+        self.path = None
+        return filename
+
+    def discard(self):
+        self._file.close()
+        if self.path is not None:
+            with contextlib.suppress(OSError):
+                os.remove(self.path)
+            self.path = None
+
+def stage_bytes(folder, data):
+    """
+    Wraps already downloaded bytes (the browser fallback) in a StagedAsset.
+    """
+    staged = StagedAsset(folder)
+    try:
+        staged.write(data)
+    except BaseException:
+        staged.discard()
+        raise
+    return staged
+
+class AssetCache:
+    """
+    Thread-safe, JSON-backed map from an asset source to the file stored for it.
+
+    URL entries keep the server's ETag/Last-Modified so stale entries can be revalidated
+    cheaply; local-file entries (keyed by absolute path) are trusted while the source's
+    size and mtime are unchanged. With path=None the cache only lives for this run.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        # Tables finishing at once save concurrently; one write at a time, in snapshot order
+        self._save_lock = threading.Lock()
+        self._entries = {}
+        self._saved_at = time.monotonic()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"  -> WARNING: Ignoring unreadable asset cache '{path}'. Error: {e}")
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+
+    def merge(self, path):
+        """
+        Adds the entries another cache saved at 'path', e.g. a shard worker's.
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        with self._lock:
+            self._entries.update(entries)
+
+    def items(self):
+        with self._lock:
+            return list(self._entries.items())
+
+    def stored_sizes(self):
+        """
+        Returns {stored file name: size in bytes} for every entry. Local entries keep
+        the source's size in 'size', and 'stored_size' when the stored file differs.
+        """
+        with self._lock:
+            return {entry['file']: entry.get('stored_size', entry.get('size')) for entry in self._entries.values()}
+
+    def save(self, min_interval=None):
+        """
+        Writes the cache to disk. With 'min_interval' the write is skipped if the
+        last one happened less than that many seconds ago.
+        """
+        if not self.path:
+            return
+        if min_interval and time.monotonic() - self._saved_at < min_interval:
+            return
+        with self._save_lock:
+            with self._lock:
+                data = json.dumps(self._entries)
+                self._saved_at = time.monotonic()
+            temp_path = f"{self.path}.tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print(f"  -> WARNING: Could not save asset cache '{self.path}'. Error: {e}")
+
+class FailedAssetLog:
+    """
+    Thread-safe list of the remote assets a migration could not fetch, one entry per
+    target row and column: {'table', 'column', 'key', 'source'}. Saved as JSON next to
+    the target, so refetch_failed_assets() can try them again later. With path=None
+    the log only lives for this run; with keep=False an existing file is ignored.
+    """
+
+    def __init__(self, path=None, keep=True):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if keep and path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for entry in json.load(f):
+                        self._entries[(entry['table'], entry['column'], str(entry['key']))] = entry
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"  -> WARNING: Ignoring unreadable failed asset list '{path}'. Error: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def record(self, table, column, key, source):
+        with self._lock:
+            self._entries[(table, column, str(key))] = {'table': table, 'column': column, 'key': key, 'source': source}
+
+    def resolve(self, table, column, key):
+        with self._lock:
+            self._entries.pop((table, column, str(key)), None)
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries.values())
+
+    def save(self):
+        """
+        Writes the list, or removes the file when nothing failed.
+        """
+        if not self.path:
+            return
+        entries = self.entries()
+        try:
+            if not entries:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"  -> WARNING: Could not save failed asset list '{self.path}'. Error: {e}")
+
+class TransientDownloadError(Exception):
+    """
+    A download attempt that may succeed when retried (connection error, timeout or a
+    RETRY_STATUSES answer). 'retry_after' is the server's requested delay, if any.
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class DownloadRefused(Exception):
+    """
+    The server answered but did not hand out the image (error status or an HTML page).
+    """
+
+class HostUnavailable(Exception):
+    """
+    Raised instead of downloading while a host's circuit breaker is open.
+    """
+
+def retry_delay(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number 'attempt' (from 1): the server's Retry-After
+    if it sent one, otherwise RETRY_BACKOFF doubled per attempt with up to 50% jitter.
+    Never more than RETRY_MAX_DELAY.
+    """
+    if retry_after is None:
+        retry_after = RETRY_BACKOFF * 2 ** (attempt - 1) * (1 + random.random() / 2)
+    return min(retry_after, RETRY_MAX_DELAY)
+
+class HostScheduler:
+    """
+    Per-host download limits shared by all download workers. At most 'connections'
+    (default: HOST_CONNECTIONS) requests go to one host at a time, and a circuit
+    breaker fails a host's URLs at once (HostUnavailable) after 'failure_threshold'
+    (default: HOST_FAILURE_THRESHOLD) transient failures in a row. Once 'cooldown'
+    (default: HOST_COOLDOWN) seconds have passed a single trial request is let
+    through; its success closes the circuit again.
+    """
+
+    def __init__(self, connections=None, failure_threshold=None, cooldown=None):
+        self.connections = connections or HOST_CONNECTIONS
+        self.failure_threshold = failure_threshold or HOST_FAILURE_THRESHOLD
+        self.cooldown = HOST_COOLDOWN if cooldown is None else cooldown
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._failures = {}
+        self._open_until = {}
+        self._trials = set()
+
+    @contextmanager
+    def slot(self, host):
+        """
+        Holds one of the host's connection slots for the enclosed request. Raises
+        HostUnavailable while the host's circuit is open.
+
+        Call record_success() or record_failure() inside the block. A trial request
+        that ends without either (e.g. AssetTooLarge, a bad URL, a local disk error)
+        says nothing about the host: the circuit stays open and the next request
+        after it is the new trial.
+        """
+        with self._lock:
+            slots = self._slots.setdefault(host, threading.BoundedSemaphore(self.connections))
+        with slots:
+            # Checked after waiting: the host may have gone down in the meantime
+            trial = self._admit(host)
+            try:
+                yield
+            finally:
+                if trial:
+                    self.release_trial(host)
+
+    def _admit(self, host):
+        """
+        Returns True when the request is the host's trial request.
+        """
+        with self._lock:
+            failures = self._failures.get(host, 0)
+            if failures < self.failure_threshold:
+                return False
+            if time.monotonic() < self._open_until[host] or host in self._trials:
+                METRICS.count('circuit_skips')
+                raise HostUnavailable(f"Host '{host}' is down ({failures} failed attempts in a row). Skipped.")
+            self._trials.add(host)
+            return True
+
+    def release_trial(self, host):
+        """
+        Lets another trial request through, without opening or closing the circuit.
+        """
+        with self._lock:
+            self._trials.discard(host)
+
+    def record_success(self, host):
+        """
+        The host answered (even with a refusal), so it is up.
+        """
+        with self._lock:
+            self._failures.pop(host, None)
+            self._trials.discard(host)
+
+    def record_failure(self, host):
+        with self._lock:
+            failures = self._failures[host] = self._failures.get(host, 0) + 1
+            self._trials.discard(host)
+            if failures < self.failure_threshold:
+                return
+            self._open_until[host] = time.monotonic() + self.cooldown
+        if failures == self.failure_threshold:
+            METRICS.count('hosts_down')
+            print(f"  -> WARNING: Host '{host}' looks down after {failures} failed attempts in a row. "
+                  f"Its remaining URLs are skipped for {self.cooldown}s.")
+
+class AssetFetcher:
+    """
+    Thread-safe image downloader used by the download workers.
+
+    Every URL is requested through one pooled keep-alive requests.Session, paced per
+    host by a HostScheduler ('hosts'). Transient failures are retried with exponential
+    backoff. Only when the server refuses the download (HTTP error status or an HTML
+    page instead of an image, e.g. bot protection) is the URL retried in headless
+    Chromium; a host that is down is not. The browser is started lazily on the first
+    such URL and lives on a single dedicated thread, because Playwright's sync API is
+    bound to the thread that started it. If it cannot be started, later fallbacks fail
+    at once with the same error.
+    """
+
+    def __init__(self, pool_size=None, hosts=None):
+        pool_size = pool_size or DOWNLOAD_WORKERS
+        self.hosts = hosts or HostScheduler()
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._browser_lock = threading.Lock()
+        self._browser_executor = None
+        self._playwright = None
+        self._browser = None
+        self._page = None
+        self._browser_error = None
+
+    def fetch(self, url, folder, validators=None):
+        """
+        Streams 'url' into a StagedAsset inside 'folder' and returns it as a FetchedAsset,
+        or raises on failure. 'validators' are optional conditional request headers
+        (If-None-Match / If-Modified-Since); when the server answers 304 Not Modified,
+        None is returned. Assets over MAX_ASSET_BYTES raise AssetTooLarge right away,
+        and URLs of a host that is down raise HostUnavailable.
+        """
+        host = urlparse(url).netloc.lower()
+        retry_after = None
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            if attempt:
+                METRICS.count('retries')
+                time.sleep(retry_delay(attempt, retry_after))
+            with self.hosts.slot(host):
+                try:
+                    asset = self._fetch_http(url, folder, validators)
+                except TransientDownloadError as e:
+                    self.hosts.record_failure(host)
+                    http_error, retry_after = e, e.retry_after
+                    continue
+                except DownloadRefused as e:
+                    self.hosts.record_success(host)
+                    http_error = e
+                    break
+                self.hosts.record_success(host)
+            return asset
+        else:
+            raise Exception(f"Plain HTTP download failed after {DOWNLOAD_RETRIES + 1} attempts: {http_error}")
+
+        if sync_playwright is None:
+            raise Exception(f"Plain HTTP download failed: {http_error}. Playwright is not installed for the browser fallback.")
+
+        METRICS.count('browser_fallbacks')
+        with self._browser_lock:
+            if self._browser_executor is None:
+                self._browser_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chromium')
+        # The browser's requests count against the host like plain ones
+        with self.hosts.slot(host):
+            return self._browser_executor.submit(self._fetch_with_browser, url, folder).result()
+
+    def _fetch_http(self, url, folder, validators):
+        try:
+            timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+            with self.session.get(url, headers=validators, timeout=timeout, stream=True) as response:
+                if response.status_code == 304 and validators:
+                    return None
+                content_type = response.headers.get('Content-Type', '')
+                if response.status_code in RETRY_STATUSES:
+                    retry_after = response.headers.get('Retry-After', '')
+                    raise TransientDownloadError(
+                        f"HTTP status {response.status_code}", int(retry_after) if retry_after.isdigit() else None
+                    )
+                if response.status_code >= 400 or content_type.startswith('text/html'):
+                    raise DownloadRefused(f"HTTP status {response.status_code} ({content_type or 'no Content-Type'})")
+
+                length = response.headers.get('Content-Length', '')
+                if length.isdigit() and int(length) > MAX_ASSET_BYTES:
+                    raise AssetTooLarge(f"Server announced {length} bytes, more than MAX_ASSET_BYTES ({MAX_ASSET_BYTES}).")
+                staged = StagedAsset(folder)
+                try:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        staged.write(chunk)
+                except BaseException:
+                    staged.discard()
+                    raise
+                return FetchedAsset(
+                    staged,
+                    content_type,
+                    response.headers.get('ETag'),
+                    response.headers.get('Last-Modified'),
+                )
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            raise TransientDownloadError(str(e)) from e
+        # Any other requests error (InvalidURL, MissingSchema, TooManyRedirects, ...) would
+        # fail the same way again, so it propagates without a retry or a breaker failure
+
+    def _start_browser(self):
+        """
+        Starts Chromium once. A failed start is torn down and remembered, so a missing
+        browser costs one attempt per run instead of one (and a leaked Playwright) per URL.
+        """
+        if self._browser_error is not None:
+            raise Exception(f"Chromium fallback unavailable: {self._browser_error}")
+        print("  -> INFO: Plain HTTP download refused, starting headless Chromium fallback...")
+        try:
+            self._playwright = sync_playwright().start()
+            self._browser = self._playwright.chromium.launch()
+            context = self._browser.new_context()
+            self._page = context.new_page()
+            self._page.set_extra_http_headers(HEADERS)
+        except Exception as e:
+            self._browser_error = e
+            self._page = None
+            with contextlib.suppress(Exception):
+                self._close_browser()
+            self._browser = self._playwright = None
+            print(f"  -> WARNING: Could not start headless Chromium. Protected URLs will fail. Error: {e}")
+            raise Exception(f"Chromium fallback unavailable: {e}") from e
+
+    def _fetch_with_browser(self, url, folder):
+        if self._page is None:
+            self._start_browser()
+
+        response = self._page.goto(url, wait_until="load", timeout=BROWSER_TIMEOUT * 1000)
+        if response is None or response.status >= 400:
+            raise Exception(f"Playwright failed to get a response (Status: {response.status if response else 'N/A'}).")
+        length = response.headers.get('content-length', '')
+        if length.isdigit() and int(length) > MAX_ASSET_BYTES:
+            raise AssetTooLarge(f"Server announced {length} bytes, more than MAX_ASSET_BYTES ({MAX_ASSET_BYTES}).")
+        # Playwright only hands out whole bodies, so this path cannot stream
+        body = response.body()
+        if len(body) > MAX_ASSET_BYTES:
+            raise AssetTooLarge(f"Download is larger than MAX_ASSET_BYTES ({MAX_ASSET_BYTES} bytes).")
+        return FetchedAsset(
+            stage_bytes(folder, body),
+            response.headers.get('content-type', ''),
+            response.headers.get('etag'),
+            response.headers.get('last-modified'),
+        )
+
+    def _close_browser(self):
+        if self._browser is not None:
+            self._browser.close()
+        if self._playwright is not None:
+            self._playwright.stop()
+
+    def close(self):
+        self.session.close()
+        if self._browser_executor is not None:
+            self._browser_executor.submit(self._close_browser).result()
+            self._browser_executor.shutdown()
+
+def is_remote_source(source):
+    return source.lower().startswith(('http://', 'https://'))
+
+def get_asset_extension(url, content_type):
+    """
+    Picks the file extension for a downloaded image: the URL's own extension when it
+    is a known image type, otherwise a guess based on the response Content-Type.
+    """
+    path = urlparse(url).path
+    _, file_ext = os.path.splitext(path)
+    if not file_ext or len(file_ext) > 5 or file_ext.lower() not in ('.jpg', '.png', '.jpeg', '.webp'):
+        file_ext = '.jpg' if 'image/jpeg' in content_type else '.png'
+    return file_ext
+
+def write_content_addressed(folder, data, file_ext):
+    """
+    Stores 'data' as '<sha256><ext>' inside 'folder' and returns the file name.
+    Identical images end up in the same file, which is only written once.
+    """
+    filename = f"{hashlib.sha256(data).hexdigest()}{file_ext.lower()}"
+    full_path = os.path.join(folder, filename)
+    if not os.path.exists(full_path):
+        temp_path = f"{full_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, full_path)
+    return filename
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Linux ioctl that makes a file share another file's data blocks (a reflink; btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+def copy_asset_file(source, destination):
+    """
+    Creates 'destination' (which must not exist) with the contents of 'source' as
+    cheaply as the platform allows and returns the method used. In order:
+
+      - 'reflink': copy-on-write clone via FICLONE, no data is copied at all,
+      - 'hardlink': a second name for the same file (LOCAL_ASSET_HARDLINKS),
+      - 'copy_file_range' / 'sendfile': copied inside the kernel,
+      - 'copy': a plain buffered copy.
+
+    Each method falls through to the next when the OS or filesystem refuses it
+    (e.g. a different filesystem for hardlinks).
+    """
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return 'reflink'
+            except OSError:
+                pass
+
+    if LOCAL_ASSET_HARDLINKS:
+        try:
+            os.remove(destination)
+            os.link(source, destination)
+            return 'hardlink'
+        except OSError:
+            pass
+
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        size = os.fstat(src.fileno()).st_size
+        for method in ('copy_file_range', 'sendfile'):
+            if not hasattr(os, method):
+                continue
+            try:
+                copied = 0
+                while copied < size:
+                    if method == 'copy_file_range':
+                        sent = os.copy_file_range(src.fileno(), dst.fileno(), size - copied, copied, copied)
+                    else:
+                        sent = os.sendfile(dst.fileno(), src.fileno(), copied, size - copied)
+                    if sent == 0:
+                        break
+                    copied += sent
+                if copied == size:
+                    return method
+            except OSError:
+                pass
+            dst.seek(0)
+            dst.truncate()
+
+        src.seek(0)
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+        return 'copy'
+
+# --- Image Normalization ---
+
+# File extension of every Pillow format NORMALIZED_IMAGE_FORMAT may name
+IMAGE_FORMAT_EXTENSIONS = {'WEBP': '.webp', 'PNG': '.png', 'JPEG': '.jpg'}
+
+def normalize_image(data, max_size, image_format, quality):
+    """
+    Runs in the image process pool: decodes 'data', scales it down to fit 'max_size'
+    (never up) and re-encodes it as 'image_format'. Returns the new bytes, or None when
+    the original should be kept (undecodable, or already small and compact).
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            needs_resize = image.width > max_size[0] or image.height > max_size[1]
+            has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha and image_format != 'JPEG' else 'RGB')
+            image.thumbnail(max_size, Image.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, format=image_format, quality=quality)
+    except Exception:
+        return None # not an image Pillow understands (e.g. SVG); store it unchanged
+
+    encoded = output.getvalue()
+    if not needs_resize and len(encoded) >= len(data):
+        return None
+    return encoded
+
+class ImageNormalizer:
+    """
+    Shrinks images to 'max_size' and re-encodes them as NORMALIZED_IMAGE_FORMAT on the
+    shared image process pool. 'variant' names these settings; cache entries made with
+    other settings (or without normalization) are not reused.
+    """
+
+    def __init__(self, executor, max_size):
+        self.executor = executor
+        self.max_size = tuple(max_size)
+        self.image_format = NORMALIZED_IMAGE_FORMAT.upper()
+        self.quality = NORMALIZED_IMAGE_QUALITY
+
+    @property
+    def variant(self):
+        return f"{self.max_size[0]}x{self.max_size[1]}-{self.image_format.lower()}-q{self.quality}"
+
+    def normalize(self, data, file_ext):
+        """
+        Returns (data, file_ext) of the normalized image, or the input unchanged when
+        normalize_image() keeps the original.
+        """
+        with METRICS.stage('normalize'):
+            encoded = self.executor.submit(
+                normalize_image, data, self.max_size, self.image_format, self.quality
+            ).result()
+        if encoded is None:
+            return data, file_ext
+        METRICS.count('images_normalized')
+        METRICS.count('normalized_bytes_saved', len(data) - len(encoded))
+        return encoded, IMAGE_FORMAT_EXTENSIONS.get(self.image_format, f'.{self.image_format.lower()}')
+
+def asset_cache_key(source, normalizer):
+    """
+    Cache key of an asset source: the URL or absolute path, plus the normalization
+    variant, so e.g. one image used as avatar and as logo keeps an entry per size.
+    """
+    return source if normalizer is None else f"{source}#{normalizer.variant}"
+
+def store_remote_asset(url, folder, fetcher, cache, normalizer=None):
+    key = asset_cache_key(url, normalizer)
+    entry = cache.get(key)
+    variant = normalizer.variant if normalizer else None
+    have_file = (entry is not None and entry.get('variant') == variant
+                 and os.path.exists(os.path.join(folder, entry['file'])))
+
+    if have_file and time.time() - entry.get('checked_at', 0) < ASSET_CACHE_MAX_AGE:
+        METRICS.count('cache_hits')
+        return entry['file']
+
+    validators = {}
+    if have_file:
+        if entry.get('etag'):
+            validators['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            validators['If-Modified-Since'] = entry['last_modified']
+
+    with METRICS.stage('download'):
+        asset = fetcher.fetch(url, folder, validators or None)
+        if asset is None: # 304 Not Modified
+            METRICS.count('not_modified')
+            cache.put(key, {**entry, 'checked_at': time.time()})
+            return entry['file']
+    METRICS.count('bytes_downloaded', asset.file.size)
+
+    file_ext = get_asset_extension(url, asset.content_type)
+    try:
+        if normalizer is not None:
+            data, file_ext = normalizer.normalize(asset.file.read(), file_ext)
+            new_filename, size = write_content_addressed(folder, data, file_ext), len(data)
+        else:
+            new_filename, size = asset.file.publish(file_ext), asset.file.size
+    finally:
+        asset.file.discard()
+    cache.put(key, {
+        'file': new_filename,
+        'size': size,
+        'etag': asset.etag,
+        'last_modified': asset.last_modified,
+        'checked_at': time.time(),
+        'variant': variant,
+    })
+    return new_filename
+
+def store_local_asset(path, folder, cache, normalizer=None):
+    key = asset_cache_key(os.path.abspath(path), normalizer)
+    stat = os.stat(path)
+    entry = cache.get(key)
+    variant = normalizer.variant if normalizer else None
+    if (entry is not None and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime
+            and entry.get('variant') == variant and os.path.exists(os.path.join(folder, entry['file']))):
+        METRICS.count('cache_hits')
+        return entry['file']
+
+    _, file_ext = os.path.splitext(path)
+    if normalizer is not None:
+        with METRICS.stage('copy'):
+            with open(path, 'rb') as f:
+                data = f.read()
+        METRICS.count('bytes_copied', len(data))
+        data, file_ext = normalizer.normalize(data, file_ext)
+        new_filename = write_content_addressed(folder, data, file_ext)
+        cache.put(key, {'file': new_filename, 'size': stat.st_size, 'stored_size': len(data),
+                        'mtime': stat.st_mtime, 'checked_at': time.time(), 'variant': variant})
+        return new_filename
+
+    with METRICS.stage('copy'):
+        new_filename = f"{hash_file(path)}{file_ext.lower()}"
+        new_full_path = os.path.join(folder, new_filename)
+        if not os.path.exists(new_full_path):
+            temp_path = f"{new_full_path}.{uuid.uuid4().hex}.tmp"
+            try:
+                method = copy_asset_file(path, temp_path)
+                os.replace(temp_path, new_full_path)
+                # A rename between two links to the same file does nothing, e.g. when another
+                # thread hardlinked the same source first; the temp name is then still there
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(temp_path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(temp_path)
+                raise
+            if method in ('reflink', 'hardlink'):
+                METRICS.count('files_linked')
+            else:
+                METRICS.count('bytes_copied', stat.st_size)
+
+    cache.put(key, {'file': new_filename, 'size': stat.st_size, 'mtime': stat.st_mtime, 'checked_at': time.time()})
+    return new_filename
+
+def store_asset(source, folder, fetcher, cache, normalizer=None):
+    """
+    Downloads (URL) or copies (local path) one avatar/logo into 'folder' and returns
+    the stored file name, named after a hash of the image bytes. Sources already in
+    'cache' with their file present are reused without downloading or copying.
+    With a 'normalizer' the image is resized/re-encoded before it is stored.
+    Returns None when a local source file does not exist.
+    """
+    if is_remote_source(source):
+        return store_remote_asset(source, folder, fetcher, cache, normalizer)
+
+    if os.path.exists(source):
+        return store_local_asset(source, folder, cache, normalizer)
+
+    return None
+
+def interleave_by_host(sources):
+    """
+    Orders sources round-robin by host, so the URLs of one slow host do not occupy
+    every download worker while they wait for its HOST_CONNECTIONS slots.
+    """
+    by_host = {}
+    for source in sources:
+        host = urlparse(source).netloc.lower() if is_remote_source(source) else ''
+        by_host.setdefault(host, []).append(source)
+    return [source for group in zip_longest(*by_host.values()) for source in group if source is not None]
+
+def fetch_assets(jobs, folder, label, fetcher, cache, executor=None, max_workers=None, normalizer=None):
+    """
+    Resolves a list of (owner_name, source) jobs into stored file names inside 'folder'.
+
+    Each distinct source is handled once. Local files are copied straight away; URLs
+    run on 'executor' (a download pool shared by the whole migration) or, without one,
+    on a temporary pool of up to 'max_workers' (default: DOWNLOAD_WORKERS) threads, all
+    using the thread-safe 'fetcher'. With a 'normalizer' local files go through the pool
+    too, so several images are resized at once. The returned list lines up with 'jobs'.
+    An asset that fails is reported and left as None, so its row is still migrated without it.
+    """
+    max_workers = max_workers or DOWNLOAD_WORKERS
+    results = [None] * len(jobs)
+
+    owners_by_source = {}
+    for index, (_, source) in enumerate(jobs):
+        if source:
+            owners_by_source.setdefault(source, []).append(index)
+
+    def resolve(source):
+        try:
+            stored_filename = store_asset(source, folder, fetcher, cache, normalizer)
+        except Exception as e:
+            METRICS.count('assets_failed')
+            for index in owners_by_source[source]:
+                print(f"  !!! CRITICAL ERROR processing {label} for {jobs[index][0]} ('{source}'). Error: {e}")
+            return
+        for index in owners_by_source[source]:
+            results[index] = stored_filename
+
+    remote_sources = []
+    for source in owners_by_source:
+        if normalizer is not None or is_remote_source(source):
+            remote_sources.append(source)
+        else:
+            resolve(source)
+
+    remote_sources = interleave_by_host(remote_sources)
+    if remote_sources and executor is not None:
+        list(executor.map(resolve, remote_sources))
+    elif remote_sources:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(remote_sources))) as page_executor:
+            list(page_executor.map(resolve, remote_sources))
+
+    # Keep finished downloads on disk so an interrupted run does not fetch them again
+    cache.save(min_interval=ASSET_CACHE_SAVE_INTERVAL)
+    return results
+
+# --- Duplicate Resolution ---
+
+def target_constraints(conn, table):
+    """
+    Returns (unique, required) for target 'table': the column tuples of its UNIQUE
+    constraints and primary key, and its NOT NULL columns. Read from the schema, so
+    they always match what the inserts will enforce.
+    """
+    unique = []
+    for _, index_name, is_unique, _, partial in conn.execute(f"PRAGMA index_list({table})"):
+        if is_unique and not partial:
+            columns = tuple(row[2] for row in conn.execute(f"PRAGMA index_info('{index_name}')"))
+            if columns not in unique:
+                unique.append(columns)
+    required = [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[3]]
+    return unique, required
+
+def legacy_stored_values(spec, old_conn, columns):
+    """
+    Returns (select list, params) of the values target 'columns' ([(column, numeric)])
+    would store, computed from the legacy table of 'spec' with its SQL expressions
+    (see TableSpec.legacy_expression() and sql_stored_value()).
+    """
+    legacy_columns = table_columns(old_conn, spec.source_table)
+    select_list, params = [], []
+    for column, numeric in columns:
+        expression, values = spec.legacy_expression(column, legacy_columns)
+        select_list.append(sql_stored_value(expression, numeric))
+        # sql_stored_value() repeats a numeric expression, parameter included
+        params += values * select_list[-1].count('?')
+    return ', '.join(select_list), params
+
+def resolve_duplicates(spec, old_conn, new_conn, policy=None, lock=None, rowids=None):
+    """
+    Pre-pass over the legacy table of 'spec' that finds the rows the target can never
+    accept, before any asset is fetched or row inserted: rows with NULL in a NOT NULL
+    column, and rows that repeat another row's value of a UNIQUE column (the key
+    included). Which of the conflicting rows is kept depends on 'policy' (default:
+    DUPLICATE_POLICY):
+
+      - 'first': the first in source order, as plain inserts would,
+      - 'last': the last in source order,
+      - 'newest': the one with the latest legacy 'updatedAt' (ties: the first).
+
+    Values are compared as the target stores them, using the spec's SQL expressions.
+    Asset and timestamp columns are not checked. The pass runs inside SQLite on a
+    temporary table of 'old_conn', so memory stays flat however large the table is;
+    'lock' is only held while the target's schema is read from 'new_conn'. Returns
+    {source rowid: reason} of the rows to skip; empty when the legacy table cannot be
+    read this way (the inserts then reject the rows).
+
+    With 'rowids' only those legacy rows are decided, together with every row they
+    collide with directly or through other rows, as nothing else can change their
+    outcome (see read_table_changes()).
+    """
+    policy = policy or DUPLICATE_POLICY
+    with lock or contextlib.nullcontext():
+        unique, required = target_constraints(new_conn, spec.name)
+        declared = {row[1]: row[2] for row in new_conn.execute(f'PRAGMA table_info({spec.name})')}
+    checked = set(spec.columns) - set(spec.assets) - set(spec.timestamp_columns)
+    unique = [columns for columns in unique if set(columns) <= checked]
+    required = [column for column in required if column in checked]
+    columns = sorted({column for columns in unique for column in columns} | set(required))
+    if not columns:
+        return {}
+
+    select_list, params = legacy_stored_values(spec, old_conn, [(column, column_is_numeric(declared[column])) for column in columns])
+    order = {'first': '_rowid_', 'last': '_rowid_ DESC', 'newest': 'updatedAt DESC, _rowid_'}[policy]
+    try:
+        if policy == 'newest':
+            old_conn.execute(f'SELECT updatedAt FROM {spec.source_table} LIMIT 0')
+    except sqlite3.OperationalError:
+        print(f"  -> WARNING: '{spec.source_table}' has no updatedAt column to pick the newest duplicate. Keeping the first.")
+        order = '_rowid_'
+
+    # One scan row per legacy row, numbered in policy order; 'kept' is 1, 0 (skipped) or NULL (undecided)
+    value_of = {column: f'v{index}' for index, column in enumerate(columns)}
+    value_list = ', '.join(value_of.values())
+    started_transaction = not old_conn.in_transaction # sync's snapshot transaction belongs to its caller
+    try:
+        old_conn.execute('DROP TABLE IF EXISTS temp.duplicate_scan')
+        old_conn.execute('DROP TABLE IF EXISTS temp.duplicate_rows')
+        old_conn.execute(f'''
+            CREATE TEMP TABLE duplicate_scan (
+                position INTEGER PRIMARY KEY,
+                source_rowid INTEGER NOT NULL,
+                kept INTEGER DEFAULT 1,
+                conflict INTEGER,
+                kept_by INTEGER,
+                reason TEXT,
+                {value_list}
+            )
+        ''')
+        try:
+            where = ''
+            if rowids is not None:
+                old_conn.execute('CREATE TEMP TABLE duplicate_rows (source_rowid INTEGER PRIMARY KEY)')
+                old_conn.executemany('INSERT OR IGNORE INTO temp.duplicate_rows VALUES (?)', ((rowid,) for rowid in rowids))
+                # Grows the set by the rows sharing a UNIQUE value with it until none is left
+                collides = ' OR '.join(
+                    f"({', '.join(value_of[column] for column in constraint)}) IN "
+                    f"(SELECT {', '.join(value_of[column] for column in constraint)} FROM legacy "
+                    f"WHERE source_rowid IN temp.duplicate_rows)"
+                    for constraint in unique
+                ) or '0'
+                grow = (f'WITH legacy (source_rowid, {value_list}) AS (SELECT _rowid_, {select_list} FROM {spec.source_table}) '
+                        f'INSERT OR IGNORE INTO temp.duplicate_rows SELECT source_rowid FROM legacy WHERE {collides}')
+                while old_conn.execute(grow, params).rowcount:
+                    pass
+                where = 'WHERE _rowid_ IN temp.duplicate_rows'
+            old_conn.execute(f'INSERT INTO temp.duplicate_scan (source_rowid, {value_list}) '
+                             f'SELECT _rowid_, {select_list} FROM {spec.source_table} {where} ORDER BY {order}', params)
+        except sqlite3.OperationalError:
+            return {}
+
+        for column in required:
+            old_conn.execute(f'UPDATE temp.duplicate_scan SET kept = 0, reason = ? WHERE {value_of[column]} IS NULL',
+                             (f"{column} is empty",))
+        matches = []
+        for number, constraint in enumerate(unique):
+            names = [value_of[column] for column in constraint]
+            old_conn.execute(f'CREATE INDEX temp.duplicate_scan_{number} ON duplicate_scan ({", ".join(names)}, position)')
+            # NULLs never collide in a UNIQUE constraint, and never compare equal here
+            matches.append(' AND '.join(f'other.{name} = duplicate_scan.{name}' for name in names))
+        # Rows sharing no value with another row are kept in any order; only the others
+        # are left undecided for the rounds below
+        for constraint in unique:
+            names = ', '.join(value_of[column] for column in constraint)
+            not_null = ' AND '.join(f'{value_of[column]} IS NOT NULL' for column in constraint)
+            old_conn.execute(f'UPDATE temp.duplicate_scan SET kept = NULL WHERE kept = 1 AND ({names}) IN '
+                             f'(SELECT {names} FROM temp.duplicate_scan WHERE kept IS NOT 0 AND {not_null} '
+                             f'GROUP BY {names} HAVING COUNT(*) > 1)')
+        old_conn.execute('CREATE INDEX temp.duplicate_scan_kept ON duplicate_scan (kept)')
+
+        # Decides the rows as inserting them one by one in policy order would, a whole set
+        # per round: a row is ready once no undecided earlier row collides with it (marked
+        # 2 first, as an UPDATE sees its own changes); ready rows colliding with a kept row
+        # are skipped, naming the first violated constraint, and the others are kept.
+        # Each round decides at least the first undecided row; real data needs a few.
+        # (Lookups of other rows go through the constraint indexes; '+kept' keeps SQLite
+        # from using the 'kept' index there instead)
+        no_earlier = ''.join(f' AND NOT EXISTS (SELECT 1 FROM temp.duplicate_scan AS other WHERE {match} '
+                             f'AND other.position < duplicate_scan.position AND (+other.kept IS NULL OR +other.kept = 2))'
+                             for match in matches)
+        while old_conn.execute('SELECT 1 FROM temp.duplicate_scan WHERE kept IS NULL LIMIT 1').fetchone():
+            old_conn.execute(f'UPDATE temp.duplicate_scan SET kept = 2 WHERE kept IS NULL{no_earlier}')
+            for number, match in enumerate(matches):
+                kept_row = f'FROM temp.duplicate_scan AS other WHERE +other.kept = 1 AND {match}'
+                old_conn.execute(f'UPDATE temp.duplicate_scan SET kept = 0, conflict = ?, '
+                                 f'kept_by = (SELECT other.source_rowid {kept_row}) '
+                                 f'WHERE kept = 2 AND EXISTS (SELECT 1 {kept_row})', (number,))
+            old_conn.execute('UPDATE temp.duplicate_scan SET kept = 1 WHERE kept = 2')
+
+        skipped = {}
+        for source_rowid, conflict, kept_by, reason, *values in old_conn.execute(
+                f'SELECT source_rowid, conflict, kept_by, reason, {value_list} FROM temp.duplicate_scan WHERE kept = 0'):
+            if conflict is not None:
+                constraint = unique[conflict]
+                value = tuple(values[columns.index(column)] for column in constraint)
+                shown = value[0] if len(value) == 1 else value
+                reason = f"duplicate {'/'.join(constraint)} '{shown}' (kept source row {kept_by})"
+            skipped[source_rowid] = reason
+        return skipped
+    finally:
+        old_conn.execute('DROP TABLE IF EXISTS temp.duplicate_scan')
+        old_conn.execute('DROP TABLE IF EXISTS temp.duplicate_rows')
+        # Never hold the legacy database's read lock past the pass
+        if started_transaction and old_conn.in_transaction:
+            old_conn.commit()
+
+# --- Table Migration Engine ---
+
+class MigrationCancelled(Exception):
+    """
+    Raised inside a table's migration when the run was stopped by another table.
+    """
+
+@dataclass
+class AssetColumn:
+    """
+    A legacy column holding an image URL or local path that is stored into 'folder'.
+    'label' names the asset in messages ('avatar', 'logo'); 'max_size' is the
+    (width, height) images are scaled down to when normalization is on.
+    """
+    source: str
+    folder: str
+    label: str
+    max_size: tuple = None
+
+@dataclass
+class TableSpec:
+    """
+    Declarative description of how one legacy table becomes one target table.
+
+    'columns' are the target columns in insert order. Each is filled from:
+      - 'assets[column]': the stored file name of an AssetColumn,
+      - 'timestamp_columns': the migration timestamp (get_timestamp()),
+      - 'mapping[column]': a source column name or a transform called with the old row dict,
+      - otherwise the source column of the same name.
+    Values of 'json_columns' are then passed through clean_extra_field().
+
+    'sql_mapping[column]' is the SQL expression over the legacy columns that does the
+    same as 'mapping[column]', used when the table is migrated inside SQLite (see
+    run_table_sql()) and when it is verified (see verify_migration()). 'key' is the
+    target's primary key column (default: the first).
+    'describe(row)' names a row (old or new, as a dict) in messages.
+    """
+    name: str
+    noun: str
+    columns: tuple
+    describe: Callable
+    source_table: str = None
+    source_columns: str = '*'
+    mapping: dict = field(default_factory=dict)
+    sql_mapping: dict = field(default_factory=dict)
+    json_columns: tuple = ()
+    assets: dict = field(default_factory=dict)
+    timestamp_columns: tuple = ('createdAt', 'updatedAt')
+    key: str = None
+    missing_message: str = "FATAL ERROR: Error reading '{table}' table from old DB. Does it exist? Error: {error}"
+
+    def __post_init__(self):
+        self.source_table = self.source_table or self.name
+        self.key = self.key or self.columns[0]
+
+    @property
+    def insert_sql(self):
+        placeholders = ', '.join('?' for _ in self.columns)
+        return f"INSERT INTO {self.name} ({', '.join(self.columns)}) VALUES ({placeholders})"
+
+    def value_of(self, column, row):
+        """
+        Returns the value of target 'column' for the legacy row dict 'row'. Only
+        meaningful for columns that are neither assets nor timestamps.
+        """
+        source = self.mapping.get(column, column)
+        value = source(row) if callable(source) else row.get(source)
+        return clean_extra_field(value) if column in self.json_columns else value
+
+    def sql_expression(self, column):
+        """
+        Returns the SQL that fills target 'column' from a legacy row; timestamps are a '?'
+        parameter. Only meaningful for columns that are not assets.
+        """
+        if column in self.timestamp_columns:
+            return '?'
+        expression = self.sql_mapping.get(column, column)
+        return sql_clean_json(expression) if column in self.json_columns else expression
+
+    def legacy_expression(self, column, legacy_columns):
+        """
+        Returns (sql, params) like sql_expression(), for a legacy table that has only
+        'legacy_columns' (lower case). The pipeline reads rows with row.get(), so a source
+        column the table lacks gets the value value_of() gives a row without it, e.g.
+        'N/A' for a missing username; here that value is a '?' parameter.
+        """
+        source = self.mapping.get(column, column)
+        if column not in self.sql_mapping and column not in self.timestamp_columns:
+            name = source if isinstance(source, str) else column
+            if name.lower() not in legacy_columns:
+                return '?', [self.value_of(column, {})]
+        return self.sql_expression(column), []
+
+class MigrationContext:
+    """
+    Services shared by every table of one migration run: the asset fetcher and cache,
+    the resume checkpoint and one download pool, so network concurrency stays bounded
+    by DOWNLOAD_WORKERS no matter how many pipeline workers are busy.
+
+    Remote assets that cannot be fetched are recorded in 'failed_assets' for a later
+    refetch_failed_assets() pass. 'duplicate_policy' picks the winner among legacy rows
+    that collide on a UNIQUE column (see resolve_duplicates()).
+
+    Tables migrated concurrently share the target connection: 'write_lock' serializes
+    its transactions, and 'cancelled' tells running tables to stop when another failed.
+
+    With 'normalize_images' (and Pillow installed) an image process pool of IMAGE_WORKERS
+    processes is started for resizing/re-encoding. With more than one 'shard_workers'
+    large pipeline tables are split across a pool of that many processes, which work
+    with the files of 'paths' (see run_table_shards()).
+    """
+
+    def __init__(self, fetcher=None, cache=None, checkpoint=None, download_workers=None, normalize_images=False,
+                 failed_assets=None, duplicate_policy=None, paths=None, shard_workers=None):
+        self.fetcher = fetcher
+        self.paths = paths
+        self.normalize_images = normalize_images
+        self.duplicate_policy = duplicate_policy or DUPLICATE_POLICY
+        self.cache = cache or AssetCache()
+        self.checkpoint = checkpoint
+        self.failed_assets = failed_assets if failed_assets is not None else FailedAssetLog()
+        self.write_lock = threading.RLock()
+        self.cancelled = threading.Event()
+        self.download_executor = ThreadPoolExecutor(
+            max_workers=download_workers or DOWNLOAD_WORKERS, thread_name_prefix='download'
+        )
+
+        self.image_executor = None
+        if normalize_images and Image is None:
+            print("  -> WARNING: Pillow is not installed. Images are stored without normalization.")
+        elif normalize_images:
+            self.image_executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+
+        self.shard_workers = shard_workers or SHARD_WORKERS
+        self.shard_executor = None
+        if paths is not None and self.shard_workers > 1:
+            self.shard_executor = ProcessPoolExecutor(max_workers=self.shard_workers)
+
+    def normalizer_for(self, asset):
+        """
+        Returns the ImageNormalizer for an AssetColumn, or None when images are stored as-is.
+        """
+        if self.image_executor is None or not asset.max_size:
+            return None
+        return ImageNormalizer(self.image_executor, asset.max_size)
+
+    def close(self):
+        self.download_executor.shutdown()
+        if self.image_executor is not None:
+            self.image_executor.shutdown()
+        if self.shard_executor is not None:
+            self.shard_executor.shutdown(cancel_futures=True)
+        if self.fetcher is not None:
+            self.fetcher.close()
+        self.cache.save()
+        self.failed_assets.save()
+
+def transform_page(spec, page, context):
+    """
+    Turns one page of legacy row dicts into (source_rowid, values) pairs for 'spec',
+    downloading/copying the page's assets concurrently first. URLs that fail are
+    recorded in 'context.failed_assets'.
+    """
+    current_time = get_timestamp() # Uses new fixed timestamp format
+
+    stored_assets = {}
+    for column, asset in spec.assets.items():
+        jobs = [(spec.describe(row), row.get(asset.source)) for row in page]
+        stored_assets[column] = fetch_assets(
+            jobs, asset.folder, asset.label, context.fetcher, context.cache, context.download_executor,
+            normalizer=context.normalizer_for(asset),
+        )
+        for row, stored_filename in zip(page, stored_assets[column]):
+            source = row.get(asset.source)
+            if stored_filename is None and source and is_remote_source(source):
+                context.failed_assets.record(spec.name, column, spec.value_of(spec.key, row), source)
+            elif stored_filename is not None:
+                context.failed_assets.resolve(spec.name, column, spec.value_of(spec.key, row))
+
+    rows = []
+    with METRICS.stage('clean'):
+        for index, old_row in enumerate(page):
+            values = []
+            for column in spec.columns:
+                if column in stored_assets:
+                    values.append(stored_assets[column][index])
+                elif column in spec.timestamp_columns:
+                    values.append(current_time)
+                else:
+                    values.append(spec.value_of(column, old_row))
+            rows.append((old_row['_rowid_'], tuple(values)))
+    return rows
+
+def run_table_pipeline(spec, old_conn, new_conn, context, after_rowid=None, on_batch=None, page_size=None, workers=None,
+                       skip_rowids=None, until_rowid=None):
+    """
+    Migrates one table as three overlapping stages connected by queues:
+
+        reader thread -> PIPELINE_WORKERS transform threads -> writer (calling thread)
+
+    The reader pages through the legacy table, the transform workers clean rows and
+    fetch assets, and the single writer inserts pages in source order (so checkpoints
+    stay exact). At most PIPELINE_MAX_PAGES pages are in flight between reader and
+    writer. Rows whose source rowid is in 'skip_rowids' are dropped by the reader, which
+    stops after 'until_rowid' if given.
+    'old_conn' must allow use from another thread (check_same_thread=False).
+    Raises MigrationCancelled once 'context.cancelled' is set. Returns the number of
+    inserted rows.
+    """
+    workers = workers or PIPELINE_WORKERS
+    page_queue = queue.Queue()
+    result_queue = queue.Queue()
+    pages_in_flight = threading.Semaphore(PIPELINE_MAX_PAGES)
+    stop = threading.Event()
+
+    def reader():
+        try:
+            pages = read_pages(old_conn, spec.source_table, spec.source_columns, page_size, after_rowid, until_rowid)
+            if skip_rowids:
+                pages = ([row for row in page if row['_rowid_'] not in skip_rowids] for page in pages)
+            for sequence, page in enumerate(page for page in pages if page):
+                while not pages_in_flight.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                page_queue.put((sequence, page))
+        except BaseException as e:
+            result_queue.put(('error', e))
+        finally:
+            for _ in range(workers):
+                page_queue.put(None)
+
+    def transformer():
+        while True:
+            item = page_queue.get()
+            if item is None:
+                result_queue.put(('done', None))
+                return
+            if stop.is_set():
+                continue
+            sequence, page = item
+            try:
+                result_queue.put(('page', (sequence, transform_page(spec, page, context))))
+            except BaseException as e:
+                result_queue.put(('error', e))
+
+    def ordered_rows():
+        waiting_pages = {}
+        next_sequence = 0
+        finished_workers = 0
+        while finished_workers < workers:
+            if context.cancelled.is_set():
+                raise MigrationCancelled(spec.name)
+            try:
+                kind, payload = result_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue # keeps the writer responsive to Ctrl-C and cancellation
+            if kind == 'error':
+                raise payload
+            if kind == 'done':
+                finished_workers += 1
+                continue
+            sequence, rows = payload
+            waiting_pages[sequence] = rows
+            while next_sequence in waiting_pages:
+                yield from waiting_pages.pop(next_sequence)
+                next_sequence += 1
+                pages_in_flight.release()
+
+    threads = [threading.Thread(target=reader, name=f'{spec.name}-reader', daemon=True)]
+    threads += [
+        threading.Thread(target=transformer, name=f'{spec.name}-transform-{n}', daemon=True)
+        for n in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        return insert_rows(
+            new_conn,
+            spec.insert_sql,
+            ordered_rows(),
+            describe=lambda values: spec.describe(dict(zip(spec.columns, values))),
+            on_batch=on_batch,
+            lock=context.write_lock,
+        )
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+def can_run_in_sql(spec, old_conn, new_conn):
+    """
+    True when 'spec' can be migrated by run_table_sql(): SQL_NATIVE_TABLES is on, the
+    table has no assets, the legacy table has rowids and SQLite has the JSON functions.
+    """
+    if not SQL_NATIVE_TABLES or spec.assets or not has_rowids(old_conn, spec.source_table):
+        return False
+    try:
+        new_conn.execute("SELECT json_valid('{}')")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+def report_sql_skipped_rows(spec, conn, source_sql, params):
+    """
+    Names the legacy rows INSERT OR IGNORE dropped: every extra row of a duplicated key,
+    and every key that did not make it into the target at all (constraint failures).
+    'source_sql' selects the migrated legacy rows.
+    """
+    key = spec.sql_expression(spec.key)
+    duplicates = conn.execute(
+        f"SELECT {key}, COUNT(*) - 1 FROM {source_sql} GROUP BY 1 HAVING COUNT(*) > 1", params
+    )
+    for key_value, extra_rows in duplicates:
+        print(f"  !!! ERROR inserting {spec.describe({spec.key: key_value})}: Duplicate key. {extra_rows} record(s) skipped.")
+
+    rejected = conn.execute(
+        f"SELECT source_key FROM (SELECT {key} AS source_key FROM {source_sql}) "
+        f"WHERE NOT EXISTS (SELECT 1 FROM main.{spec.name} AS target WHERE target.{spec.key} = source_key)",
+        params,
+    )
+    for (key_value,) in rejected:
+        print(f"  !!! ERROR inserting {spec.describe({spec.key: key_value})}: Integrity failed. Record skipped.")
+
+def run_table_sql(spec, old_conn, new_conn, after_rowid=None, on_batch=None, lock=None, skip_rowids=None):
+    """
+    Migrates an asset-free table without moving its rows through Python: the legacy
+    file is ATTACHed to 'new_conn' and copied with one INSERT OR IGNORE ... SELECT in
+    source order, cleaned by the spec's SQL expressions (json_valid(), CASE). Rows that
+    break a constraint are skipped by SQLite and reported by key afterwards. Source
+    rowids in 'skip_rowids' are left out. 'lock' is held from ATTACH to DETACH.
+    Returns the number of inserted rows.
+    """
+    legacy_path = database_path(old_conn)
+    conditions, params = [], []
+    if after_rowid is not None:
+        conditions.append('_rowid_ > ?')
+        params.append(after_rowid)
+    if skip_rowids:
+        conditions.append('_rowid_ NOT IN (SELECT source_rowid FROM temp.migration_skipped_rows)')
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    source_sql = f"legacy.{spec.source_table} {where}"
+    select_list = ', '.join(spec.sql_expression(column) for column in spec.columns)
+    timestamps = [get_timestamp()] * sum(column in spec.timestamp_columns for column in spec.columns)
+    corrupt_sql = ' + '.join(
+        f"COALESCE(SUM({sql_is_corrupt_json(spec.sql_mapping.get(column, column))}), 0)" for column in spec.json_columns
+    ) or '0'
+
+    with lock or contextlib.nullcontext():
+        new_conn.execute('CREATE TEMP TABLE IF NOT EXISTS migration_skipped_rows (source_rowid INTEGER PRIMARY KEY)')
+        new_conn.execute('DELETE FROM temp.migration_skipped_rows')
+        new_conn.executemany('INSERT INTO temp.migration_skipped_rows VALUES (?)', ((rowid,) for rowid in skip_rowids or ()))
+        new_conn.commit() # ATTACH is not allowed inside a transaction
+        new_conn.execute('ATTACH DATABASE ? AS legacy', (legacy_path,))
+        try:
+            with METRICS.stage('read'):
+                total, last_rowid, corrupt = new_conn.execute(
+                    f"SELECT COUNT(*), MAX(_rowid_), {corrupt_sql} FROM {source_sql}", params
+                ).fetchone()
+
+            new_conn.execute('BEGIN')
+            try:
+                with METRICS.stage('insert'):
+                    inserted = new_conn.execute(
+                        f"INSERT OR IGNORE INTO main.{spec.name} ({', '.join(spec.columns)}) "
+                        f"SELECT {select_list} FROM {source_sql} ORDER BY _rowid_",
+                        timestamps + params,
+                    ).rowcount
+                    if on_batch and last_rowid is not None:
+                        on_batch(last_rowid)
+                with METRICS.stage('commit'):
+                    new_conn.commit()
+            except BaseException:
+                if new_conn.in_transaction:
+                    new_conn.rollback()
+                raise
+
+            if inserted < total:
+                report_sql_skipped_rows(spec, new_conn, source_sql, params)
+        finally:
+            new_conn.execute('DETACH DATABASE legacy')
+
+    METRICS.count('rows_read', total)
+    METRICS.count('rows_written', inserted)
+    METRICS.count('skipped_rows', total - inserted)
+    METRICS.count('corrupt_values', corrupt)
+    METRICS.advance(total)
+    return inserted
+
+def report_duplicates(spec, skip_rowids, after_rowid, policy):
+    """
+    Prints and counts the rows resolve_duplicates() skipped that this run would have
+    read (those after 'after_rowid' when resuming) and returns their number.
+    """
+    skipped = [(rowid, reason) for rowid, reason in sorted(skip_rowids.items())
+               if after_rowid is None or rowid > after_rowid]
+    if not skipped:
+        return 0
+    METRICS.count('skipped_rows', len(skipped))
+    # One print, so the block stays together while other tables print too
+    lines = [f"  -> Skipping {len(skipped)} {spec.noun} records the target cannot accept ('{policy}' wins among duplicates):"]
+    lines += [f"      source row {rowid}: {reason}" for rowid, reason in skipped[:DUPLICATE_EXAMPLES]]
+    if len(skipped) > DUPLICATE_EXAMPLES:
+        lines.append(f"      ... and {len(skipped) - DUPLICATE_EXAMPLES} more.")
+    print('\n'.join(lines))
+    return len(skipped)
+
+def migrate_table(spec, old_conn, new_conn, context, page_size=None):
+    """
+    Migrates the legacy table described by 'spec' and returns the number of rows written.
+    Asset-free tables run inside SQLite (run_table_sql()) when possible, large tables in
+    worker processes when sharding is on (run_table_shards()), everything else through
+    the Python pipeline. Rows that can never be inserted are found up front by
+    resolve_duplicates() and skipped. A missing or unreadable source table is reported
+    and counts as 0 rows. Every use of 'new_conn' holds 'context.write_lock', so tables can
+    run on several threads at once.
+    """
+    for asset in spec.assets.values():
+        os.makedirs(asset.folder, exist_ok=True)
+
+    try:
+        row_count = count_rows(old_conn, spec.source_table)
+        old_conn.execute(f'SELECT {spec.source_columns} FROM {spec.source_table} LIMIT 0')
+    except sqlite3.OperationalError as e:
+        print(spec.missing_message.format(table=spec.source_table, error=e))
+        return 0
+
+    print(f"\nFound {row_count} {spec.noun} records to migrate.")
+    with context.write_lock:
+        after_rowid, on_batch = table_progress(context.checkpoint, spec.name)
+        # Rows an interrupted run already handled count as done for the progress line
+        done = count_rows(new_conn, spec.name) if after_rowid is not None else 0
+        in_sql = can_run_in_sql(spec, old_conn, new_conn)
+    skip_rowids = resolve_duplicates(spec, old_conn, new_conn, context.duplicate_policy, lock=context.write_lock)
+    skipped = report_duplicates(spec, skip_rowids, after_rowid, context.duplicate_policy)
+    METRICS.start_table(spec.name, row_count, done)
+    METRICS.advance(skipped)
+    if in_sql:
+        written = run_table_sql(spec, old_conn, new_conn, after_rowid, on_batch, context.write_lock, skip_rowids)
+    elif context.shard_executor is not None and row_count - done >= SHARD_MIN_ROWS and has_rowids(old_conn, spec.source_table):
+        written = run_table_shards(spec, old_conn, new_conn, context, after_rowid, on_batch, skip_rowids)
+    else:
+        written = run_table_pipeline(spec, old_conn, new_conn, context, after_rowid, on_batch, page_size,
+                                     skip_rowids=skip_rowids)
+    METRICS.finish_table(written)
+    return written
+
+# --- Sharded Tables ---
+
+@dataclass
+class TableShard:
+    """
+    One rowid range of a legacy table: the rows after 'after_rowid' up to and including
+    'last_rowid', of which 'rows' exist. run_shard() migrates it in a worker process into
+    'paths.new_db', its own shard database, using the shard's asset cache and failed
+    asset list in 'paths'. Rows in 'skip_rowids' lost a duplicate-key conflict.
+    """
+    table: str
+    index: int
+    after_rowid: int
+    last_rowid: int
+    rows: int
+    paths: MigrationPaths
+    skip_rowids: set
+    normalize_images: bool
+
+def shard_ranges(conn, table, after_rowid, shard_rows):
+    """
+    Splits the rows of 'table' after 'after_rowid' into consecutive rowid ranges of
+    'shard_rows' rows. Returns [(after_rowid, last_rowid, rows), ...].
+    """
+    ranges = []
+    lower = -(2 ** 63) if after_rowid is None else after_rowid
+    while True:
+        row = conn.execute(
+            f'SELECT _rowid_ FROM {table} WHERE _rowid_ > ? ORDER BY _rowid_ LIMIT 1 OFFSET ?', (lower, shard_rows - 1)
+        ).fetchone()
+        if row is None:
+            break
+        ranges.append((lower, row[0], shard_rows))
+        lower = row[0]
+    last_rowid, rows = conn.execute(f'SELECT MAX(_rowid_), COUNT(*) FROM {table} WHERE _rowid_ > ?', (lower,)).fetchone()
+    if rows:
+        ranges.append((lower, last_rowid, rows))
+    return ranges
+
+def run_shard(shard):
+    """
+    Process pool entry point: migrates one TableShard with the regular pipeline into its
+    shard database. Returns the rows written, the console output (printed by the
+    coordinator when it merges the shard) and the shard's metrics report.
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        METRICS.reset()
+        spec = next(spec for spec in build_table_specs(shard.paths) if spec.name == shard.table)
+        old_conn = sqlite3.connect(shard.paths.old_db, check_same_thread=False)
+        new_conn = sqlite3.connect(shard.paths.new_db, check_same_thread=False)
+        apply_bulk_load_pragmas(new_conn)
+        create_new_db_schema(new_conn, with_triggers=False)
+        context = MigrationContext(AssetFetcher(), AssetCache(shard.paths.asset_cache),
+                                   normalize_images=shard.normalize_images,
+                                   failed_assets=FailedAssetLog(shard.paths.failed_assets, keep=False))
+        try:
+            written = run_table_pipeline(spec, old_conn, new_conn, context, shard.after_rowid,
+                                         skip_rowids=shard.skip_rowids, until_rowid=shard.last_rowid)
+        finally:
+            context.close()
+            old_conn.close()
+            new_conn.close()
+    return {'written': written, 'output': output.getvalue(), 'report': METRICS.report(True)}
+
+def merge_shard(spec, new_conn, shard, on_batch=None):
+    """
+    Copies a finished shard database into the target with ATTACH + INSERT ... SELECT, in
+    one transaction that also checkpoints the shard's last rowid. Cross-shard duplicates
+    were already resolved for the whole table by resolve_duplicates(), so a shard row
+    whose UNIQUE value the target already holds is unexpected: it is reported and left
+    out. The caller holds the write lock. Returns the number of merged rows.
+    """
+    columns = ', '.join(spec.columns)
+    unique, _ = target_constraints(new_conn, spec.name)
+    taken = ' OR '.join(
+        f"EXISTS (SELECT 1 FROM main.{spec.name} AS target WHERE "
+        + ' AND '.join(f"target.{column} = shard_row.{column}" for column in constraint) + ")"
+        for constraint in unique
+    )
+
+    new_conn.commit() # ATTACH is not allowed inside a transaction
+    new_conn.execute('ATTACH DATABASE ? AS shard', (shard.paths.new_db,))
+    try:
+        if taken:
+            for row in new_conn.execute(f"SELECT {columns} FROM shard.{spec.name} AS shard_row WHERE {taken}"):
+                print(f"  !!! ERROR inserting {spec.describe(dict(zip(spec.columns, row)))}: Duplicate key across shards. Record skipped.")
+        new_conn.execute('BEGIN')
+        try:
+            with METRICS.stage('insert'):
+                total = count_rows(new_conn, f'shard.{spec.name}')
+                merged = new_conn.execute(
+                    f"INSERT OR IGNORE INTO main.{spec.name} ({columns}) "
+                    f"SELECT {columns} FROM shard.{spec.name} ORDER BY _rowid_"
+                ).rowcount
+                if on_batch:
+                    on_batch(shard.last_rowid)
+            with METRICS.stage('commit'):
+                new_conn.commit()
+        except BaseException:
+            if new_conn.in_transaction:
+                new_conn.rollback()
+            raise
+    finally:
+        new_conn.execute('DETACH DATABASE shard')
+
+    METRICS.count('rows_written', merged - total) # the shard already counted them as written
+    METRICS.count('skipped_rows', total - merged)
+    return merged
+
+def run_table_shards(spec, old_conn, new_conn, context, after_rowid=None, on_batch=None, skip_rowids=None):
+    """
+    Migrates a large pipeline table in parallel: its rows after 'after_rowid' are split
+    into rowid ranges of SHARD_ROWS rows, each migrated by run_shard() in
+    'context.shard_executor' into a shard database in a temporary folder next to the
+    target. Assets go straight into the shared upload folders, which is safe across
+    processes as stored files are named after their content and renamed into place.
+
+    Finished shards are merged in rowid order by merge_shard(), so the checkpoint stays
+    exact and an interrupted run resumes after the last merged shard. Every shard starts
+    from a copy of the asset cache; their cache entries and failed assets are merged
+    back. Returns the number of inserted rows.
+    """
+    paths = context.paths
+    context.cache.save()
+    folder = tempfile.mkdtemp(prefix='.migrator-shards-', dir=os.path.dirname(os.path.abspath(paths.new_db)))
+    shards = []
+    for index, (lower, upper, rows) in enumerate(shard_ranges(old_conn, spec.source_table, after_rowid, SHARD_ROWS)):
+        name = os.path.join(folder, f'{spec.name}-{index}')
+        cache_path = f'{name}.cache.json'
+        if os.path.exists(paths.asset_cache):
+            shutil.copyfile(paths.asset_cache, cache_path)
+        shard_paths = MigrationPaths(
+            paths.old_db, f'{name}.db', paths.player_avatar_folder, paths.teams_avatar_folder, cache_path,
+            f'{name}.report.json', f'{name}.profile', f'{name}.failed.json',
+        )
+        shard_skips = {rowid for rowid in skip_rowids or () if lower < rowid <= upper}
+        shards.append(TableShard(spec.name, index, lower, upper, rows, shard_paths, shard_skips, context.normalize_images))
+    print(f"  -> Migrating '{spec.name}' as {len(shards)} shards in {context.shard_workers} processes.")
+
+    futures = {context.shard_executor.submit(run_shard, shard): shard for shard in shards}
+    finished = {}
+    inserted = 0
+    try:
+        pending = set(futures)
+        while shards:
+            if context.cancelled.is_set():
+                raise MigrationCancelled(spec.name)
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished[futures[future].index] = future.result()
+
+            # Merge in rowid order, so the checkpoint never skips an unmerged shard
+            while shards and shards[0].index in finished:
+                shard = shards.pop(0)
+                result = finished[shard.index]
+                sys.stdout.write(result['output'])
+                METRICS.absorb(result['report'])
+                with context.write_lock:
+                    inserted += merge_shard(spec, new_conn, shard, on_batch)
+                if os.path.exists(shard.paths.asset_cache):
+                    context.cache.merge(shard.paths.asset_cache)
+                for entry in FailedAssetLog(shard.paths.failed_assets).entries():
+                    context.failed_assets.record(entry['table'], entry['column'], entry['key'], entry['source'])
+                METRICS.advance(shard.rows - len(shard.skip_rowids))
+    finally:
+        for future in futures:
+            future.cancel()
+        shutil.rmtree(folder, ignore_errors=True)
+    return inserted
+
+# --- Table Specs ---
+
+def build_table_specs(paths=None):
+    """
+    Returns the TableSpec of every migrated table, in migration order, storing assets
+    in the folders of 'paths' (default: MigrationPaths.from_config()).
+    """
+    paths = paths or MigrationPaths.from_config()
+    return [
+        # Player Migration (Includes concurrent avatar download)
+        TableSpec(
+            name='players',
+            noun='player',
+            columns=('_id', 'firstName', 'lastName', 'username', 'avatar', 'country', 'steamid', 'team', 'extra', 'createdAt', 'updatedAt'),
+            mapping={
+                'username': lambda row: row.get('username', 'N/A'),
+            },
+            json_columns=('extra',),
+            assets={'avatar': AssetColumn('avatar', paths.player_avatar_folder, 'avatar', PLAYER_AVATAR_SIZE)},
+            describe=lambda row: row.get('username', 'N/A'),
+        ),
+        # Team Migration (Includes concurrent logo download)
+        TableSpec(
+            name='teams',
+            noun='team',
+            columns=('_id', 'name', 'country', 'shortName', 'logo', 'extra', 'createdAt', 'updatedAt'),
+            mapping={
+                'name': lambda row: row.get('name', 'N/A'),
+            },
+            json_columns=('extra',),
+            assets={'logo': AssetColumn('logo', paths.teams_avatar_folder, 'logo', TEAM_LOGO_SIZE)},
+            describe=lambda row: row.get('name', 'N/A'),
+        ),
+        # Coach Migration (Simplified)
+        TableSpec(
+            name='coaches',
+            noun='coach',
+            columns=('steamid', 'name', 'team', 'createdAt', 'updatedAt'),
+            source_columns='steamid',
+            mapping={
+                'name': lambda row: None,
+                'team': lambda row: None,
+            },
+            sql_mapping={
+                'name': 'NULL',
+                'team': 'NULL',
+            },
+            describe=lambda row: f"coach {row.get('steamid')}",
+            missing_message="\nINFO: '{table}' table not found in old DB. Assuming no coach data to migrate. Error: {error}",
+        ),
+        # Match Migration (Corrected)
+        TableSpec(
+            name='matches',
+            noun='match',
+            columns=('id', 'current', 'left_id', 'left_wins', 'right_id', 'right_wins', 'matchType', 'vetos', 'createdAt', 'updatedAt'),
+            # Use the confirmed column names: id, current, left_id, left_wins, right_id, right_wins, matchType, vetos
+            source_columns='id, current, left_id, left_wins, right_id, right_wins, matchType, vetos',
+            mapping={
+                # Ensure 'current' is treated as an integer (0 or 1)
+                'current': lambda row: 1 if row.get('current') in (1, 'true', 'True') else 0,
+                'left_wins': lambda row: row.get('left_wins', 0),
+                'right_wins': lambda row: row.get('right_wins', 0),
+                'matchType': lambda row: row.get('matchType', 'Legacy'),
+            },
+            sql_mapping={
+                # Typed like Python's 'in': the text '1' is not 1, whatever the column's affinity
+                'current': "CASE WHEN (typeof(current) IN ('integer', 'real') AND current = 1) "
+                           "OR (typeof(current) = 'text' AND current IN ('true', 'True')) THEN 1 ELSE 0 END",
+            },
+            json_columns=('vetos',),
+            describe=lambda row: f"match {row.get('id')}",
+        ),
+    ]
+
+# --- Table Scheduler ---
+
+def run_table_schedule(specs, run_table, cancelled, workers=None):
+    """
+    Calls run_table(spec) for every spec on up to 'workers' (default: TABLE_WORKERS)
+    threads and returns {table: result}. Tables are independent: foreign keys are
+    not enforced while loading (see apply_bulk_load_pragmas()).
+
+    The first failure (or Ctrl-C) sets the 'cancelled' event, waits for the running
+    tables to stop and is re-raised; tables that had not started are left untouched.
+    """
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=workers or TABLE_WORKERS, thread_name_prefix='table') as executor:
+        running = {executor.submit(run_table, spec): spec.name for spec in specs}
+        try:
+            while running:
+                # Short timeout keeps the main thread responsive to Ctrl-C
+                done, _ = wait(running, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        except BaseException:
+            cancelled.set()
+            for future in running:
+                future.cancel() # only succeeds for tables still queued
+            raise
+    return results
+
+# --- Main Migration Runner ---
+
+def run_migration(resume=False, profile=False, report_path=None, normalize_images=None, paths=None, verify=False,
+                  duplicate_policy=None, build=None, shards=None):
+    """
+    Migrates 'paths.old_db' into 'paths.new_db' (default: MigrationPaths.from_config())
+    and returns the metrics report as a dict, with 'completed' and 'error' set.
+
+    With 'resume' an interrupted run is continued. The report is also written to
+    'report_path' (default: 'paths.report'); with 'profile' every stage is profiled into
+    'paths.profile_folder'. 'normalize_images' overrides NORMALIZE_IMAGES. With 'verify'
+    a completed migration is checked by verify_migration() and the result stored under
+    'verification'. 'duplicate_policy' overrides DUPLICATE_POLICY (see resolve_duplicates()).
+    'build' overrides TARGET_BUILD: a staged build leaves an existing target untouched
+    until the new one replaces it, and keeps an interrupted run in 'paths.partial_db'
+    ('partial' writes that file as it goes, 'memory'/'temp' save it on a clean exit).
+    'shards' overrides SHARD_WORKERS (see run_table_shards()). Never asks for input, so it can be used as a library call.
+    """
+    paths = paths or MigrationPaths.from_config()
+    duplicate_policy = duplicate_policy or DUPLICATE_POLICY
+    build = build or TARGET_BUILD
+    staged = build != 'direct'
+    # Builds written to disk as they go are what --resume continues after a crash
+    durable = build in ('partial', 'direct')
+    METRICS.reset(profile)
+
+    # 1. Setup connections
+    if not os.path.exists(paths.old_db):
+        print(f"FATAL ERROR: Old database file not found at {paths.old_db}")
+        return {'completed': False, 'error': f"Old database file not found at {paths.old_db}"}
+
+    try:
+        old_conn = sqlite3.connect(paths.old_db)
+    except Exception as e:
+        print(f"FATAL ERROR: Could not open old database file. Error: {e}")
+        return {'completed': False, 'error': f"Could not open old database file. Error: {e}"}
+
+    target_name = os.path.basename(paths.new_db)
+    target_folder = os.path.dirname(os.path.abspath(paths.new_db))
+    os.makedirs(target_folder, exist_ok=True)
+
+    # Only continue into an existing target if an interrupted run left its checkpoint behind
+    resuming = False
+    resume_path = paths.partial_db if staged else paths.new_db
+    if resume and os.path.exists(resume_path):
+        probe_conn = sqlite3.connect(resume_path)
+        resuming = MigrationCheckpoint.exists_in(probe_conn)
+        probe_conn.close()
+        if resuming:
+            print(f"Resuming interrupted migration into: {target_name}")
+        else:
+            print(f"No interrupted migration found in {target_name}. Starting from scratch.")
+        
+    # Delete old target file if it exists (a staged build replaces it only once complete)
+    stale_path = paths.partial_db if staged else paths.new_db
+    if os.path.exists(stale_path) and not resuming:
+        try:
+            remove_database_file(stale_path)
+            print(f"Deleted old target file: {os.path.basename(stale_path)}")
+        except Exception as e:
+            print(f"FATAL ERROR: Could not delete old {target_name}. Please close any program using it and try again. Error: {e}")
+            old_conn.close()
+            return {'completed': False, 'error': f"Could not delete old {target_name}. Error: {e}"}
+    # A rebuilt target starts a new sync history (see sync_migration())
+    if os.path.exists(paths.sync_index) and not resuming:
+        remove_database_file(paths.sync_index)
+
+    try:
+        # The one writer connection, shared by the table threads under context.write_lock
+        if build == 'partial':
+            new_conn = sqlite3.connect(paths.partial_db, check_same_thread=False)
+            print(f"Building {target_name} in {os.path.basename(paths.partial_db)}.")
+        elif staged:
+            new_conn = open_build_database(build, resume_from=paths.partial_db if resuming else None)
+            print(f"Building {target_name} in a private {'in-memory' if build == 'memory' else 'temporary'} database.")
+        else:
+            new_conn = sqlite3.connect(paths.new_db, check_same_thread=False)
+        if BULK_LOAD:
+            apply_bulk_load_pragmas(new_conn, durable=durable)
+        create_new_db_schema(new_conn, with_triggers=not BULK_LOAD)
+        checkpoint = MigrationCheckpoint(new_conn)
+    except Exception as e:
+        print(f"FATAL ERROR: Could not create new database schema. Error: {e}")
+        old_conn.close()
+        return {'completed': False, 'error': f"Could not create new database schema. Error: {e}"}
+
+    # 2. Run migrations
+    if profile:
+        tracemalloc.start()
+    # Plain HTTP first; Chromium is only started if some URL refuses it
+    if normalize_images is None:
+        normalize_images = NORMALIZE_IMAGES
+    # A rebuilt target starts a new failed asset list; a resumed one adds to it
+    failed_assets = FailedAssetLog(paths.failed_assets, keep=resuming)
+    context = MigrationContext(AssetFetcher(), AssetCache(paths.asset_cache), checkpoint,
+                               normalize_images=normalize_images, failed_assets=failed_assets,
+                               duplicate_policy=duplicate_policy, paths=paths, shard_workers=shards)
+
+    table_specs = build_table_specs(paths)
+    counts = dict.fromkeys((spec.name for spec in table_specs), 0)
+    completed = False
+    error = None
+    
+    def run_table(spec):
+        # Each table reads through its own connection; the pipeline's reader thread uses it too
+        table_conn = sqlite3.connect(paths.old_db, check_same_thread=False)
+        try:
+            written = migrate_table(spec, table_conn, new_conn, context)
+        finally:
+            table_conn.close()
+        with context.write_lock:
+            checkpoint.mark_done(spec.name)
+        context.cache.save() # so a killed run does not download the finished table's assets again
+        return written
+
+    try:
+        for spec in table_specs:
+            if checkpoint.is_done(spec.name):
+                print(f"\nSkipping '{spec.name}': already migrated by the interrupted run.")
+        remaining = [spec for spec in table_specs if not checkpoint.is_done(spec.name)]
+        # Tables print from several threads; keep their lines (and the progress line) whole
+        with contextlib.redirect_stdout(ConsoleOutput(sys.stdout)):
+            counts.update(run_table_schedule(remaining, run_table, context.cancelled))
+        completed = True
+
+        if resuming:
+            # Report what the target holds, not just what this run added
+            counts = {table: count_rows(new_conn, table) for table in counts}
+            
+    except KeyboardInterrupt:
+        error = "Interrupted"
+        print("\n!!! Migration interrupted. Progress up to the last written batch was kept.")
+        print("Run the script again with --resume to continue where it stopped.")
+    except Exception as e:
+        error = str(e)
+        print(f"\n!!! CRITICAL MIGRATION ERROR: {e}")
+        print("Migration incomplete. Check the logs above for detailed errors.")
+        print("Run the script again with --resume to continue where it stopped.")
+    finally:
+        # 3. Commit and Close
+        context.close()
+        if BULK_LOAD:
+            create_new_db_triggers(new_conn)
+        if completed:
+            checkpoint.clear()
+        new_conn.commit()
+        if completed and durable:
+            # Hand OpenHud a single file in its default journal mode
+            new_conn.execute('PRAGMA journal_mode = DELETE')
+        old_conn.close()
+        if build == 'partial':
+            # Every batch is already in the file; a complete build only has to be swapped in
+            new_conn.close()
+            try:
+                if completed:
+                    with METRICS.stage('commit'):
+                        publish_database(paths.partial_db, paths.new_db)
+            except OSError as e:
+                print(f"\n!!! CRITICAL MIGRATION ERROR: Could not write {target_name}. Error: {e}")
+                print("Close any program using it and run the script again with --resume.")
+                completed = False
+                error = f"Could not write {target_name}. Error: {e}"
+        elif staged:
+            try:
+                with METRICS.stage('commit'):
+                    if completed:
+                        save_database(new_conn, paths.new_db)
+                        if os.path.exists(paths.partial_db):
+                            remove_database_file(paths.partial_db)
+                    else:
+                        save_database(new_conn, paths.partial_db)
+            except (OSError, sqlite3.Error) as e:
+                print(f"\n!!! CRITICAL MIGRATION ERROR: Could not write {target_name}. Error: {e}")
+                if completed:
+                    print("Close any program using it and run the script again.")
+                completed = False
+                error = f"Could not write {target_name}. Error: {e}"
+            new_conn.close()
+        else:
+            new_conn.close()
+
+        # Written for interrupted runs too, so slow or failing migrations can be diagnosed
+        report_path = report_path or paths.report
+        report = METRICS.report(completed, error, counts)
+        report['duplicate_policy'] = duplicate_policy
+        METRICS.write_report(report_path, report)
+        if profile:
+            METRICS.write_profiles(paths.profile_folder)
+            tracemalloc.stop()
+
+    if not completed:
+        return report
+
+    stage_times = ', '.join(f"{name} {seconds:.1f}s" for name, seconds in METRICS.stage_seconds.items())
+    print("\n-------------------------------------------")
+    print("✅ Full Database Migration Complete!")
+    print(f"Players migrated: {counts['players']}")
+    print(f"Teams migrated: {counts['teams']}")
+    print(f"Coaches migrated: {counts['coaches']}")
+    print(f"Matches migrated: {counts['matches']}")
+    print(f"Rows skipped: {METRICS.counters['skipped_rows']}, corrupt JSON values replaced: {METRICS.counters['corrupt_values']}")
+    print(f"Time per stage: {stage_times}")
+    if len(failed_assets):
+        print(f"Images that could not be downloaded: {len(failed_assets)}, listed in {paths.failed_assets}")
+        print("Run the script again with 'refetch' to retry them and fill in the rows.")
+    print(f"New database file created: {target_name}")
+    print(f"Metrics report: {report_path}")
+    print("-------------------------------------------")
+
+    if verify:
+        # Rows skipped above were already reported, so only changed or extra rows fail the check
+        report['verification'] = verify_migration(paths, allow_missing=True, duplicate_policy=duplicate_policy)
+        METRICS.write_report(report_path, report)
+    return report
+
+
+# --- Re-fetch Failed Assets ---
+
+def refetch_failed_assets(paths=None, normalize_images=None):
+    """
+    Retries the downloads a migration into 'paths.new_db' recorded as failed (default:
+    MigrationPaths.from_config()) and fills the stored file into rows that still have
+    no asset. Entries that fail again stay in the list. Returns a summary dict.
+    """
+    paths = paths or MigrationPaths.from_config()
+    failed_assets = FailedAssetLog(paths.failed_assets)
+    entries = failed_assets.entries()
+    if not entries:
+        print(f"No failed downloads recorded in {paths.failed_assets}.")
+        return {'retried': 0, 'fixed': 0, 'failed': 0}
+    if not os.path.exists(paths.new_db):
+        print(f"FATAL ERROR: Migrated database file not found at {paths.new_db}")
+        return {'retried': 0, 'fixed': 0, 'failed': len(entries), 'error': f"Migrated database file not found at {paths.new_db}"}
+
+    if normalize_images is None:
+        normalize_images = NORMALIZE_IMAGES
+    specs = {spec.name: spec for spec in build_table_specs(paths)}
+    context = MigrationContext(AssetFetcher(), AssetCache(paths.asset_cache), normalize_images=normalize_images)
+    conn = sqlite3.connect(paths.new_db)
+    conn.row_factory = sqlite3.Row
+    fixed = 0
+    print(f"Retrying {len(entries)} failed downloads...")
+    try:
+        groups = {}
+        for entry in entries:
+            groups.setdefault((entry['table'], entry['column']), []).append(entry)
+        for (table, column), group in groups.items():
+            spec = specs[table]
+            asset = spec.assets[column]
+            os.makedirs(asset.folder, exist_ok=True)
+            jobs = []
+            for entry in group:
+                # Messages name the row by its columns (username, team name), so load it
+                row = conn.execute(f"SELECT * FROM {table} WHERE {spec.key} = ?", (entry['key'],)).fetchone()
+                jobs.append((spec.describe(dict(row) if row else {spec.key: entry['key']}), entry['source']))
+            # Download threads report failures concurrently; keep their lines whole
+            with contextlib.redirect_stdout(ConsoleOutput(sys.stdout)):
+                stored = fetch_assets(jobs, asset.folder, asset.label, context.fetcher, context.cache,
+                                      context.download_executor, normalizer=context.normalizer_for(asset))
+            with conn:
+                for entry, stored_filename in zip(group, stored):
+                    if stored_filename is None:
+                        continue
+                    # Only rows still without an asset: a duplicate key may have kept another row
+                    conn.execute(f"UPDATE {table} SET {column} = ? WHERE {spec.key} = ? AND {column} IS NULL",
+                                 (stored_filename, entry['key']))
+                    failed_assets.resolve(table, column, entry['key'])
+                    fixed += 1
+    finally:
+        context.close()
+        conn.close()
+        failed_assets.save()
+
+    remaining = len(failed_assets)
+    print(f"Re-fetch finished: {fixed} downloaded, {remaining} still failing.")
+    return {'retried': len(entries), 'fixed': fixed, 'failed': remaining}
+
+# --- Verification ---
+
+def verify_columns(spec, new_conn):
+    """
+    Returns [(column, numeric)] for the target columns verification compares: all but
+    timestamps (set at migration time) and assets (checked as files).
+    """
+    declared = {row[1]: row[2] for row in new_conn.execute(f'PRAGMA table_info({spec.name})')}
+    return [
+        (column, column_is_numeric(declared.get(column)))
+        for column in spec.columns
+        if column not in spec.timestamp_columns and column not in spec.assets
+    ]
+
+def legacy_verify_rows(spec, old_conn, columns, skip_rowids):
+    """
+    Yields (key, values...) for every legacy row the migration keeps, i.e. all but
+    'skip_rowids' (see resolve_duplicates()), mapped and cleaned by the spec's SQL
+    expressions. Optional columns the legacy table lacks get the values migration gives
+    them (see TableSpec.legacy_expression()). A legacy table migrate_table() cannot read
+    (missing, or without its 'source_columns') gives no rows, as nothing is migrated
+    from it; any other error is raised.
+    """
+    try:
+        old_conn.execute(f'SELECT {spec.source_columns} FROM {spec.source_table} LIMIT 0')
+    except sqlite3.OperationalError:
+        return
+    numeric = dict(columns)
+    select_list, params = legacy_stored_values(spec, old_conn, [(column, numeric[column]) for column in [spec.key] + list(numeric)])
+    cursor = old_conn.execute(f"SELECT _rowid_, {select_list} FROM {spec.source_table}", params)
+    for row in cursor:
+        if row[0] not in skip_rowids:
+            yield row[1:]
+
+def target_verify_rows(spec, new_conn, columns):
+    """
+    Returns a cursor over (key, values...) for every row of the migrated table.
+    """
+    numeric = dict(columns)
+    select_list = ', '.join(
+        sql_stored_value(column, numeric[column]) for column in [spec.key] + [c for c, _ in columns]
+    )
+    return new_conn.execute(f"SELECT {select_list} FROM {spec.name}")
+
+def table_fingerprint(rows, buckets, only=None):
+    """
+    Folds (key, values...) rows into per-bucket [row count, sum of row hashes mod 2**64],
+    which does not depend on row order. Fingerprints are only comparable within one
+    process. With 'only' (a set of bucket numbers) it instead returns {key: row hash}
+    for the rows in those buckets.
+    """
+    fingerprint = [[0, 0] for _ in range(buckets)]
+    row_hashes = {}
+    for row in rows:
+        key = row[0]
+        # hash() is salted per process, which is fine: both sides are hashed by this one
+        bucket = hash(key) % buckets
+        row_hash = hash(row) % 2 ** 64
+        if only is None:
+            fingerprint[bucket][0] += 1
+            fingerprint[bucket][1] = (fingerprint[bucket][1] + row_hash) % 2 ** 64
+        elif bucket in only:
+            row_hashes[key] = row_hash
+    return fingerprint if only is None else row_hashes
+
+def verify_table(spec, old_conn, new_conn, buckets=None, max_keys=None, duplicate_policy=None):
+    """
+    Compares one legacy table with its migrated copy and returns a summary with the
+    keys that are missing from the target, unexpected in it, or changed. Legacy rows
+    that lose under 'duplicate_policy' are not expected in the target. Both sides are
+    streamed once into bucket fingerprints; only buckets that differ are read again to
+    name their keys.
+    """
+    buckets = buckets or VERIFY_BUCKETS
+    max_keys = max_keys or VERIFY_MAX_KEYS
+    columns = verify_columns(spec, new_conn)
+    skip_rowids = resolve_duplicates(spec, old_conn, new_conn, duplicate_policy)
+    legacy = table_fingerprint(legacy_verify_rows(spec, old_conn, columns, skip_rowids), buckets)
+    target = table_fingerprint(target_verify_rows(spec, new_conn, columns), buckets)
+    differing = {bucket for bucket in range(buckets) if legacy[bucket] != target[bucket]}
+
+    missing, unexpected, changed = [], [], []
+    if differing:
+        legacy_keys = table_fingerprint(legacy_verify_rows(spec, old_conn, columns, skip_rowids), buckets, differing)
+        target_keys = table_fingerprint(target_verify_rows(spec, new_conn, columns), buckets, differing)
+        missing = sorted(key for key in legacy_keys if key not in target_keys)
+        unexpected = sorted(key for key in target_keys if key not in legacy_keys)
+        changed = sorted(key for key in legacy_keys if key in target_keys and legacy_keys[key] != target_keys[key])
+
+    return {
+        'legacy_rows': sum(count for count, _ in legacy),
+        'target_rows': sum(count for count, _ in target),
+        'differing_buckets': len(differing),
+        'missing': len(missing),
+        'unexpected': len(unexpected),
+        'changed': len(changed),
+        'missing_keys': missing[:max_keys],
+        'unexpected_keys': unexpected[:max_keys],
+        'changed_keys': changed[:max_keys],
+    }
+
+def verify_assets(spec, new_conn, expected_sizes):
+    """
+    Checks that every file referenced by an asset column of 'spec' exists in its folder,
+    is not empty and has the size the asset cache recorded for it. Returns (number of
+    files checked, list of problems).
+    """
+    checked = 0
+    problems = []
+    for column, asset in spec.assets.items():
+        for (filename,) in new_conn.execute(f'SELECT DISTINCT {column} FROM {spec.name} WHERE {column} IS NOT NULL'):
+            checked += 1
+            try:
+                size = os.path.getsize(os.path.join(asset.folder, filename))
+            except OSError:
+                problems.append(f"{asset.label} '{filename}' is missing from {asset.folder}")
+                continue
+            expected = expected_sizes.get(filename)
+            if size == 0 or (expected is not None and size != expected):
+                problems.append(f"{asset.label} '{filename}' has {size} bytes, expected {expected or 'more than 0'}")
+    return checked, problems
+
+def open_read_only(path):
+    return sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=ro", uri=True)
+
+def verify_migration(paths=None, allow_missing=False, buckets=None, max_keys=None, duplicate_policy=None):
+    """
+    Checks 'paths.new_db' against 'paths.old_db' (default: MigrationPaths.from_config())
+    without modifying either: per-table fingerprints of keys and values, plus every
+    referenced avatar/logo file. Returns a report dict whose 'ok' is False on any
+    difference; with 'allow_missing', legacy rows absent from the target (the records
+    the migration skipped) are reported but tolerated. 'duplicate_policy' must be the
+    one the migration used (default: DUPLICATE_POLICY).
+    """
+    paths = paths or MigrationPaths.from_config()
+    started = time.perf_counter()
+    for path in (paths.old_db, paths.new_db):
+        if not os.path.exists(path):
+            print(f"FATAL ERROR: Database file not found at {path}")
+            return {'ok': False, 'error': f"Database file not found at {path}"}
+
+    old_conn = open_read_only(paths.old_db)
+    new_conn = open_read_only(paths.new_db)
+    expected_sizes = AssetCache(paths.asset_cache).stored_sizes()
+    report = {'ok': True, 'duplicate_policy': duplicate_policy or DUPLICATE_POLICY, 'tables': {}, 'assets_checked': 0,
+              'asset_problems': []}
+    print(f"\nVerifying {os.path.basename(paths.new_db)} against {os.path.basename(paths.old_db)}...")
+    try:
+        for spec in build_table_specs(paths):
+            result = verify_table(spec, old_conn, new_conn, buckets, max_keys, duplicate_policy)
+            checked, problems = verify_assets(spec, new_conn, expected_sizes)
+            report['tables'][spec.name] = result
+            report['assets_checked'] += checked
+            report['asset_problems'] += problems
+
+            if not (result['missing'] or result['unexpected'] or result['changed']):
+                print(f"  -> {spec.name}: {result['target_rows']} rows match.")
+                continue
+            if result['unexpected'] or result['changed'] or not allow_missing:
+                report['ok'] = False
+            print(f"  !!! ERROR {spec.name}: {result['missing']} missing, {result['unexpected']} unexpected, "
+                  f"{result['changed']} changed of {result['legacy_rows']} legacy rows.")
+            for kind in ('missing', 'unexpected', 'changed'):
+                if result[f'{kind}_keys']:
+                    print(f"      {kind}: {', '.join(str(key) for key in result[f'{kind}_keys'])}")
+    finally:
+        old_conn.close()
+        new_conn.close()
+
+    for problem in report['asset_problems'][:max_keys or VERIFY_MAX_KEYS]:
+        print(f"  !!! ERROR {problem}")
+    if report['asset_problems']:
+        report['ok'] = False
+    print(f"  -> {report['assets_checked']} asset files checked, {len(report['asset_problems'])} problems.")
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    print(f"Verification {'passed' if report['ok'] else 'FAILED'} in {report['seconds']:.1f}s.")
+    return report
+
+# --- Migration Plan ---
+
+def plan_table(spec, old_conn, schema_conn, duplicate_policy):
+    """
+    Counts the rows of one legacy table, the rows resolve_duplicates() would skip and the
+    corrupt values per JSON column. Returns None when the migration could not read it.
+    """
+    try:
+        old_conn.execute(f'SELECT {spec.source_columns} FROM {spec.source_table} LIMIT 0')
+        rows = count_rows(old_conn, spec.source_table)
+    except sqlite3.OperationalError:
+        return None
+    try:
+        corrupt = old_conn.execute('SELECT ' + ', '.join(
+            [f"COALESCE(SUM({sql_is_corrupt_json(spec.sql_mapping.get(column, column))}), 0)" for column in spec.json_columns]
+            or ['0']
+        ) + f' FROM {spec.source_table}').fetchone()
+        corrupt = dict(zip(spec.json_columns, corrupt))
+    except sqlite3.OperationalError: # SQLite without the JSON functions
+        corrupt = {column: None for column in spec.json_columns}
+    conflicts = resolve_duplicates(spec, old_conn, schema_conn, duplicate_policy)
+    return {
+        'rows': rows,
+        'conflicts': len(conflicts),
+        'conflict_examples': [f"source row {rowid}: {reason}" for rowid, reason in sorted(conflicts.items())[:DUPLICATE_EXAMPLES]],
+        'corrupt': corrupt,
+    }
+
+def plan_assets(spec, old_conn, cache):
+    """
+    Collects the distinct avatar/logo sources of one legacy table per asset column:
+    remote URLs grouped by host, local files with their total size, local paths that
+    do not exist, and how many sources 'cache' already holds a stored file for.
+    """
+    columns = {}
+    for column, asset in spec.assets.items():
+        plan = {'urls_by_host': {}, 'local_files': 0, 'local_bytes': 0, 'missing_files': 0, 'cached': 0}
+        try:
+            sources = old_conn.execute(f"SELECT DISTINCT {asset.source} FROM {spec.source_table} WHERE {asset.source} != ''")
+        except sqlite3.OperationalError:
+            continue
+        for (source,) in sources:
+            if not isinstance(source, str):
+                continue
+            remote = is_remote_source(source)
+            if remote:
+                plan['urls_by_host'].setdefault(urlparse(source).netloc.lower(), []).append(source)
+            elif os.path.exists(source):
+                plan['local_files'] += 1
+                plan['local_bytes'] += os.path.getsize(source)
+            else:
+                plan['missing_files'] += 1
+                continue
+            entry = cache.get(source if remote else os.path.abspath(source))
+            if entry is not None and os.path.exists(os.path.join(asset.folder, entry['file'])):
+                plan['cached'] += 1
+        columns[column] = plan
+    return columns
+
+def probe_remote_assets(urls_by_host, sample=None, workers=None):
+    """
+    Sends a HEAD request to up to 'sample' (default: PLAN_PROBE_SAMPLE) URLs of every host
+    and extrapolates each host's download volume from the mean Content-Length, and its
+    download time from the mean response time spread over the HOST_CONNECTIONS the
+    migration would use. Returns {host: {'probed', 'failed', 'bytes', 'seconds'}};
+    'bytes'/'seconds' are None when no probe of the host succeeded.
+    """
+    sample = sample or PLAN_PROBE_SAMPLE
+    workers = workers or DOWNLOAD_WORKERS
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max(len(urls_by_host), 1), pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def head(url):
+        started = time.perf_counter()
+        try:
+            response = session.head(url, headers=HEADERS, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+                                    allow_redirects=True)
+        except requests.RequestException:
+            return None
+        if response.status_code >= 400:
+            return None
+        length = response.headers.get('Content-Length', '')
+        return (int(length) if length.isdigit() else None), time.perf_counter() - started
+
+    jobs = interleave_by_host([url for urls in urls_by_host.values() for url in urls[:sample]])
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            answers = dict(zip(jobs, executor.map(head, jobs)))
+    finally:
+        session.close()
+
+    results = {}
+    for host, urls in urls_by_host.items():
+        probed = [answers[url] for url in urls[:sample]]
+        ok = [answer for answer in probed if answer is not None]
+        sizes = [size for size, _ in ok if size is not None]
+        results[host] = {
+            'urls': len(urls),
+            'probed': len(probed),
+            'failed': len(probed) - len(ok),
+            'bytes': round(sum(sizes) / len(sizes) * len(urls)) if sizes else None,
+            'seconds': sum(seconds for _, seconds in ok) / len(ok) * len(urls) / min(HOST_CONNECTIONS, workers) if ok else None,
+        }
+    return results
+
+def plan_migration(paths=None, probe=False, duplicate_policy=None):
+    """
+    Dry run: reads 'paths.old_db' (default: MigrationPaths.from_config()) read-only and
+    reports what a migration would do, without writing any file: rows per table,
+    projected integrity conflicts, corrupt JSON values, distinct remote URLs per host,
+    local asset files and their size, and missing local files. With 'probe', remote
+    hosts get a few HEAD requests to estimate the download volume and time (see
+    probe_remote_assets()). Returns the plan as a dict.
+    """
+    paths = paths or MigrationPaths.from_config()
+    duplicate_policy = duplicate_policy or DUPLICATE_POLICY
+    started = time.perf_counter()
+    if not os.path.exists(paths.old_db):
+        print(f"FATAL ERROR: Old database file not found at {paths.old_db}")
+        return {'ok': False, 'error': f"Old database file not found at {paths.old_db}"}
+
+    print(f"\nPlanning the migration of {os.path.basename(paths.old_db)} (nothing is written)...")
+    old_conn = open_read_only(paths.old_db)
+    # The target schema in memory, so conflicts are judged against the real constraints
+    schema_conn = sqlite3.connect(':memory:')
+    with contextlib.redirect_stdout(io.StringIO()):
+        create_new_db_schema(schema_conn, with_triggers=False)
+    cache = AssetCache(paths.asset_cache)
+    report = {'ok': True, 'source': paths.old_db, 'duplicate_policy': duplicate_policy, 'tables': {}, 'assets': {}}
+    try:
+        for spec in build_table_specs(paths):
+            table = plan_table(spec, old_conn, schema_conn, duplicate_policy)
+            if table is None:
+                print(f"  -> {spec.name}: no readable '{spec.source_table}' table, nothing to migrate.")
+                continue
+            report['tables'][spec.name] = table
+            corrupt = ', '.join(f"{count if count is not None else '?'} corrupt {column}"
+                                for column, count in table['corrupt'].items())
+            print(f"  -> {spec.name}: {table['rows']} rows, {table['conflicts']} conflicts "
+                  f"('{duplicate_policy}' wins){', ' + corrupt if corrupt else ''}.")
+            for example in table['conflict_examples']:
+                print(f"      {example}")
+            if table['conflicts'] > len(table['conflict_examples']):
+                print(f"      ... and {table['conflicts'] - len(table['conflict_examples'])} more.")
+
+            for column, assets in plan_assets(spec, old_conn, cache).items():
+                report['assets'][f'{spec.name}.{column}'] = assets
+                urls = sum(len(host_urls) for host_urls in assets['urls_by_host'].values())
+                print(f"  -> {spec.name}.{column}: {urls} URLs on {len(assets['urls_by_host'])} hosts, "
+                      f"{assets['local_files']} local files ({assets['local_bytes'] / 1048576:.1f} MiB), "
+                      f"{assets['missing_files']} missing local files, {assets['cached']} already stored.")
+    finally:
+        old_conn.close()
+        schema_conn.close()
+
+    urls_by_host = {}
+    for assets in report['assets'].values():
+        for host, host_urls in assets['urls_by_host'].items():
+            urls_by_host.setdefault(host, []).extend(host_urls)
+        assets['urls_by_host'] = {host: len(host_urls) for host, host_urls in assets['urls_by_host'].items()}
+    report['hosts'] = {host: {'urls': len(urls)} for host, urls in sorted(urls_by_host.items(), key=lambda item: -len(item[1]))}
+    report['rows'] = sum(table['rows'] for table in report['tables'].values())
+    report['conflicts'] = sum(table['conflicts'] for table in report['tables'].values())
+    report['local_bytes'] = sum(assets['local_bytes'] for assets in report['assets'].values())
+    report['missing_files'] = sum(assets['missing_files'] for assets in report['assets'].values())
+
+    if probe and urls_by_host:
+        print(f"Probing {len(urls_by_host)} hosts with HEAD requests...")
+        report['hosts'] = probe_remote_assets(urls_by_host)
+        known = [host for host in report['hosts'].values() if host['bytes'] is not None]
+        work = [host['seconds'] for host in report['hosts'].values() if host['seconds'] is not None]
+        report['download_bytes'] = sum(host['bytes'] for host in known)
+        # Hosts download side by side, but never on more than DOWNLOAD_WORKERS connections in total
+        report['download_seconds'] = max(max(work, default=0), sum(work) * min(HOST_CONNECTIONS, DOWNLOAD_WORKERS)
+                                         / DOWNLOAD_WORKERS)
+    for host, result in report['hosts'].items():
+        line = f"      {host}: {result['urls']} URLs"
+        if 'probed' in result:
+            line += f", {result['failed']}/{result['probed']} probes failed"
+            if result['bytes'] is not None:
+                line += f", ~{result['bytes'] / 1048576:.1f} MiB"
+            if result['seconds'] is not None:
+                line += f", ~{format_duration(result['seconds'])}"
+        print(line)
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    print("\n-------------------------------------------")
+    print(f"Rows: {report['rows']}, projected conflicts: {report['conflicts']}")
+    print(f"Remote URLs: {sum(host['urls'] for host in report['hosts'].values())} on {len(report['hosts'])} hosts")
+    print(f"Local asset files: {report['local_bytes'] / 1048576:.1f} MiB, missing: {report['missing_files']}")
+    if 'download_bytes' in report:
+        print(f"Estimated download: ~{report['download_bytes'] / 1048576:.1f} MiB in ~{format_duration(report['download_seconds'])}")
+    print(f"Planned in {report['seconds']:.1f}s. Nothing was written.")
+    print("-------------------------------------------")
+    return report
+
+# --- Continuous Sync ---
+
+class SyncIndex:
+    """
+    Content hash of every legacy row sync mode has written into the target, by table and
+    key. Kept in its own database next to the target and ATTACHed to the target
+    connection as 'sync_index', so index updates commit in the same transaction as the
+    rows they describe. Only keys in the index are ever deleted from the target, so
+    rows created by the new OpenHud are left alone.
+    """
+
+    def __init__(self, conn, path):
+        self.conn = conn
+        conn.execute('ATTACH DATABASE ? AS sync_index', (path,))
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sync_index.row_hashes (
+                table_name TEXT NOT NULL,
+                key NOT NULL,
+                hash INTEGER NOT NULL,
+                PRIMARY KEY (table_name, key)
+            ) WITHOUT ROWID
+        ''')
+        conn.commit()
+
+    def store(self, table, entries):
+        """
+        Records (key, hash) pairs; call inside the transaction that wrote the rows.
+        """
+        self.conn.executemany('''
+            INSERT INTO sync_index.row_hashes (table_name, key, hash) VALUES (?, ?, ?)
+            ON CONFLICT(table_name, key) DO UPDATE SET hash = excluded.hash
+        ''', ((table, key, row_hash) for key, row_hash in entries))
+
+    def remove(self, table, keys):
+        self.conn.executemany('DELETE FROM sync_index.row_hashes WHERE table_name = ? AND key = ?',
+                              ((table, key) for key in keys))
+
+def row_hash(values):
+    """
+    Stable 64-bit hash of a legacy row's values, the same in every process and run.
+    """
+    return int.from_bytes(hashlib.blake2b(repr(values).encode(), digest_size=8).digest(), 'big', signed=True)
+
+def legacy_hash_sql(spec, old_conn):
+    """
+    Returns the SELECT that lists the legacy table of 'spec' as (source_rowid, key, hash)
+    rows, hashing the same values a 'SELECT source_columns' reads with the row_hash()
+    SQL function sync_migration() registers on 'old_conn'.
+    """
+    columns = spec.source_columns
+    if columns == '*':
+        columns = ', '.join(f'"{row[1]}"' for row in old_conn.execute(f'PRAGMA table_info({spec.source_table})'))
+    return (f'SELECT _rowid_ AS source_rowid, {spec.sql_expression(spec.key)} AS key, row_hash({columns}) AS hash '
+            f'FROM {spec.source_table}')
+
+def read_rows_by_rowid(conn, spec, rowids):
+    """
+    Yields the legacy rows of 'spec' with the given rowids as dicts with '_rowid_'.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    for chunk in iter_batches(rowids, 500):
+        placeholders = ', '.join('?' for _ in chunk)
+        cursor.execute(f'SELECT _rowid_ AS _rowid_, {spec.source_columns} FROM {spec.source_table} '
+                       f'WHERE _rowid_ IN ({placeholders}) ORDER BY _rowid_', chunk)
+        yield from (dict(row) for row in cursor.fetchall())
+
+@dataclass
+class TableChanges:
+    """
+    What sync_table() writes for one table, read from a legacy snapshot by
+    read_table_changes(): the new or changed legacy rows (dicts with '_rowid_'), their
+    {rowid: (key, hash)} index entries and the keys to delete.
+    """
+    rows: list
+    entries: dict
+    deleted: list
+
+def read_table_changes(spec, old_conn, new_conn, duplicate_policy):
+    """
+    Reads what changed in the legacy table of 'spec' since the last sync, or returns
+    None if nothing did. The diff runs inside SQLite, on the SyncIndex ATTACHed to
+    'old_conn': every legacy row's hash is looked up by key, and only rows whose hash
+    differs come back. Only those (and the rows they collide with) are checked by
+    resolve_duplicates(). Only reads, so it can run inside the short legacy read
+    transaction; the changed rows are held in memory until sync_table().
+    """
+    if not has_rowids(old_conn, spec.source_table):
+        return None
+    key_sql = spec.sql_expression(spec.key)
+    with METRICS.stage('read'):
+        # LIMIT -1 keeps SQLite from inlining the subquery, which would hash every row twice
+        changed = old_conn.execute(f'''
+            SELECT legacy.source_rowid, legacy.key, legacy.hash FROM ({legacy_hash_sql(spec, old_conn)} LIMIT -1) AS legacy
+            LEFT JOIN sync_index.row_hashes AS known ON known.table_name = ? AND known.key = legacy.key
+            WHERE known.hash IS NOT legacy.hash
+        ''', (spec.name,)).fetchall()
+        skip_rowids = resolve_duplicates(spec, old_conn, new_conn, duplicate_policy,
+                                         rowids=[rowid for rowid, _, _ in changed]) if changed else {}
+        # Indexed keys left without a legacy row the target keeps: deleted, or now skipped
+        old_conn.execute('DROP TABLE IF EXISTS temp.sync_skipped')
+        old_conn.execute('CREATE TEMP TABLE sync_skipped (source_rowid INTEGER PRIMARY KEY)')
+        old_conn.executemany('INSERT INTO temp.sync_skipped VALUES (?)', ((rowid,) for rowid in skip_rowids))
+        deleted = [key for key, in old_conn.execute(f'''
+            SELECT key FROM sync_index.row_hashes WHERE table_name = ? AND key NOT IN (
+                SELECT {key_sql} FROM {spec.source_table}
+                WHERE {key_sql} IS NOT NULL AND _rowid_ NOT IN temp.sync_skipped
+            )
+        ''', (spec.name,))]
+        old_conn.execute('DROP TABLE temp.sync_skipped')
+    METRICS.count('rows_read', count_rows(old_conn, spec.source_table))
+
+    entries = {rowid: (key, values_hash) for rowid, key, values_hash in changed if rowid not in skip_rowids}
+    if not entries and not deleted:
+        return None
+    return TableChanges(list(read_rows_by_rowid(old_conn, spec, list(entries))), entries, deleted)
+
+def sync_table(spec, changes, new_conn, index, context):
+    """
+    Writes the TableChanges of one table into the target: new and changed rows are
+    transformed, assets included, and upserted, keeping their 'createdAt', and rows
+    whose key disappeared from the legacy table are deleted. Needs no access to the
+    legacy database. Returns (upserted, deleted).
+    """
+    updates = ', '.join(f"{column} = excluded.{column}" for column in spec.columns if column not in (spec.key, 'createdAt'))
+    upsert_sql = f"{spec.insert_sql} ON CONFLICT({spec.key}) DO UPDATE SET {updates}"
+    upserted = 0
+    for page in iter_batches(changes.rows, READ_PAGE_SIZE):
+        rows = transform_page(spec, page, context)
+        entries = [changes.entries[old_row['_rowid_']] for old_row in page]
+        # Index the page in its own transaction; rows the target rejected are indexed
+        # too, so they are only retried once they change again
+        upserted += insert_rows(
+            new_conn, upsert_sql, rows,
+            describe=lambda values: spec.describe(dict(zip(spec.columns, values))),
+            batch_size=len(rows),
+            on_batch=lambda _: index.store(spec.name, entries),
+        )
+
+    if changes.deleted:
+        try:
+            new_conn.executemany(f"DELETE FROM {spec.name} WHERE {spec.key} = ?", ((key,) for key in changes.deleted))
+            index.remove(spec.name, changes.deleted)
+            new_conn.commit()
+        except BaseException:
+            if new_conn.in_transaction:
+                new_conn.rollback()
+            raise
+    return upserted, len(changes.deleted)
+
+def legacy_version(conn, path):
+    """
+    Changes whenever the legacy database was written: its PRAGMA data_version (bumped by
+    commits of other connections) plus the mtimes of the file and its WAL.
+    """
+    mtimes = tuple(os.stat(path + suffix).st_mtime_ns if os.path.exists(path + suffix) else None for suffix in ('', '-wal'))
+    return conn.execute('PRAGMA data_version').fetchone()[0], mtimes
+
+def sync_migration(paths=None, interval=None, once=False, normalize_images=None, duplicate_policy=None):
+    """
+    Keeps 'paths.new_db' (default: MigrationPaths.from_config()) in step with a legacy
+    database that is still in use: polls it every 'interval' (default: SYNC_INTERVAL)
+    seconds and, when it changed, syncs every table with sync_table(). Which rows
+    changed is found inside SQLite by joining row hashes with the SyncIndex in
+    'paths.sync_index' (see read_table_changes()), so only changed rows are transformed,
+    fetched and written; an unchanged table costs one hashing scan. The legacy read
+    transaction only lasts for those scans, so OpenHud can keep writing while assets
+    download. A missing target is created; the first sync of a target indexes (and
+    rewrites) all of its rows.
+
+    Runs until Ctrl-C, or for a single pass with 'once'. Returns the totals of the run.
+    """
+    paths = paths or MigrationPaths.from_config()
+    interval = interval or SYNC_INTERVAL
+    if not os.path.exists(paths.old_db):
+        print(f"FATAL ERROR: Old database file not found at {paths.old_db}")
+        return {'ok': False, 'error': f"Old database file not found at {paths.old_db}"}
+
+    os.makedirs(os.path.dirname(os.path.abspath(paths.new_db)), exist_ok=True)
+    old_conn = open_read_only(paths.old_db)
+    new_conn = sqlite3.connect(paths.new_db)
+    with contextlib.redirect_stdout(io.StringIO()):
+        create_new_db_schema(new_conn)
+    index = SyncIndex(new_conn, paths.sync_index)
+    # read_table_changes() diffs the legacy rows against the index inside SQLite
+    old_conn.execute('ATTACH DATABASE ? AS sync_index', (paths.sync_index,))
+    old_conn.create_function('row_hash', -1, lambda *values: row_hash(values), deterministic=True)
+    context = MigrationContext(AssetFetcher(), AssetCache(paths.asset_cache),
+                               normalize_images=NORMALIZE_IMAGES if normalize_images is None else normalize_images,
+                               failed_assets=FailedAssetLog(paths.failed_assets), duplicate_policy=duplicate_policy)
+    table_specs = build_table_specs(paths)
+    for spec in table_specs:
+        for asset in spec.assets.values():
+            os.makedirs(asset.folder, exist_ok=True)
+
+    totals = {'ok': True, 'passes': 0, 'upserted': 0, 'deleted': 0}
+    last_version = None
+    print(f"Syncing {os.path.basename(paths.old_db)} into {os.path.basename(paths.new_db)}"
+          + (" once." if once else f" every {interval}s. Press Ctrl-C to stop."))
+    try:
+        while True:
+            version = legacy_version(old_conn, paths.old_db)
+            if version != last_version:
+                METRICS.reset()
+                started = time.perf_counter()
+                try:
+                    old_conn.execute('BEGIN') # one consistent snapshot of every legacy table
+                    try:
+                        pending = [(spec, read_table_changes(spec, old_conn, new_conn, context.duplicate_policy))
+                                   for spec in table_specs]
+                    finally:
+                        old_conn.rollback()
+                except sqlite3.OperationalError as e: # e.g. locked by the old OpenHud; try again
+                    print(f"  -> WARNING: Could not read {os.path.basename(paths.old_db)}, retrying. Error: {e}")
+                else:
+                    # Download threads report failures concurrently; keep their lines whole
+                    with contextlib.redirect_stdout(ConsoleOutput(sys.stdout)):
+                        changes = {spec.name: sync_table(spec, table_changes, new_conn, index, context)
+                                   if table_changes else (0, 0) for spec, table_changes in pending}
+                    last_version = version
+                    totals['passes'] += 1
+                    context.cache.save()
+                    context.failed_assets.save()
+                    summary = ', '.join(f"{table} +{upserted}/-{deleted}" for table, (upserted, deleted) in changes.items()
+                                        if upserted or deleted)
+                    totals['upserted'] += sum(upserted for upserted, _ in changes.values())
+                    totals['deleted'] += sum(deleted for _, deleted in changes.values())
+                    print(f"[{get_timestamp()}] {summary or 'no changes'} "
+                          f"({METRICS.counters['rows_read']} rows checked in {time.perf_counter() - started:.1f}s)")
+            if once:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\nSync stopped.")
+    finally:
+        context.close()
+        old_conn.close()
+        new_conn.close()
+    return totals
+
+# --- Bundle Export/Import ---
+
+def detect_schema(conn):
+    """
+    Returns 'v1' for a database this script (or OpenHud) created, else 'legacy'.
+    """
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'update_players_updatedAt'").fetchone()
+    return 'v1' if row else 'legacy'
+
+def is_plain_file_name(name):
+    return isinstance(name, str) and name not in ('', '.', '..') and os.path.basename(name) == name and '\\' not in name
+
+class BundleAssets:
+    """
+    The asset blobs of a bundle being exported: every stored file is named after a hash of
+    its content, so an image used by many rows (or by players and teams) is stored once.
+    Only {source path: blob name} is kept in memory; the files are copied into the bundle
+    after the tables.
+    """
+
+    def __init__(self):
+        self.blobs = {}
+        self.stored_names = {}
+
+    def add(self, path):
+        """
+        Returns the blob name for the file at 'path'.
+        """
+        blob = self.blobs.get(path)
+        if blob is None:
+            with METRICS.stage('copy'):
+                blob = f"{hash_file(path)}{os.path.splitext(path)[1].lower()}"
+            self.blobs[path] = blob
+            self.stored_names[os.path.basename(path)] = blob
+        return blob
+
+def v1_bundle_rows(spec, conn, assets):
+    """
+    Yields the rows of a migrated (v1) table as dicts of its columns, with asset columns
+    pointing at bundle blobs. Asset files missing from the upload folders become None.
+    """
+    for page in read_pages(conn, spec.name, ', '.join(spec.columns)):
+        for row in page:
+            row.pop('_rowid_')
+            for column, asset in spec.assets.items():
+                path = os.path.join(asset.folder, row[column]) if is_plain_file_name(row[column]) else None
+                row[column] = assets.add(path) if path and os.path.exists(path) else None
+            yield row
+
+def legacy_bundle_rows(spec, conn, new_conn, cache, assets, duplicate_policy=None):
+    """
+    Yields the rows of a legacy table transformed as the migration would, without any
+    network access: remote avatars/logos come from the files the asset cache says this
+    install already stored, local ones from their paths. URLs that were never stored
+    are kept under '_sources', so the importing side can refetch them.
+    """
+    skip_rowids = resolve_duplicates(spec, conn, new_conn, duplicate_policy)
+    report_duplicates(spec, skip_rowids, None, duplicate_policy or DUPLICATE_POLICY)
+    current_time = get_timestamp()
+    for page in read_pages(conn, spec.source_table, spec.source_columns):
+        for old_row in page:
+            if old_row['_rowid_'] in skip_rowids:
+                continue
+            row = {column: spec.value_of(column, old_row) for column in spec.columns
+                   if column not in spec.assets and column not in spec.timestamp_columns}
+            row.update(dict.fromkeys(spec.timestamp_columns, current_time))
+            for column, asset in spec.assets.items():
+                source = old_row.get(asset.source)
+                path = None
+                if source and is_remote_source(source):
+                    entry = cache.get(source)
+                    if entry is not None and os.path.exists(os.path.join(asset.folder, entry['file'])):
+                        path = os.path.join(asset.folder, entry['file'])
+                    else:
+                        row.setdefault('_sources', {})[column] = source
+                elif source and os.path.exists(source):
+                    path = source
+                row[column] = assets.add(path) if path else None
+            yield row
+
+def write_ndjson(bundle, name, rows):
+    """
+    Streams 'rows' into the bundle entry 'name', one JSON object per line, and returns
+    how many were written.
+    """
+    count = 0
+    with bundle.open(name, 'w', force_zip64=True) as raw, io.TextIOWrapper(raw, encoding='utf-8', newline='\n') as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')))
+            f.write('\n')
+            count += 1
+    return count
+
+def read_ndjson(bundle, name):
+    with bundle.open(name) as raw, io.TextIOWrapper(raw, encoding='utf-8', newline='\n') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def export_bundle(bundle_path, paths=None, schema=None, duplicate_policy=None):
+    """
+    Writes 'paths.old_db' (default: MigrationPaths.from_config()) into a bundle at
+    'bundle_path': a zip with one NDJSON file per table (tables/<name>.ndjson, rows in
+    the v1 column layout), the deduplicated avatar/logo blobs (assets/), the asset
+    cache entries of the exported remote images (assets/cache.ndjson) and a manifest.
+
+    'schema' is 'legacy' (rows are migrated on the way, assets taken from the asset
+    cache and folders of 'paths') or 'v1' (a migrated database, with its uploads in the
+    folders of 'paths'); by default it is detected. 'duplicate_policy' resolves legacy
+    duplicates as in run_migration(). Rows are streamed page by page and
+    nothing is downloaded. Returns the manifest.
+    """
+    paths = paths or MigrationPaths.from_config()
+    started = time.perf_counter()
+    conn = open_read_only(paths.old_db)
+    schema = schema or detect_schema(conn)
+    print(f"Exporting {os.path.basename(paths.old_db)} ({schema} schema) to {bundle_path}...")
+    cache = AssetCache(paths.asset_cache)
+    assets = BundleAssets()
+    manifest = {'format': BUNDLE_FORMAT, 'version': BUNDLE_VERSION, 'created_at': get_timestamp(), 'schema': schema,
+                'tables': {}}
+
+    # The v1 schema in memory, to judge legacy duplicates against the real constraints
+    schema_conn = sqlite3.connect(':memory:')
+    with contextlib.redirect_stdout(io.StringIO()):
+        create_new_db_schema(schema_conn, with_triggers=False)
+    temp_path = f"{bundle_path}.tmp"
+    try:
+        with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as bundle:
+            for spec in build_table_specs(paths):
+                table = spec.name if schema == 'v1' else spec.source_table
+                try:
+                    conn.execute(f'SELECT {spec.source_columns if schema == "legacy" else "*"} FROM {table} LIMIT 0')
+                except sqlite3.OperationalError:
+                    print(f"  -> {spec.name}: no '{table}' table, skipped.")
+                    continue
+                rows = v1_bundle_rows(spec, conn, assets) if schema == 'v1' else legacy_bundle_rows(
+                    spec, conn, schema_conn, cache, assets, duplicate_policy)
+                manifest['tables'][spec.name] = write_ndjson(bundle, f'tables/{spec.name}.ndjson', rows)
+                print(f"  -> {spec.name}: {manifest['tables'][spec.name]} rows.")
+
+            # Images are already compressed; store them as they are
+            written = set()
+            for path, blob in assets.blobs.items():
+                if blob not in written:
+                    bundle.write(path, f'assets/{blob}', compress_type=zipfile.ZIP_STORED)
+                    METRICS.count('bytes_copied', os.path.getsize(path))
+                    written.add(blob)
+            cache_entries = (
+                {'key': key, 'entry': {**entry, 'file': assets.stored_names[entry['file']]}}
+                for key, entry in cache.items()
+                if is_remote_source(key) and entry.get('file') in assets.stored_names and not entry.get('variant')
+            )
+            manifest['cache_entries'] = write_ndjson(bundle, 'assets/cache.ndjson', cache_entries)
+            manifest['assets'] = len(set(assets.blobs.values()))
+            bundle.writestr('manifest.json', json.dumps(manifest, indent=2))
+        os.replace(temp_path, bundle_path)
+    finally:
+        conn.close()
+        schema_conn.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    print(f"Exported {sum(manifest['tables'].values())} rows and {manifest['assets']} asset files "
+          f"in {time.perf_counter() - started:.1f}s.")
+    return manifest
+
+def extract_blob(bundle, blob, folder):
+    """
+    Copies the bundle's asset 'blob' into 'folder' unless the file is already there.
+    Returns the file name, or None if the bundle does not have it.
+    """
+    destination = os.path.join(folder, blob)
+    if os.path.exists(destination):
+        return blob
+    try:
+        source = bundle.open(f'assets/{blob}')
+    except KeyError:
+        return None
+    temp_path = f"{destination}.{uuid.uuid4().hex}.tmp"
+    with METRICS.stage('copy'), source, open(temp_path, 'wb') as f:
+        shutil.copyfileobj(source, f, DOWNLOAD_CHUNK_SIZE)
+    os.replace(temp_path, destination)
+    METRICS.count('bytes_copied', os.path.getsize(destination))
+    return blob
+
+def bundle_import_rows(spec, bundle, failed_assets):
+    """
+    Yields (line number, values) for insert_rows() from a bundle table, extracting the
+    asset blobs the rows use. '_sources' of unresolved images go to 'failed_assets'.
+    """
+    for line_number, row in enumerate(read_ndjson(bundle, f'tables/{spec.name}.ndjson'), start=1):
+        for column, asset in spec.assets.items():
+            blob = row.get(column)
+            row[column] = extract_blob(bundle, blob, asset.folder) if is_plain_file_name(blob) else None
+        for column, source in row.get('_sources', {}).items():
+            failed_assets.record(spec.name, column, row.get(spec.key), source)
+        METRICS.count('rows_read')
+        yield line_number, tuple(row.get(column) for column in spec.columns)
+
+def import_bundle(bundle_path, paths=None, replace=False, build=None):
+    """
+    Creates 'paths.new_db' (default: MigrationPaths.from_config()) from an export_bundle()
+    file: rows are streamed from the NDJSON files with batched inserts, asset blobs are
+    copied into the upload folders and the exported asset cache entries are added to
+    'paths.asset_cache', so a later migration of the same legacy database downloads
+    nothing again. Images the source never stored are listed for 'refetch'. An existing
+    target is only replaced with 'replace'; 'build' overrides TARGET_BUILD as in
+    run_migration(). Makes no network calls. Returns the row counts per table.
+    """
+    paths = paths or MigrationPaths.from_config()
+    build = build or TARGET_BUILD
+    target_name = os.path.basename(paths.new_db)
+    if os.path.exists(paths.new_db) and not replace:
+        print(f"FATAL ERROR: {target_name} already exists. Use --replace to overwrite it.")
+        return {'completed': False, 'error': f"{target_name} already exists"}
+
+    METRICS.reset()
+    try:
+        bundle = zipfile.ZipFile(bundle_path)
+        manifest = json.loads(bundle.read('manifest.json'))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        print(f"FATAL ERROR: Could not read bundle {bundle_path}. Error: {e}")
+        return {'completed': False, 'error': f"Could not read bundle {bundle_path}. Error: {e}"}
+    with bundle:
+        if manifest.get('format') != BUNDLE_FORMAT or manifest.get('version', 0) > BUNDLE_VERSION:
+            print(f"FATAL ERROR: {bundle_path} is not a bundle this script can import.")
+            return {'completed': False, 'error': f"{bundle_path} is not a supported bundle"}
+        print(f"Importing {bundle_path} ({manifest['schema']} export of {manifest['created_at']}) into {target_name}...")
+
+        os.makedirs(os.path.dirname(os.path.abspath(paths.new_db)), exist_ok=True)
+        if build in ('partial', 'direct'):
+            build_path = paths.partial_db if build == 'partial' else paths.new_db
+            remove_database_file(build_path)
+            new_conn = sqlite3.connect(build_path)
+        else:
+            new_conn = open_build_database(build)
+        if os.path.exists(paths.sync_index):
+            remove_database_file(paths.sync_index)
+        apply_bulk_load_pragmas(new_conn)
+        create_new_db_schema(new_conn, with_triggers=False)
+        cache = AssetCache(paths.asset_cache)
+        failed_assets = FailedAssetLog(paths.failed_assets, keep=False)
+        names = set(bundle.namelist())
+        counts = {}
+        try:
+            for spec in build_table_specs(paths):
+                if f'tables/{spec.name}.ndjson' not in names:
+                    continue
+                for asset in spec.assets.values():
+                    os.makedirs(asset.folder, exist_ok=True)
+                counts[spec.name] = insert_rows(
+                    new_conn, spec.insert_sql, bundle_import_rows(spec, bundle, failed_assets),
+                    describe=lambda values, spec=spec: spec.describe(dict(zip(spec.columns, values))),
+                )
+                print(f"  -> {spec.name}: {counts[spec.name]} rows imported.")
+            if 'assets/cache.ndjson' in names:
+                for line in read_ndjson(bundle, 'assets/cache.ndjson'):
+                    cache.put(line['key'], line['entry'])
+            create_new_db_triggers(new_conn)
+            new_conn.commit()
+            if build in ('memory', 'temp'):
+                save_database(new_conn, paths.new_db)
+        finally:
+            new_conn.close()
+            cache.save()
+            failed_assets.save()
+        if build == 'partial':
+            publish_database(paths.partial_db, paths.new_db)
+
+    print(f"Imported {sum(counts.values())} rows into {target_name}, "
+          f"{METRICS.counters['bytes_copied'] / 1048576:.1f} MiB of images copied.")
+    if len(failed_assets):
+        print(f"Images the exporting install never stored: {len(failed_assets)}, listed in {paths.failed_assets}")
+        print("Run the script again with 'refetch' to download them.")
+    return {'completed': True, 'counts': counts}
+
+# --- Batch Mode ---
+
+def find_legacy_databases(folder):
+    """
+    Returns every legacy '*.db' file below 'folder', sorted. Migrated targets
+    ('*.v1.db') are skipped.
+    """
+    found = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.endswith('.db') and not name.endswith('.v1.db'):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+def batch_jobs_from_folder(source_folder, output_folder):
+    """
+    One MigrationPaths per legacy database below 'source_folder', each migrating into
+    its own '<output_folder>/<name>/database.v1.db' with its own uploads and caches.
+    """
+    jobs = []
+    for old_db in find_legacy_databases(source_folder):
+        name = os.path.splitext(os.path.relpath(old_db, source_folder))[0].replace(os.sep, '__')
+        jobs.append(MigrationPaths.for_target(old_db, os.path.join(output_folder, name, 'database.v1.db')))
+    return jobs
+
+def run_batch_job(paths, options):
+    """
+    Process pool entry point: runs one migration with its console output written to
+    '<target>.log' next to the target, and returns its report with the job's paths.
+    """
+    log_path = f"{os.path.splitext(paths.new_db)[0]}.log"
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    with open(log_path, 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        try:
+            report = run_migration(paths=paths, **options)
+        except Exception as e:
+            print(f"\n!!! CRITICAL MIGRATION ERROR: {e}")
+            report = {'completed': False, 'error': str(e)}
+    return {'source': paths.old_db, 'target': paths.new_db, 'log': log_path, **report}
+
+def run_batch(jobs, workers=None, report_path=None, **options):
+    """
+    Migrates every MigrationPaths in 'jobs' without prompts, up to 'workers' (default:
+    BATCH_WORKERS) at a time in separate processes. 'options' are passed on to
+    run_migration() (resume, profile, normalize_images, verify, duplicate_policy, build,
+    shards). A job whose
+    verification fails counts as failed.
+
+    Returns the consolidated report of all jobs, also written to 'report_path' if given.
+    Targets must be in different folders, because uploads and caches live next to them.
+    """
+    target_folders = [os.path.dirname(os.path.abspath(job.new_db)) for job in jobs]
+    shared_folders = sorted({folder for folder in target_folders if target_folders.count(folder) > 1})
+    if shared_folders:
+        raise ValueError(f"Every target needs its own folder, shared by several jobs: {', '.join(shared_folders)}")
+
+    started = time.perf_counter()
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=min(workers or BATCH_WORKERS, len(jobs)) or 1) as executor:
+        futures = {executor.submit(run_batch_job, job, options): index for index, job in enumerate(jobs)}
+        for finished, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception as e: # e.g. a worker process died
+                result = {'source': jobs[index].old_db, 'target': jobs[index].new_db, 'completed': False, 'error': str(e)}
+            if result['completed'] and not result.get('verification', {'ok': True})['ok']:
+                result['completed'] = False
+                result['error'] = "Verification failed"
+            results[index] = result
+
+            rows = sum(result.get('counts', {}).values())
+            status = "✅" if result['completed'] else "❌"
+            detail = f"{rows} rows in {result.get('seconds', 0):.1f}s" if result['completed'] else f"FAILED: {result.get('error')}"
+            print(f"[{finished}/{len(jobs)}] {status} {result['source']} -> {result['target']}: {detail}")
+
+    report = {
+        'started_at': get_timestamp(),
+        'seconds': round(time.perf_counter() - started, 3),
+        'jobs': len(jobs),
+        'completed': sum(1 for result in results if result['completed']),
+        'failed': sum(1 for result in results if not result['completed']),
+        'rows_written': sum(result.get('counters', {}).get('rows_written', 0) for result in results),
+        'skipped_rows': sum(result.get('counters', {}).get('skipped_rows', 0) for result in results),
+        'results': results,
+    }
+    if report_path:
+        try:
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            print(f"  -> WARNING: Could not write batch report '{report_path}'. Error: {e}")
+    return report
+
+
+# --- Main Execution ---\
+
+def command_paths(source=None, target=None):
+    """
+    Returns the MigrationPaths of the command line's --source and --target: the install
+    configured above, or everything next to 'target' when one is given.
+    """
+    if target:
+        return MigrationPaths.for_target(source or OLD_DB_PATH, target)
+    paths = MigrationPaths.from_config()
+    paths.old_db = source or OLD_DB_PATH
+    return paths
+
+if __name__ == "__main__":
+    # Options shared by the interactive migration and batch mode
+    options_parser = argparse.ArgumentParser(add_help=False)
+    options_parser.add_argument('--resume', action='store_true',
+                                help=f"continue an interrupted migration in {os.path.basename(NEW_DB_PATH)} instead of rebuilding it")
+    options_parser.add_argument('--profile', action='store_true',
+                                help="profile every stage with cProfile/tracemalloc (slower; results go to the migrator_profile folder)")
+    options_parser.add_argument('--normalize-images', action='store_true', default=None,
+                                help="shrink avatars/logos to the HUD sizes and re-encode them (needs Pillow)")
+    options_parser.add_argument('--verify', action='store_true',
+                                help="check the new database against the old one after migrating (see the 'verify' command)")
+    options_parser.add_argument('--duplicates', choices=DUPLICATE_POLICIES, default=None,
+                                help=f"which legacy row wins when several share a unique key: the first, the last or "
+                                     f"the newest by updatedAt (default: {DUPLICATE_POLICY})")
+    options_parser.add_argument('--build', choices=TARGET_BUILDS, default=None,
+                                help=f"build the new database in a .partial file next to it, in memory or in a temp file and "
+                                     f"swap it in once complete, or write it directly in place (default: {TARGET_BUILD})")
+    options_parser.add_argument('--shards', type=int, default=None, metavar='N',
+                                help=f"migrate large player/team tables in N worker processes, each into its own shard "
+                                     f"database merged into the target (default: {SHARD_WORKERS}, i.e. off)")
+
+    # Options shared by several commands. Each is defined once and only set when given, so
+    # a value given before the command name is not reset by the command's default.
+    source_parser = argparse.ArgumentParser(add_help=False)
+    source_parser.add_argument('--source', default=argparse.SUPPRESS, help=f"legacy database (default: {OLD_DB_PATH})")
+    target_parser = argparse.ArgumentParser(add_help=False)
+    target_parser.add_argument('--target', default=argparse.SUPPRESS,
+                               help=f"migrated database; its uploads, asset cache and reports are next to it "
+                                    f"(default: {NEW_DB_PATH})")
+    report_parser = argparse.ArgumentParser(add_help=False)
+    report_parser.add_argument('--report', metavar='PATH', default=argparse.SUPPRESS,
+                               help=f"where to write the JSON report: a migration's metrics (default: "
+                                    f"{os.path.basename(METRICS_REPORT_PATH)} next to the target), the --plan result, "
+                                    f"the consolidated 'batch' report (default: migrator_batch_report.json in "
+                                    f"--output-dir or the current folder) or the 'verify' result (default: none)")
+
+    parser = argparse.ArgumentParser(description="Migrates the old OpenHud database.db into database.v1.db.",
+                                     parents=[options_parser, source_parser, target_parser, report_parser])
+    parser.add_argument('--plan', action='store_true',
+                        help="only report what the migration would do (rows, conflicts, assets) without writing anything")
+    parser.add_argument('--probe', action='store_true',
+                        help="with --plan: send HEAD requests to a few URLs per host to estimate the download")
+    commands = parser.add_subparsers(dest='command')
+    batch_parser = commands.add_parser(
+        'batch', parents=[options_parser, report_parser],
+        help="migrate many legacy databases in parallel without any prompts",
+        description="Migrates many legacy databases in parallel without any prompts. Every target gets its "
+                    "own folder with its uploads, asset cache, metrics report and log.",
+    )
+    batch_parser.add_argument('--job', nargs=2, action='append', default=[], metavar=('SOURCE', 'TARGET'),
+                              help="migrate SOURCE into TARGET (repeatable; targets must be in different folders)")
+    batch_parser.add_argument('--source-dir', help="migrate every legacy *.db file below this folder")
+    batch_parser.add_argument('--output-dir', help="with --source-dir: where to create one target folder per database")
+    batch_parser.add_argument('--workers', type=int, default=None,
+                              help=f"migrations to run at the same time (default: {BATCH_WORKERS})")
+    refetch_parser = commands.add_parser(
+        'refetch', parents=[target_parser],
+        help="retry the image downloads a migration recorded as failed",
+        description="Retries the avatars/logos listed in migrator_failed_assets.json next to the migrated "
+                    "database and fills them into the rows that are still missing them.",
+    )
+    refetch_parser.add_argument('--normalize-images', action='store_true', default=None,
+                                help="shrink and re-encode the images like the migration did (needs Pillow)")
+    verify_parser = commands.add_parser(
+        'verify', parents=[source_parser, target_parser, report_parser],
+        help="check a migrated database against the legacy one",
+        description="Compares every table of the legacy and migrated databases by key and value fingerprints "
+                    "and checks the avatar/logo files. Neither database is modified.",
+    )
+    verify_parser.add_argument('--allow-missing', action='store_true',
+                               help="tolerate legacy rows missing from the target (records the migration skipped)")
+    verify_parser.add_argument('--duplicates', choices=DUPLICATE_POLICIES, default=None,
+                               help=f"the --duplicates policy the migration used (default: {DUPLICATE_POLICY})")
+    sync_parser = commands.add_parser(
+        'sync', parents=[source_parser, target_parser],
+        help="keep the migrated database up to date while the legacy one is still in use",
+        description="Watches the legacy database and writes only new, changed and deleted rows (with their "
+                    "avatars/logos) into the migrated one, until Ctrl-C.",
+    )
+    sync_parser.add_argument('--interval', type=float, default=None,
+                             help=f"seconds between checks for changes (default: {SYNC_INTERVAL})")
+    sync_parser.add_argument('--once', action='store_true', help="sync once and exit instead of watching")
+    sync_parser.add_argument('--normalize-images', action='store_true', default=None,
+                             help="shrink and re-encode the images like the migration does (needs Pillow)")
+    sync_parser.add_argument('--duplicates', choices=DUPLICATE_POLICIES, default=None,
+                             help=f"which legacy row wins when several share a unique key (default: {DUPLICATE_POLICY})")
+    export_parser = commands.add_parser(
+        'export', parents=[source_parser, target_parser],
+        help="write a legacy or migrated database with its images into one portable bundle file",
+        description="Writes --source, a legacy or migrated database, as NDJSON per table plus the avatar/logo "
+                    "files (each stored once, taken from the uploads and asset cache of --target) into a zip "
+                    "bundle that 'import' turns into a database.v1.db on another machine. Nothing is downloaded.",
+    )
+    export_parser.add_argument('bundle', help="bundle file to write")
+    export_parser.add_argument('--schema', choices=('legacy', 'v1'), default=None,
+                               help="schema of --source (default: detected)")
+    export_parser.add_argument('--duplicates', choices=DUPLICATE_POLICIES, default=None,
+                               help=f"which legacy row wins when several share a unique key (default: {DUPLICATE_POLICY})")
+    import_parser = commands.add_parser(
+        'import', parents=[target_parser],
+        help="create the migrated database from an 'export' bundle",
+        description="Creates database.v1.db and its uploads from a bundle written by 'export', without "
+                    "any network access.",
+    )
+    import_parser.add_argument('bundle', help="bundle file to read")
+    import_parser.add_argument('--replace', action='store_true', help="overwrite an existing target database")
+    import_parser.add_argument('--build', choices=TARGET_BUILDS, default=None,
+                               help=f"build the database next to the target, in memory, in a temp file or in place "
+                                    f"(default: {TARGET_BUILD})")
+    # Not parser.set_defaults(): it would change the default of the shared options too
+    args = parser.parse_args(namespace=argparse.Namespace(source=None, target=None, report=None))
+    paths = command_paths(args.source, args.target)
+
+    if args.command == 'refetch':
+        result = refetch_failed_assets(paths, normalize_images=args.normalize_images)
+        sys.exit(1 if result['failed'] else 0)
+
+    if args.command == 'sync':
+        result = sync_migration(paths, args.interval, args.once, args.normalize_images, args.duplicates)
+        sys.exit(0 if result['ok'] else 1)
+
+    if args.command == 'export':
+        if not os.path.exists(paths.old_db):
+            print(f"FATAL ERROR: Database file not found at {paths.old_db}")
+            sys.exit(1)
+        export_bundle(args.bundle, paths, schema=args.schema, duplicate_policy=args.duplicates)
+        sys.exit(0)
+
+    if args.command == 'import':
+        result = import_bundle(args.bundle, paths, replace=args.replace, build=args.build)
+        sys.exit(0 if result['completed'] else 1)
+
+    if args.command == 'verify':
+        report = verify_migration(paths, allow_missing=args.allow_missing, duplicate_policy=args.duplicates)
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        sys.exit(0 if report['ok'] else 1)
+
+    if args.command == 'batch':
+        if args.source_dir and not args.output_dir:
+            batch_parser.error("--source-dir needs --output-dir")
+        jobs = [MigrationPaths.for_target(source, target) for source, target in args.job]
+        if args.source_dir:
+            jobs += batch_jobs_from_folder(args.source_dir, args.output_dir)
+        if not jobs:
+            batch_parser.error("nothing to migrate: pass --job SOURCE TARGET and/or --source-dir with --output-dir")
+
+        report_path = args.report or os.path.join(args.output_dir or '.', 'migrator_batch_report.json')
+        print(f"Migrating {len(jobs)} database(s), up to {args.workers or BATCH_WORKERS} at a time...")
+        try:
+            report = run_batch(jobs, args.workers, report_path, resume=args.resume, profile=args.profile,
+                               normalize_images=args.normalize_images, verify=args.verify,
+                               duplicate_policy=args.duplicates, build=args.build, shards=args.shards)
+        except ValueError as e:
+            batch_parser.error(str(e))
+
+        print("\n-------------------------------------------")
+        print(f"Batch finished in {report['seconds']:.1f}s: {report['completed']} completed, {report['failed']} failed.")
+        print(f"Rows written: {report['rows_written']}, rows skipped: {report['skipped_rows']}")
+        print(f"Consolidated report: {report_path}")
+        print("-------------------------------------------")
+        sys.exit(1 if report['failed'] else 0)
+
+    if args.plan:
+        plan = plan_migration(paths, probe=args.probe, duplicate_policy=args.duplicates)
+        if args.report: # only when asked for, the plan writes nothing by default
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(plan, f, indent=2)
+        sys.exit(0 if plan['ok'] else 1)
+
+    if not os.path.exists(paths.old_db):
+        print(f"FATAL ERROR: Old database file not found at {paths.old_db}")
+        print("Please ensure the old file is at %APPDATA%/openhud/database.db")
+    else:
+        # Playwright is optional: without it, URLs that refuse plain HTTP downloads are skipped
+        if sync_playwright is None:
+            print("NOTE: Playwright is not installed. Protected image URLs cannot fall back to a browser.")
+            print("To enable the fallback run: 'pip install playwright' and 'playwright install'")
+        if (args.normalize_images or NORMALIZE_IMAGES) and Image is None:
+            print("NOTE: Pillow is not installed. Images will be stored without normalization.")
+            print("To enable it run: 'pip install Pillow'")
+
+        # --- WARNING AND CONFIRMATION ---
+        print("=" * 70)
+        print("                ⚠️ WARNING: DATABASE MIGRATION ⚠️")
+        print("=" * 70)
+        print("This file migrates the old database.db file into the newer database.v1.db.")
+        if args.resume:
+            print(f"1. This script will **CONTINUE** an interrupted migration in: {os.path.basename(paths.new_db)}, the old file should be safe")
+            print("2. Tables and rows that were already written are skipped.")
+        elif (args.build or TARGET_BUILD) == 'direct':
+            print(f"1. This script will **DELETE** any existing file named: {os.path.basename(paths.new_db)}, the old file should be safe")
+            print("2. It will then generate a new 'database.v1.db' from the old 'database.db' in its place.")
+        else:
+            print(f"1. This script will **REPLACE** any existing file named: {os.path.basename(paths.new_db)}, the old file should be safe")
+            print("2. The new 'database.v1.db' is generated from the old 'database.db' in a separate file first and")
+            print("   swapped in only once it is complete; an interrupted run leaves the existing file as it was.")
+            print("3. Close OpenHud before proceeding: a database that is open in it is not replaced.")
         print("\n🚨 Please keep a **backup copy** of your original **database.db** file just in case.")
         print("=" * 70)
         
@@ -556,8 +4311,10 @@ if __name__ == "__main__":
         proceed = input("Proceed? (y/n)")
         
         if proceed == 'y' or proceed == 'Y':
-            run_migration() 
+            run_migration(resume=args.resume, profile=args.profile, report_path=args.report,
+                          normalize_images=args.normalize_images, paths=paths, verify=args.verify,
+                          duplicate_policy=args.duplicates, build=args.build, shards=args.shards)
         else:
             print("\nMigration aborted. The database files have not been modified.")
             
-    input("\nPress ENTER to close the window...")
\ No newline at end of file
+    input("\nPress ENTER to close the window...")
@@ -0,0 +1,494 @@
+import argparse
+import atexit
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:
+    # Windows: peak RSS is not available, tracemalloc numbers still are
+    resource = None
+
+# --- Benchmark Setup ---
+# Every run passes explicit paths inside scratch_dir(), never migrator.py's defaults.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import migrator
+
+_scratch_dir = None
+
+def scratch_dir():
+    """
+    Returns the benchmarks' scratch folder. Created on first use, so importing this
+    module (e.g. from the tests) leaves nothing behind, and removed when Python exits.
+    """
+    global _scratch_dir
+    if _scratch_dir is None:
+        _scratch_dir = tempfile.mkdtemp(prefix='openhud-bench-')
+        atexit.register(shutil.rmtree, _scratch_dir, ignore_errors=True)
+    return _scratch_dir
+
+# Legacy values that clean_extra_field() has to repair
+CORRUPT_JSON_VALUES = ('[object Object]', 'undefined', '', '{broken', None)
+
+MATCH_TYPES = ('bo1', 'bo2', 'bo3', 'bo5')
+
+
+# --- Synthetic Legacy Database ---
+
+def make_payload(name, size):
+    """
+    Returns 'size' bytes that start like a PNG and are unique per 'name', so every URL
+    or local file maps to its own content-addressed file.
+    """
+    seed = hashlib.sha256(name.encode()).digest()
+    body = seed * (max(size - 8, 0) // len(seed) + 1)
+    return (b'\x89PNG\r\n\x1a\n' + body)[:max(size, 8)]
+
+def create_legacy_db(path, players=1000, teams=100, coaches=50, matches=200,
+                     corrupt_rate=0.05, duplicate_rate=0.01, remote_rate=0.5, local_rate=0.2,
+                     missing_rate=0.05, unique_assets=200, base_url=None, local_asset_dir=None,
+                     local_asset_bytes=30000, seed=1):
+    """
+    Writes a synthetic legacy database.db to 'path' and returns the row count per table.
+    The same arguments and 'seed' always produce the same database.
+
+    - 'corrupt_rate' of the extra/vetos values are corrupt ('[object Object]', bad JSON, ...).
+    - 'duplicate_rate' of the rows reuse an earlier row's key (_id, username or steamid).
+    - Each avatar/logo is a URL under 'base_url' with 'remote_rate', a file in
+      'local_asset_dir' with 'local_rate' (both drawn from 'unique_assets' sources),
+      a missing local path with 'missing_rate', and empty otherwise.
+    """
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    if not base_url:
+        remote_rate = 0
+    if not local_asset_dir:
+        local_rate = 0
+
+    if local_rate:
+        os.makedirs(local_asset_dir, exist_ok=True)
+        for n in range(unique_assets):
+            local_path = os.path.join(local_asset_dir, f'asset-{n}.png')
+            if not os.path.exists(local_path):
+                with open(local_path, 'wb') as f:
+                    f.write(make_payload(f'local-{n}', local_asset_bytes))
+
+    def asset_source(kind):
+        roll = rng.random()
+        if roll < remote_rate:
+            return f"{base_url}/{kind}/{rng.randrange(unique_assets)}.png"
+        if roll < remote_rate + local_rate:
+            return os.path.join(local_asset_dir, f'asset-{rng.randrange(unique_assets)}.png')
+        if roll < remote_rate + local_rate + missing_rate:
+            return os.path.join(folder, 'missing-assets', f'{rng.randrange(10 ** 6)}.png')
+        return None
+
+    def json_value(valid):
+        if rng.random() < corrupt_rate:
+            return rng.choice(CORRUPT_JSON_VALUES)
+        return valid
+
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE players (
+            _id TEXT, firstName TEXT, lastName TEXT, username TEXT, avatar TEXT,
+            country TEXT, steamid TEXT, team TEXT, extra TEXT
+        );
+        CREATE TABLE teams (_id TEXT, name TEXT, shortName TEXT, country TEXT, logo TEXT, extra TEXT);
+        CREATE TABLE coaches (steamid TEXT);
+        CREATE TABLE matches (
+            id TEXT, current INTEGER, left_id TEXT, left_wins INTEGER, right_id TEXT,
+            right_wins INTEGER, matchType TEXT, vetos TEXT
+        );
+    ''')
+
+    team_ids = [f'team-{n:07d}' for n in range(teams)]
+
+    def team_rows():
+        for n, team_id in enumerate(team_ids):
+            if n and rng.random() < duplicate_rate:
+                team_id = team_ids[rng.randrange(n)]
+            yield (team_id, f'Team {n}', f'T{n}', 'UA', asset_source('logos'), json_value('{"tier": 1}'))
+
+    def player_rows():
+        for n in range(players):
+            row = [f'player-{n:08d}', 'First', 'Last', f'user{n}', asset_source('avatars'),
+                   'UA', f'7656119{n:010d}', rng.choice(team_ids) if team_ids else None,
+                   json_value('{"role": "rifler"}')]
+            if n and rng.random() < duplicate_rate:
+                # Collide with an earlier player on one of the target's UNIQUE columns
+                earlier = rng.randrange(n)
+                column = rng.choice((0, 3, 6))
+                row[column] = (f'player-{earlier:08d}', None, None, f'user{earlier}', None, None, f'7656119{earlier:010d}')[column]
+            yield row
+
+    def coach_rows():
+        for n in range(coaches):
+            steamid = n
+            if n and rng.random() < duplicate_rate:
+                steamid = rng.randrange(n)
+            yield (f'7656119{steamid:010d}',)
+
+    def match_rows():
+        for n in range(matches):
+            match_id = n
+            if n and rng.random() < duplicate_rate:
+                match_id = rng.randrange(n)
+            yield (
+                f'match-{match_id:07d}',
+                rng.choice((0, 1, 'true', 'false', None)),
+                rng.choice(team_ids) if team_ids else None,
+                rng.randrange(3),
+                rng.choice(team_ids) if team_ids else None,
+                rng.randrange(3),
+                rng.choice(MATCH_TYPES),
+                json_value('[{"mapName": "de_mirage", "type": "pick"}]'),
+            )
+
+    conn.executemany('INSERT INTO teams VALUES (?, ?, ?, ?, ?, ?)', team_rows())
+    conn.executemany('INSERT INTO players VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', player_rows())
+    conn.executemany('INSERT INTO coaches VALUES (?)', coach_rows())
+    conn.executemany('INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?)', match_rows())
+    conn.commit()
+    conn.close()
+    return {'players': players, 'teams': teams, 'coaches': coaches, 'matches': matches}
+
+
+# --- Local HTTP Asset Server ---
+
+class AssetServer:
+    """
+    Threaded local stand-in for remote avatar/logo hosts.
+
+    Every GET waits 'latency' seconds (plus up to 'jitter'), fails with 503 at
+    'error_rate' and otherwise returns 'payload_bytes' of image data with an ETag,
+    answering 304 to a matching If-None-Match. Request counters are kept in 'stats'.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, error_rate=0.0, payload_bytes=30000, port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payload_bytes = payload_bytes
+        self.stats = {'requests': 0, 'errors': 0, 'not_modified': 0, 'bytes_sent': 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send_empty(self, status, etag=None):
+                self.send_response(status)
+                if etag:
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_HEAD(self):
+                server._count('requests')
+                time.sleep(server.latency + random.random() * server.jitter)
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(server.payload_bytes))
+                self.end_headers()
+
+            def do_GET(self):
+                server._count('requests')
+                time.sleep(server.latency + random.random() * server.jitter)
+
+                if random.random() < server.error_rate:
+                    server._count('errors')
+                    self._send_empty(503)
+                    return
+
+                etag = f'"{hashlib.sha256(self.path.encode()).hexdigest()[:16]}"'
+                if self.headers.get('If-None-Match') == etag:
+                    server._count('not_modified')
+                    self._send_empty(304, etag)
+                    return
+
+                body = make_payload(self.path, server.payload_bytes)
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+                server._count('bytes_sent', len(body))
+
+            def log_message(self, *args):
+                pass # keep benchmark output readable
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name='asset-server', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# --- Migration Runner ---
+
+def count_files(folder):
+    return len(os.listdir(folder)) if os.path.isdir(folder) else 0
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def run_benchmark(args):
+    """
+    Generates a legacy DB, serves its remote assets locally and times run_migration()
+    against it. Prints a summary and returns the results (also written as JSON to
+    'args.report' when set).
+    """
+    server = AssetServer(args.latency, args.jitter, args.error_rate, args.payload_kb * 1024).start()
+    run_dir = os.path.join(scratch_dir(), 'run')
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+
+    paths = migrator.MigrationPaths.for_target(
+        os.path.join(run_dir, 'database.db'), os.path.join(run_dir, 'database.v1.db')
+    )
+    if args.download_workers:
+        migrator.DOWNLOAD_WORKERS = args.download_workers
+    if args.page_size:
+        migrator.READ_PAGE_SIZE = args.page_size
+
+    sizes = create_legacy_db(
+        paths.old_db, args.players, args.teams, args.coaches, args.matches,
+        args.corrupt_rate, args.duplicate_rate, args.remote_rate, args.local_rate,
+        args.missing_rate, args.unique_assets, server.base_url,
+        os.path.join(scratch_dir(), 'local-assets'), args.payload_kb * 1024, args.seed,
+    )
+
+    migrator_output = io.StringIO()
+    if not args.profile: # run_migration() traces memory itself when profiling
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else migrator_output):
+            migrator.run_migration(profile=args.profile, paths=paths)
+    finally:
+        elapsed = time.perf_counter() - started
+        if not args.profile:
+            _, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        server.stop()
+    metrics = migrator.METRICS.report()
+    if args.profile:
+        traced_peak = max(table.get('peak_traced_bytes', 0) for table in metrics['tables'].values())
+
+    new_conn = sqlite3.connect(paths.new_db)
+    migrated = {table: migrator.count_rows(new_conn, table) for table in sizes}
+    asset_refs = (
+        new_conn.execute('SELECT COUNT(avatar) FROM players').fetchone()[0]
+        + new_conn.execute('SELECT COUNT(logo) FROM teams').fetchone()[0]
+    )
+    new_conn.close()
+    stored_files = count_files(paths.player_avatar_folder) + count_files(paths.teams_avatar_folder)
+    total_rows = sum(migrated.values())
+
+    results = {
+        'sizes': sizes,
+        'migrated': migrated,
+        'seconds': elapsed,
+        'rows_per_second': total_rows / elapsed,
+        'asset_refs': asset_refs,
+        'stored_files': stored_files,
+        'assets_per_second': asset_refs / elapsed,
+        'table_seconds': {name: table['seconds'] for name, table in metrics['tables'].items()},
+        'stages': metrics['stages'],
+        'counters': metrics['counters'],
+        'peak_traced_bytes': traced_peak,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'http': dict(server.stats),
+        'settings': {key: value for key, value in vars(args).items() if key != 'command'},
+    }
+
+    print("\n-------------------------------------------")
+    print(f"Benchmark: {sizes['players']} players, {sizes['teams']} teams, {sizes['coaches']} coaches, {sizes['matches']} matches")
+    print(f"Total time: {elapsed:.2f} s")
+    print(f"Rows/s: {results['rows_per_second']:.0f} ({total_rows} rows migrated)")
+    print(f"Assets/s: {results['assets_per_second']:.1f} ({asset_refs} references, {stored_files} files stored)")
+    print("Per table:")
+    for table, seconds in results['table_seconds'].items():
+        print(f"  {table:<10} {seconds:>8.2f} s")
+    print("Per stage (summed over threads):")
+    for stage, stage_metrics in metrics['stages'].items():
+        print(f"  {stage:<10} {stage_metrics['seconds']:>8.2f} s {stage_metrics['calls']:>8} calls")
+    print(f"Counters: {', '.join(f'{name} {value}' for name, value in metrics['counters'].items())}")
+    rss = results['peak_rss_bytes']
+    print(f"Peak memory: {traced_peak / 1048576:.1f} MiB traced" + (f", {rss / 1048576:.1f} MiB RSS" if rss else ''))
+    print(f"HTTP: {server.stats['requests']} requests, {server.stats['errors']} errors, "
+          f"{server.stats['not_modified']} not modified, {server.stats['bytes_sent'] / 1048576:.1f} MiB sent")
+    print("-------------------------------------------")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Report written to {args.report}")
+    return results
+
+
+# --- Memory Benchmark ---
+
+def measure_player_migration(player_count, page_size):
+    """
+    Migrates a synthetic players table of 'player_count' rows into a fresh target and
+    returns (seconds, peak_traced_bytes). Peak memory is tracked with tracemalloc.
+    """
+    old_path = os.path.join(scratch_dir(), f'legacy-{player_count}.db')
+    new_path = os.path.join(scratch_dir(), f'target-{player_count}.db')
+    # No avatars, corruption or duplicates, so only the read/clean/insert path is measured
+    create_legacy_db(old_path, players=player_count, teams=0, coaches=0, matches=0,
+                     corrupt_rate=0, duplicate_rate=0, missing_rate=0)
+    if os.path.exists(new_path):
+        os.remove(new_path)
+
+    players_spec = migrator.build_table_specs(migrator.MigrationPaths.for_target(old_path, new_path))[0]
+    old_conn = sqlite3.connect(old_path, check_same_thread=False)
+    new_conn = sqlite3.connect(new_path)
+    migrator.apply_bulk_load_pragmas(new_conn)
+    migrator.create_new_db_schema(new_conn, with_triggers=False)
+    context = migrator.MigrationContext()
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    migrated = migrator.migrate_table(players_spec, old_conn, new_conn, context, page_size=page_size)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    context.close()
+    old_conn.close()
+    new_conn.close()
+    if migrated != player_count:
+        print(f"  !!! WARNING: expected {player_count} migrated players, got {migrated}")
+    return elapsed, peak
+
+def run_memory_benchmark(sizes, page_size):
+    results = []
+    for player_count in sizes:
+        elapsed, peak = measure_player_migration(player_count, page_size)
+        results.append((player_count, elapsed, peak))
+
+    print("\n-------------------------------------------")
+    print(f"Memory benchmark (page size {page_size or migrator.READ_PAGE_SIZE})")
+    print(f"{'players':>10} {'seconds':>9} {'rows/s':>10} {'peak MiB':>9}")
+    for player_count, elapsed, peak in results:
+        print(f"{player_count:>10} {elapsed:>9.2f} {player_count / elapsed:>10.0f} {peak / 1048576:>9.2f}")
+
+    smallest_peak, largest_peak = results[0][2], results[-1][2]
+    growth = largest_peak / smallest_peak if smallest_peak else float('inf')
+    print(f"Peak growth from {results[0][0]} to {results[-1][0]} players: x{growth:.2f}")
+    print("-------------------------------------------")
+    return results
+
+
+# --- Main Execution ---
+
+def add_dataset_arguments(parser):
+    parser.add_argument('--players', type=int, default=5000)
+    parser.add_argument('--teams', type=int, default=300)
+    parser.add_argument('--coaches', type=int, default=100)
+    parser.add_argument('--matches', type=int, default=500)
+    parser.add_argument('--corrupt-rate', type=float, default=0.05, help="share of corrupt extra/vetos values")
+    parser.add_argument('--duplicate-rate', type=float, default=0.01, help="share of rows with a duplicate key")
+    parser.add_argument('--remote-rate', type=float, default=0.5, help="share of avatars/logos that are URLs")
+    parser.add_argument('--local-rate', type=float, default=0.2, help="share of avatars/logos that are local files")
+    parser.add_argument('--missing-rate', type=float, default=0.05, help="share of avatars/logos pointing at missing files")
+    parser.add_argument('--unique-assets', type=int, default=500, help="distinct URLs and local files to draw from")
+    parser.add_argument('--payload-kb', type=int, default=30, help="size of every served or local image")
+    parser.add_argument('--seed', type=int, default=1)
+
+def add_server_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds added to every request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many extra random seconds per request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered with 503")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for migrator.py")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Generate a legacy DB, serve its assets and time run_migration()")
+    add_dataset_arguments(run_parser)
+    add_server_arguments(run_parser)
+    run_parser.add_argument('--download-workers', type=int, default=None)
+    run_parser.add_argument('--page-size', type=int, default=None)
+    run_parser.add_argument('--report', help="also write the results as JSON to this file")
+    run_parser.add_argument('--verbose', action='store_true', help="show the migrator's own output")
+    run_parser.add_argument('--profile', action='store_true', help="run the migration with --profile (shown with --verbose)")
+
+    generate_parser = commands.add_parser('generate', help="Write a synthetic legacy database.db")
+    generate_parser.add_argument('path')
+    generate_parser.add_argument('--base-url', help="URL prefix for remote avatars/logos (e.g. from 'serve')")
+    generate_parser.add_argument('--local-asset-dir', help="folder for the generated local avatar/logo files")
+    add_dataset_arguments(generate_parser)
+
+    serve_parser = commands.add_parser('serve', help="Run the local asset server until Ctrl-C")
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--payload-kb', type=int, default=30)
+    add_server_arguments(serve_parser)
+
+    memory_parser = commands.add_parser('memory', help="Show that peak memory stays flat as the players table grows")
+    memory_parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 200000])
+    memory_parser.add_argument('--page-size', type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run_benchmark(args)
+    elif args.command == 'generate':
+        sizes = create_legacy_db(
+            args.path, args.players, args.teams, args.coaches, args.matches,
+            args.corrupt_rate, args.duplicate_rate, args.remote_rate, args.local_rate,
+            args.missing_rate, args.unique_assets, args.base_url, args.local_asset_dir,
+            args.payload_kb * 1024, args.seed,
+        )
+        print(f"Wrote {args.path}: {sizes}")
+    elif args.command == 'serve':
+        server = AssetServer(args.latency, args.jitter, args.error_rate, args.payload_kb * 1024, args.port).start()
+        print(f"Serving synthetic images at {server.base_url} (Ctrl-C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.stop()
+            print(f"Stopped. {server.stats}")
+    elif args.command == 'memory':
+        run_memory_benchmark(sorted(args.sizes), args.page_size)
@@ -0,0 +1,417 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from migrator_benchmark import AssetServer, create_legacy_db
+
+import migrator
+
+
+# --- Fixtures ---
+
+@pytest.fixture(autouse=True)
+def isolated_install(tmp_path, monkeypatch):
+    """
+    Points APPDATA and every install path migrator.py computed at import time into
+    'tmp_path', so no default can reach a real OpenHud install (APPDATA is always set
+    on Windows).
+    """
+    appdata = tmp_path / 'appdata'
+    monkeypatch.setenv('APPDATA', str(appdata))
+    monkeypatch.setattr(migrator, 'APPDATA_PATH', str(appdata))
+    install = migrator.MigrationPaths.for_target(str(appdata / 'openhud' / 'database.db'),
+                                                 str(appdata / 'openhud' / 'database.v1.db'))
+    for name, value in (('OLD_DB_PATH', install.old_db), ('NEW_DB_PATH', install.new_db),
+                        ('PLAYER_AVATAR_FOLDER', install.player_avatar_folder),
+                        ('TEAMS_AVATAR_FOLDER', install.teams_avatar_folder),
+                        ('ASSET_CACHE_PATH', install.asset_cache), ('METRICS_REPORT_PATH', install.report),
+                        ('PROFILE_FOLDER', install.profile_folder), ('FAILED_ASSETS_PATH', install.failed_assets)):
+        monkeypatch.setattr(migrator, name, value)
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    # Retries still happen, without the backoff sleeps
+    monkeypatch.setattr(migrator, 'RETRY_BACKOFF', 0)
+
+@pytest.fixture
+def server():
+    server = AssetServer(latency=0, payload_bytes=2000).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def legacy(tmp_path, server):
+    """
+    A small legacy database with remote, local, missing and duplicate assets and rows.
+    """
+    path = str(tmp_path / 'legacy' / 'database.db')
+    create_legacy_db(path, players=600, teams=60, coaches=20, matches=80, unique_assets=40,
+                     base_url=server.base_url, local_asset_dir=str(tmp_path / 'legacy' / 'local'),
+                     local_asset_bytes=2000, seed=7)
+    return path
+
+def target_paths(tmp_path, legacy, name='target'):
+    return migrator.MigrationPaths.for_target(legacy, str(tmp_path / name / 'database.v1.db'))
+
+def table_contents(db_path):
+    """
+    Every migrated table's rows without the migration timestamps, in key order.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        contents = {}
+        for spec in migrator.build_table_specs():
+            columns = [column for column in spec.columns if column not in spec.timestamp_columns]
+            contents[spec.name] = conn.execute(
+                f"SELECT {', '.join(columns)} FROM {spec.name} ORDER BY {spec.key}"
+            ).fetchall()
+        return contents
+    finally:
+        conn.close()
+
+
+# --- Downloads ---
+
+def test_players_and_teams_share_one_bounded_download_pool(tmp_path, legacy, server, monkeypatch):
+    monkeypatch.setattr(migrator, 'DOWNLOAD_WORKERS', 3)
+    fetch = migrator.AssetFetcher.fetch
+    lock = threading.Lock()
+    running = {'now': 0, 'peak': 0}
+    tables = set()
+
+    def slow_fetch(self, url, folder, validators=None):
+        with lock:
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+            tables.add(os.path.basename(folder))
+        try:
+            time.sleep(0.01)
+            return fetch(self, url, folder, validators)
+        finally:
+            with lock:
+                running['now'] -= 1
+
+    monkeypatch.setattr(migrator.AssetFetcher, 'fetch', slow_fetch)
+    paths = target_paths(tmp_path, legacy)
+    report = migrator.run_migration(paths=paths)
+    assert report['completed']
+    assert tables == {'player_pictures', 'team_logos'}
+    # Downloads overlap, but never more than DOWNLOAD_WORKERS at once across both tables
+    assert 1 < running['peak'] <= 3
+
+    conn = sqlite3.connect(paths.new_db)
+    stored = conn.execute("SELECT COUNT(*) FROM players WHERE avatar LIKE '%.png'").fetchone()[0]
+    conn.close()
+    assert stored > 0
+
+def test_5xx_is_retried_then_fails(server, tmp_path):
+    server.error_rate = 1.0
+    migrator.METRICS.reset()
+    fetcher = migrator.AssetFetcher()
+    try:
+        with pytest.raises(Exception, match='after 4 attempts'):
+            fetcher.fetch(f'{server.base_url}/avatars/1.png', str(tmp_path))
+    finally:
+        fetcher.close()
+    assert server.stats['requests'] == migrator.DOWNLOAD_RETRIES + 1
+    assert migrator.METRICS.counters['retries'] == migrator.DOWNLOAD_RETRIES
+
+def test_circuit_breaker_opens_and_recovers(server, tmp_path):
+    server.error_rate = 1.0
+    migrator.METRICS.reset()
+    hosts = migrator.HostScheduler(failure_threshold=2, cooldown=0.2)
+    fetcher = migrator.AssetFetcher(hosts=hosts)
+    try:
+        with pytest.raises(migrator.HostUnavailable):
+            fetcher.fetch(f'{server.base_url}/avatars/1.png', str(tmp_path))
+        assert server.stats['requests'] == 2
+        assert migrator.METRICS.counters['hosts_down'] == 1
+
+        # Other URLs of the host are skipped without a request while the circuit is open
+        with pytest.raises(migrator.HostUnavailable):
+            fetcher.fetch(f'{server.base_url}/avatars/2.png', str(tmp_path))
+        assert server.stats['requests'] == 2
+
+        # After the cooldown a trial request goes through and closes the circuit
+        server.error_rate = 0
+        time.sleep(0.25)
+        asset = fetcher.fetch(f'{server.base_url}/avatars/3.png', str(tmp_path))
+        asset.file.discard()
+        asset = fetcher.fetch(f'{server.base_url}/avatars/4.png', str(tmp_path))
+        asset.file.discard()
+    finally:
+        fetcher.close()
+    assert server.stats['requests'] == 4
+
+def test_failed_trial_request_does_not_block_the_host(server, tmp_path, monkeypatch):
+    server.error_rate = 1.0
+    hosts = migrator.HostScheduler(failure_threshold=2, cooldown=0.2)
+    fetcher = migrator.AssetFetcher(hosts=hosts)
+    try:
+        with pytest.raises(migrator.HostUnavailable):
+            fetcher.fetch(f'{server.base_url}/avatars/1.png', str(tmp_path))
+
+        # The trial request after the cooldown is refused for its announced size
+        server.error_rate = 0
+        time.sleep(0.25)
+        monkeypatch.setattr(migrator, 'MAX_ASSET_BYTES', server.payload_bytes - 1)
+        with pytest.raises(migrator.AssetTooLarge):
+            fetcher.fetch(f'{server.base_url}/avatars/2.png', str(tmp_path))
+
+        # That said nothing about the host: the next request is the new trial
+        monkeypatch.setattr(migrator, 'MAX_ASSET_BYTES', server.payload_bytes)
+        for n in (3, 4):
+            asset = fetcher.fetch(f'{server.base_url}/avatars/{n}.png', str(tmp_path))
+            asset.file.discard()
+    finally:
+        fetcher.close()
+    assert server.stats['requests'] == 5
+
+class FakePlaywright:
+    """
+    Stands in for sync_playwright(): records starts/stops and serves 'body' for every
+    page, or fails the Chromium launch with 'launch_error'.
+    """
+
+    def __init__(self, launch_error=None, body=b'', headers=None):
+        self.launch_error = launch_error
+        self._body = body
+        self.status = 200
+        self.headers = headers or {'content-type': 'image/png'}
+        self.starts = self.stops = 0
+        self.chromium = self
+
+    def __call__(self):
+        return self
+
+    def start(self):
+        self.starts += 1
+        return self
+
+    def stop(self):
+        self.stops += 1
+
+    def launch(self):
+        if self.launch_error:
+            raise self.launch_error
+        return self
+
+    def new_context(self):
+        return self
+
+    def new_page(self):
+        return self
+
+    def set_extra_http_headers(self, headers):
+        pass
+
+    def goto(self, url, **kwargs):
+        return self
+
+    def body(self):
+        return self._body
+
+    def close(self):
+        pass
+
+def refusing_fetcher():
+    fetcher = migrator.AssetFetcher()
+    def refuse(url, folder, validators):
+        raise migrator.DownloadRefused("HTTP status 403 (text/html)")
+    fetcher._fetch_http = refuse
+    return fetcher
+
+def test_failed_browser_launch_is_torn_down_and_not_retried(tmp_path, monkeypatch):
+    playwright = FakePlaywright(launch_error=RuntimeError("Executable doesn't exist"))
+    monkeypatch.setattr(migrator, 'sync_playwright', playwright)
+    fetcher = refusing_fetcher()
+    try:
+        for n in range(3):
+            with pytest.raises(Exception, match="Executable doesn't exist"):
+                fetcher.fetch(f'http://example.invalid/{n}.png', str(tmp_path))
+    finally:
+        fetcher.close()
+    assert playwright.starts == 1
+    assert playwright.stops == 1
+
+def test_browser_downloads_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(migrator, 'MAX_ASSET_BYTES', 100)
+    monkeypatch.setattr(migrator, 'sync_playwright', FakePlaywright(body=b'x' * 101))
+    fetcher = refusing_fetcher()
+    try:
+        with pytest.raises(migrator.AssetTooLarge):
+            fetcher.fetch('http://example.invalid/big.png', str(tmp_path))
+    finally:
+        fetcher.close()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+def test_stale_cache_entries_are_revalidated_with_etag(tmp_path, legacy, server, monkeypatch):
+    paths = target_paths(tmp_path, legacy)
+    first = migrator.run_migration(paths=paths)
+    assert first['completed']
+    assert first['counters']['bytes_downloaded'] > 0
+
+    # Every cache entry is now stale: a rebuild asks the server, which answers 304
+    monkeypatch.setattr(migrator, 'ASSET_CACHE_MAX_AGE', 0)
+    server.stats['not_modified'] = 0
+    second = migrator.run_migration(paths=paths)
+    assert second['completed']
+    assert second['counters']['not_modified'] > 0
+    assert second['counters']['not_modified'] == server.stats['not_modified']
+    assert second['counters']['bytes_downloaded'] == 0
+    assert migrator.verify_migration(paths, allow_missing=True)['ok']
+
+
+# --- Migration ---
+
+def test_interrupted_migration_resumes(tmp_path, legacy, monkeypatch):
+    expected_paths = target_paths(tmp_path, legacy, 'expected')
+    assert migrator.run_migration(paths=expected_paths)['completed']
+
+    monkeypatch.setattr(migrator, 'INSERT_BATCH_SIZE', 50)
+    record = migrator.MigrationCheckpoint.record
+    calls = []
+
+    def crash_after_some_batches(self, table, last_rowid):
+        calls.append(table)
+        if table == 'players' and calls.count('players') == 4:
+            raise KeyboardInterrupt
+        record(self, table, last_rowid)
+
+    paths = target_paths(tmp_path, legacy)
+    monkeypatch.setattr(migrator.MigrationCheckpoint, 'record', crash_after_some_batches)
+    interrupted = migrator.run_migration(paths=paths)
+    assert not interrupted['completed']
+    assert not os.path.exists(paths.new_db)
+    assert os.path.exists(paths.partial_db)
+    conn = sqlite3.connect(paths.partial_db)
+    assert conn.execute('SELECT last_rowid FROM _migration_checkpoint WHERE table_name = ?', ('players',)).fetchone()
+    conn.close()
+
+    monkeypatch.setattr(migrator.MigrationCheckpoint, 'record', record)
+    resumed = migrator.run_migration(resume=True, paths=paths)
+    assert resumed['completed']
+    assert not os.path.exists(paths.partial_db)
+    assert table_contents(paths.new_db) == table_contents(expected_paths.new_db)
+    assert migrator.verify_migration(paths, allow_missing=True)['ok']
+
+def test_target_open_in_wal_mode_is_not_replaced(tmp_path, legacy):
+    paths = target_paths(tmp_path, legacy)
+    os.makedirs(os.path.dirname(paths.new_db))
+    app = sqlite3.connect(paths.new_db)
+    app.execute('PRAGMA journal_mode = WAL')
+    app.execute('CREATE TABLE kept (value TEXT)')
+    app.execute("INSERT INTO kept VALUES ('only in the WAL')")
+    app.commit()
+    try:
+        report = migrator.run_migration(paths=paths)
+        assert not report['completed']
+        assert os.path.exists(paths.partial_db)
+        assert app.execute('SELECT value FROM kept').fetchall() == [('only in the WAL',)]
+    finally:
+        app.close()
+
+    # Once the program closed it, the finished build is swapped in
+    assert migrator.run_migration(resume=True, paths=paths)['completed']
+    assert not os.path.exists(paths.partial_db)
+    assert migrator.verify_migration(paths, allow_missing=True)['ok']
+
+def test_sharded_migration_matches_single_process(tmp_path, legacy, monkeypatch, capsys):
+    single_paths = target_paths(tmp_path, legacy, 'single')
+    assert migrator.run_migration(paths=single_paths)['completed']
+
+    monkeypatch.setattr(migrator, 'SHARD_MIN_ROWS', 100)
+    monkeypatch.setattr(migrator, 'SHARD_ROWS', 150)
+    sharded_paths = target_paths(tmp_path, legacy, 'sharded')
+    capsys.readouterr()
+    assert migrator.run_migration(paths=sharded_paths, shards=2)['completed']
+    assert "Migrating 'players' as 4 shards in 2 processes." in capsys.readouterr().out
+    assert table_contents(sharded_paths.new_db) == table_contents(single_paths.new_db)
+
+
+# --- Sync ---
+
+def test_sync_picks_up_legacy_edits(tmp_path, legacy):
+    paths = target_paths(tmp_path, legacy)
+    assert migrator.run_migration(paths=paths)['completed']
+    # The first sync indexes every row the migration wrote
+    assert migrator.sync_migration(paths, once=True)['ok']
+
+    conn = sqlite3.connect(legacy)
+    conn.execute("UPDATE players SET firstName = 'Edited' WHERE _id = 'player-00000001'")
+    conn.execute("INSERT INTO teams VALUES ('team-new', 'New Team', 'NEW', 'UA', NULL, '{}')")
+    conn.commit()
+    conn.close()
+
+    totals = migrator.sync_migration(paths, once=True)
+    assert totals['ok']
+    assert totals['upserted'] == 2
+    assert totals['deleted'] == 0
+    conn = sqlite3.connect(paths.new_db)
+    assert conn.execute("SELECT firstName FROM players WHERE _id = 'player-00000001'").fetchone() == ('Edited',)
+    assert conn.execute("SELECT name FROM teams WHERE _id = 'team-new'").fetchone() == ('New Team',)
+    conn.close()
+    assert migrator.verify_migration(paths, allow_missing=True)['ok']
+
+def test_sync_resolves_duplicates_of_unchanged_rows(tmp_path, legacy):
+    paths = target_paths(tmp_path, legacy)
+    assert migrator.run_migration(paths=paths, duplicate_policy='last')['completed']
+    assert migrator.sync_migration(paths, once=True, duplicate_policy='last')['ok']
+
+    # A new row reusing an unchanged row's username wins under 'last', so the old row goes
+    conn = sqlite3.connect(legacy)
+    conn.execute("INSERT INTO players SELECT 'player-new', firstName, lastName, username, avatar, country, "
+                 "NULL, team, extra FROM players WHERE _id = 'player-00000001'")
+    conn.commit()
+    conn.close()
+
+    totals = migrator.sync_migration(paths, once=True, duplicate_policy='last')
+    assert (totals['upserted'], totals['deleted']) == (1, 1)
+    conn = sqlite3.connect(paths.new_db)
+    assert conn.execute("SELECT _id FROM players WHERE _id IN ('player-00000001', 'player-new')").fetchall() == [('player-new',)]
+    conn.close()
+    assert migrator.verify_migration(paths, allow_missing=True, duplicate_policy='last')['ok']
+    # Nothing changed since: the skipped row stays skipped and nothing is written
+    totals = migrator.sync_migration(paths, once=True, duplicate_policy='last')
+    assert (totals['upserted'], totals['deleted']) == (0, 0)
+
+
+# --- SQL-native tables ---
+
+EDGE_CURRENT_VALUES = (1, '1', 'true', 'True', 'TRUE', 1.0, 0, None, b'1', ' 1', 2)
+EDGE_JSON_VALUES = (
+    None, '', ' ', '{}', ' {"a": 1} ', '\x1c{"a": 1}', '\xa0[1]　', ' {}', '\x85[]', '\x0b{}\x0c',
+    '[object Object]', ' Undefined ', '{broken', 'NaN', 'Infinity', '1e999', '-0', 1, 1.0, 2.5, 1e300, 0.1 + 0.2,
+    b'{}', '"a\x01"', '﻿{}', '{}\x00', '[' * 1500 + ']' * 1500, '[' * 2500 + ']' * 2500, '"\\u12"',
+)
+
+def test_sql_and_python_paths_clean_identically(tmp_path, monkeypatch):
+    legacy = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(legacy)
+    # TEXT affinity keeps '1' as text, which must not count as current
+    conn.execute('CREATE TABLE matches (id TEXT, current TEXT, left_id TEXT, left_wins INTEGER, '
+                 'right_id TEXT, right_wins INTEGER, matchType TEXT, vetos)')
+    conn.executemany('INSERT INTO matches VALUES (?, ?, NULL, 0, NULL, 0, ?, ?)', [
+        (f'match-{n}', EDGE_CURRENT_VALUES[n % len(EDGE_CURRENT_VALUES)], 'bo1', vetos)
+        for n, vetos in enumerate(EDGE_JSON_VALUES * 2)
+    ])
+    conn.commit()
+    conn.close()
+
+    results = {}
+    for sql_native in (True, False):
+        monkeypatch.setattr(migrator, 'SQL_NATIVE_TABLES', sql_native)
+        paths = target_paths(tmp_path, legacy, f'sql-{sql_native}')
+        report = migrator.run_migration(paths=paths)
+        assert report['completed']
+        results[sql_native] = (table_contents(paths.new_db)['matches'], report['counters']['corrupt_values'])
+        # sync rewrites rows through the Python path; nothing may change or fail to verify
+        assert migrator.sync_migration(paths, once=True)['ok']
+        assert table_contents(paths.new_db)['matches'] == results[sql_native][0]
+        assert migrator.verify_migration(paths)['ok']
+
+    assert results[True] == results[False]
+    assert len(results[True][0]) == len(EDGE_JSON_VALUES) * 2